@@ -0,0 +1,132 @@
+# ad_tree.py
+"""
+AD-tree (all-dimensions tree, Moore & Lee 1998): a sparse in-memory index
+answering the count of any conjunction of variable = value.
+
+Rows are an (n, m) array of indexed values. Every node holds the count of the
+rows matching its conjunction and, for each later variable, a vary node with
+one child per observed value. Two things keep the tree small:
+- the most common value (MCV) of each vary node gets no child: its count is
+  derived as count(without that variable) - count(other values),
+- nodes with at most `leaf_size` rows keep those rows instead of children
+  and count them directly.
+Unobserved values have no node at all, so the size follows the data rather
+than the product of the cardinalities, and a query costs the same whatever
+the number of rows.
+
+Usage:
+    tree = ADTree(rows, arities)
+    tree.count({0: 3, 4: 1})  # rows with variable 0 == 3 and variable 4 == 1
+    tree.contingency([0, 4])  # {(v0, v4): count} of every observed pair
+"""
+import numpy as np
+
+LEAF_SIZE = 16
+
+
+class _Node:
+    __slots__ = ("count", "vary", "rows")
+
+    def __init__(self, count):
+        self.count = count
+        # vary[a - first] for the variables a >= first this node may refine
+        self.vary = None
+        # The matching rows, for nodes small enough to be leaves
+        self.rows = None
+
+
+class _Vary:
+    __slots__ = ("mcv", "children")
+
+    def __init__(self, mcv, children):
+        self.mcv = mcv
+        self.children = children
+
+
+class ADTree:
+    def __init__(self, rows, arities, leaf_size=LEAF_SIZE):
+        self.arities = list(arities)
+        self.leaf_size = leaf_size
+        self.num_nodes = 0
+        # Only needed while building: leaves keep copies of their rows
+        self._rows = np.asarray(rows)
+        self.root = self._make_node(np.arange(len(self._rows)), 0)
+        self._rows = None
+
+    def _make_node(self, index, first):
+        self.num_nodes += 1
+        node = _Node(len(index))
+        if len(index) <= self.leaf_size:
+            node.rows = self._rows[index]
+            return node
+        node.vary = [self._make_vary(index, a) for a in range(first, len(self.arities))]
+        return node
+
+    def _make_vary(self, index, attribute):
+        values = self._rows[index, attribute]
+        counts = np.bincount(values, minlength=self.arities[attribute])
+        mcv = int(counts.argmax())
+        # Split the rows by value with one stable sort
+        order = np.argsort(values, kind="stable")
+        bounds = np.concatenate(([0], np.cumsum(counts)))
+        children = {}
+        for value in np.flatnonzero(counts):
+            if value == mcv:
+                continue
+            child_index = index[order[bounds[value] : bounds[value + 1]]]
+            children[int(value)] = self._make_node(child_index, attribute + 1)
+        return _Vary(mcv, children)
+
+    def count(self, query):
+        """Number of rows matching {variable position: value}."""
+        return self._count(self.root, sorted(query.items()), 0, 0)
+
+    def _count(self, node, query, i, first):
+        if i == len(query):
+            return node.count
+        if node.rows is not None:
+            attributes = [a for a, _ in query[i:]]
+            values = [v for _, v in query[i:]]
+            return int(np.all(node.rows[:, attributes] == values, axis=1).sum())
+        attribute, value = query[i]
+        vary = node.vary[attribute - first]
+        if value == vary.mcv:
+            total = self._count(node, query, i + 1, first)
+            for child in vary.children.values():
+                total -= self._count(child, query, i + 1, attribute + 1)
+            return total
+        child = vary.children.get(value)
+        if child is None:
+            return 0
+        return self._count(child, query, i + 1, attribute + 1)
+
+    def contingency(self, attributes):
+        """
+        Sparse contingency table of `attributes` (positions, any order):
+        {values tuple: count} of the observed combinations only.
+        """
+        order = sorted(range(len(attributes)), key=lambda i: attributes[i])
+        table = self._contingency(self.root, [attributes[i] for i in order], 0)
+        # Back to the caller's order of attributes
+        position = [order.index(i) for i in range(len(attributes))]
+        return {tuple(key[p] for p in position): n for key, n in table.items()}
+
+    def _contingency(self, node, attributes, first):
+        if not attributes:
+            return {(): node.count} if node.count else {}
+        if node.rows is not None:
+            keys, counts = np.unique(node.rows[:, attributes], axis=0, return_counts=True)
+            return {tuple(int(v) for v in key): int(n) for key, n in zip(keys, counts)}
+        attribute, rest = attributes[0], attributes[1:]
+        vary = node.vary[attribute - first]
+        # Counts of the most common value: all rows minus the other values
+        mcv_table = dict(self._contingency(node, rest, first))
+        table = {}
+        for value, child in vary.children.items():
+            for key, n in self._contingency(child, rest, attribute + 1).items():
+                table[(value,) + key] = n
+                mcv_table[key] -= n
+        for key, n in mcv_table.items():
+            if n:
+                table[(vary.mcv,) + key] = n
+        return table
@@ -0,0 +1,162 @@
+# alpha_sweep.py
+"""
+Evaluate the smoothing parameter alpha over a whole grid at once.
+
+The counts do not depend on alpha, so they are read once (one joint count
+tensor, one sparse table per family) and every alpha-dependent quantity is
+computed with a leading alpha axis:
+- K2 score of the hypothesis' structure (k2_learning.family_k2_scores),
+- the posterior table of every evidence (compiled_model.joint_probability_tensor),
+- classification metrics, from the number of transactions of every
+  (evidence, true target value) pair instead of classifying them one by one.
+A grid of alphas costs about as much as a single compiled model.
+
+With --holdout F the counts of the last F of the hash buckets are left out
+of the model and the metrics are measured on them; otherwise they are
+measured on the whole dataset, as in classification_metrics.py.
+
+Usage:
+    python3 alpha_sweep.py
+    python3 alpha_sweep.py --hypothesis "Fraud as Mediator" --alphas 0.01 0.1 1 10 --holdout 0.2
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from bayes_classifier import BayesianClassifier, available_hypotheses, hypothesis_parents
+from compiled_model import joint_probability_tensor
+from count_backends import BUCKET_FIELD, bucket_limit, joint_count_tensor
+
+ALPHAS = [0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0]
+OUTPUT_FILENAME = "benchmarks/alpha_sweep.csv"
+
+
+def posterior_tables(joint_counts, variables, parents, alphas, target_variable="fraud", N=None):
+    """
+    (alphas, evidence codes, target values) array: for every alpha, the
+    table CompiledModel.compile builds.
+    """
+    alphas = np.asarray(alphas, dtype=np.float64)
+    if N is None:
+        N = int(joint_counts.sum())
+    prob = joint_probability_tensor(joint_counts, variables, parents, alphas, N)
+    target_axis = variables.index(target_variable) + 1
+    return np.moveaxis(prob, target_axis, -1).reshape(len(alphas), -1, prob.shape[target_axis])
+
+
+def evidence_counts(joint_counts, variables, target_variable="fraud"):
+    """(evidence codes, target values) array of how many transactions have each pair."""
+    target_axis = variables.index(target_variable)
+    return np.moveaxis(joint_counts, target_axis, -1).reshape(-1, joint_counts.shape[target_axis])
+
+
+def classification_metrics(tables, counts, positive):
+    """
+    Metrics of every alpha's predictions (argmax of its table row, as
+    classify() does) over the transactions counted in `counts`.
+    Returns {metric: array with one value per alpha}.
+    """
+    predicted_positive = (tables.argmax(axis=-1) == positive).astype(np.float64)
+    positives = counts[:, positive].astype(np.float64)
+    negatives = counts.sum(axis=1) - positives
+    tp = predicted_positive @ positives
+    fp = predicted_positive @ negatives
+    fn = positives.sum() - tp
+    tn = negatives.sum() - fp
+    with np.errstate(divide="ignore", invalid="ignore"):
+        precision = np.where(tp + fp > 0, tp / (tp + fp), 0.0)
+        recall = np.where(tp + fn > 0, tp / (tp + fn), 0.0)
+        f1 = np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), 0.0)
+        # Mean -log P(true target | evidence) of the normalized posteriors
+        posteriors = tables / tables.sum(axis=-1, keepdims=True)
+        log_loss = -np.sum(counts * np.log(np.where(counts > 0, posteriors, 1.0)), axis=(1, 2))
+    total = counts.sum()
+    return {
+        "accuracy": (tp + tn) / total,
+        "precision": precision,
+        "recall": recall,
+        "f1_score": f1,
+        "log_loss": log_loss / total,
+        "true_positives": tp.astype(np.int64),
+        "true_negatives": tn.astype(np.int64),
+        "false_positives": fp.astype(np.int64),
+        "false_negatives": fn.astype(np.int64),
+    }
+
+
+def structure_k2_scores(classifier, parents, alphas):
+    """K2 score of the whole structure `parents` for every alpha (one count table per family)."""
+    from k2_learning import family_k2_scores
+
+    scores = np.zeros(len(alphas))
+    for var in classifier.variables:
+        family = classifier.family_counts(list(parents.get(var, [])) + [var])
+        scores += family_k2_scores(family, len(classifier.cardinalities[var]), alphas)
+    return scores
+
+
+def sweep(classifier, hypothesis, alphas, test_counts=None, positive_value="yes"):
+    """
+    DataFrame with one row per alpha: K2 score of the structure and the
+    classification metrics over `test_counts` (a joint count tensor, the
+    classifier's own counts by default).
+    """
+    variables = classifier.variables
+    target = classifier.target_variable
+    parents = hypothesis_parents(hypothesis, variables)
+    joint = classifier.joint_counts()
+    if test_counts is None:
+        test_counts = joint
+    tables = posterior_tables(joint, variables, parents, alphas, target, classifier.N)
+    metrics = classification_metrics(
+        tables,
+        evidence_counts(test_counts, variables, target),
+        classifier.cardinalities[target][positive_value],
+    )
+    results = pd.DataFrame({"alpha": alphas, "k2_score": structure_k2_scores(classifier, parents, alphas)})
+    for name, values in metrics.items():
+        results[name] = values
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep the smoothing parameter alpha.")
+    parser.add_argument("--hypothesis", nargs="*", default=list(available_hypotheses))
+    parser.add_argument("--alphas", nargs="+", type=float, default=ALPHAS)
+    parser.add_argument("--holdout", type=float, default=0.0, help="Fraction of buckets held out")
+    parser.add_argument("--output", default=OUTPUT_FILENAME)
+    args = parser.parse_args()
+
+    classifier = BayesianClassifier(backend="memory", fraction=1 - args.holdout)
+    test_counts = None
+    if args.holdout:
+        test_counts = joint_count_tensor(
+            classifier.data_collection,
+            classifier.variables,
+            classifier.cardinalities,
+            {BUCKET_FIELD: {"$gte": bucket_limit(1 - args.holdout)}},
+        )
+        print(f"Training on {classifier.N:,} transactions, testing on {int(test_counts.sum()):,}.")
+
+    alphas = np.asarray(args.alphas, dtype=np.float64)
+    results = []
+    for name in args.hypothesis:
+        start = time.perf_counter()
+        result = sweep(classifier, available_hypotheses[name], alphas, test_counts)
+        elapsed = time.perf_counter() - start
+        result.insert(0, "hypothesis", name)
+        results.append(result)
+        best = result.loc[result["f1_score"].idxmax()]
+        print(f"\n--- {name}: {len(alphas)} alphas in {1e3 * elapsed:.1f} ms ---")
+        print(result[["alpha", "k2_score", "accuracy", "precision", "recall", "f1_score", "log_loss"]].to_string(index=False))
+        print(f"Best F1 {best['f1_score']:.4f} at alpha={best['alpha']:g}; "
+              f"best K2 score at alpha={result.loc[result['k2_score'].idxmax(), 'alpha']:g}")
+
+    pd.concat(results).to_csv(args.output, index=False)
+    print(f"\nResults saved to {args.output}.")
+
+
+if __name__ == "__main__":
+    main()
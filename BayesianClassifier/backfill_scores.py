@@ -0,0 +1,218 @@
+# backfill_scores.py
+"""
+Score every transaction of transactions_indexed and write the predictions
+back to MongoDB.
+
+The collection is split into ranges of _ids holding about as many
+documents each (one $bucketAuto, computed by the server), and worker
+processes each stream one range in _id order, in batches of BATCH_SIZE
+documents. A batch is classified at once with the compiled
+model (CompiledModel.classify_batch: a vectorized table lookup), and
+`fraud_score` (P(fraud = yes | evidence)) and `fraud_pred` are written
+with one unordered bulk_write: into the transactions themselves, or, with
+--scores-collection, into a separate collection keyed by the same _id.
+
+After every batch the range's checkpoint (in `backfill_checkpoints`)
+records the last _id written, so a job that stops can be started again and
+continues where each range left off. Re-scoring after a model change is a
+new job (--job) or --restart. The last range has no upper bound, so
+documents inserted later (with larger ObjectIds) are scored if its worker
+has not gone past them yet; start a new job to be sure to include them.
+
+Usage:
+    python3 scoring_runtime.py export model.npz --hypothesis "Fraud as Mediator"
+    python3 backfill_scores.py model.npz --workers 8
+    python3 backfill_scores.py model.npz --scores-collection fraud_scores
+    python3 backfill_scores.py model.npz --restart
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import islice
+
+import numpy as np
+
+from compiled_model import CompiledModel
+
+BATCH_SIZE = 10000
+CHECKPOINT_COLLECTION = "backfill_checkpoints"
+SCORE_FIELD = "fraud_score"
+PRED_FIELD = "fraud_pred"
+
+
+def id_ranges(collection, n_ranges):
+    """
+    Split the collection into at most `n_ranges` ranges of _ids with about
+    as many documents each, as [(first _id, end)]: a range holds the _ids
+    from its first one (included) to the next range's first one (excluded),
+    and the last one has no end (None). The boundaries come from one
+    $bucketAuto on the server, so only they reach the client.
+    """
+    pipeline = [{"$bucketAuto": {"groupBy": "$_id", "buckets": n_ranges}}]
+    firsts = [doc["_id"]["min"] for doc in collection.aggregate(pipeline, allowDiskUse=True)]
+    return list(zip(firsts, firsts[1:] + [None]))
+
+
+def plan_job(db, job, collection_name, n_ranges, restart=False):
+    """
+    The checkpoints of `job`: those of a previous run of the job if any
+    (unless restart), new ones otherwise.
+    """
+    checkpoints = db[CHECKPOINT_COLLECTION]
+    if restart:
+        checkpoints.delete_many({"job": job})
+    existing = list(checkpoints.find({"job": job}).sort("index", 1))
+    if existing:
+        return existing
+    docs = [
+        {
+            "_id": f"{job}/{index}",
+            "job": job,
+            "index": index,
+            "first": first,
+            "end": end,
+            "resume_after": None,
+            "rows": 0,
+            "done": False,
+        }
+        for index, (first, end) in enumerate(id_ranges(db[collection_name], n_ranges))
+    ]
+    if docs:
+        checkpoints.insert_many(docs)
+    return docs
+
+
+def batches(cursor, size):
+    while True:
+        batch = list(islice(cursor, size))
+        if not batch:
+            return
+        yield batch
+
+
+def score_range(task):
+    """Worker: score one range of _ids, checkpointing after every batch."""
+    from pymongo import ReplaceOne, UpdateOne
+
+    from mongo_connection import get_db
+
+    checkpoint, model_path, collection_name, scores_collection, batch_size = task
+    db = get_db()
+    checkpoints = db[CHECKPOINT_COLLECTION]
+    collection = db[collection_name]
+    target = db[scores_collection] if scores_collection else collection
+    model = CompiledModel.load(model_path)
+    positive = model.cardinalities[model.target_variable]["yes"]
+
+    id_filter = {} if checkpoint["end"] is None else {"$lt": checkpoint["end"]}
+    if checkpoint["resume_after"] is None:
+        id_filter["$gte"] = checkpoint["first"]
+    else:
+        id_filter["$gt"] = checkpoint["resume_after"]
+    cursor = (
+        collection.find({"_id": id_filter}, {var: 1 for var in model.input_variables})
+        .sort("_id", 1)
+        .batch_size(batch_size)
+    )
+
+    rows = 0
+    start = time.perf_counter()
+    for batch in batches(cursor, batch_size):
+        columns = {
+            var: np.fromiter((doc[var] for doc in batch), dtype=np.int64, count=len(batch))
+            for var in model.input_variables
+        }
+        predictions, posteriors = model.classify_batch(columns)
+        scores = posteriors[:, positive].tolist()
+        preds = (predictions == positive).tolist()
+        if scores_collection:
+            requests = [
+                ReplaceOne({"_id": doc["_id"]}, {SCORE_FIELD: score, PRED_FIELD: pred}, upsert=True)
+                for doc, score, pred in zip(batch, scores, preds)
+            ]
+        else:
+            requests = [
+                UpdateOne({"_id": doc["_id"]}, {"$set": {SCORE_FIELD: score, PRED_FIELD: pred}})
+                for doc, score, pred in zip(batch, scores, preds)
+            ]
+        target.bulk_write(requests, ordered=False)
+        checkpoints.update_one(
+            {"_id": checkpoint["_id"]},
+            {"$set": {"resume_after": batch[-1]["_id"]}, "$inc": {"rows": len(batch)}},
+        )
+        rows += len(batch)
+    checkpoints.update_one({"_id": checkpoint["_id"]}, {"$set": {"done": True}})
+    return checkpoint["index"], rows, time.perf_counter() - start
+
+
+def backfill(
+    model_path,
+    job=None,
+    collection_name="transactions_indexed",
+    scores_collection=None,
+    workers=None,
+    n_ranges=None,
+    batch_size=BATCH_SIZE,
+    restart=False,
+):
+    """Run (or resume) a backfill job; returns the number of rows scored by this call."""
+    from mongo_connection import get_db
+
+    workers = workers or os.cpu_count()
+    job = job or os.path.splitext(os.path.basename(model_path))[0]
+    # Fail before planning the job if the model cannot be loaded
+    CompiledModel.load(model_path)
+    checkpoints = plan_job(get_db(), job, collection_name, n_ranges or 4 * workers, restart)
+    pending = [c for c in checkpoints if not c["done"]]
+    print(f"Job '{job}': {len(pending)} of {len(checkpoints)} ranges left "
+          f"({sum(c['rows'] for c in checkpoints):,} rows already scored).")
+
+    total = 0
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(
+                score_range, (checkpoint, model_path, collection_name, scores_collection, batch_size)
+            )
+            for checkpoint in pending
+        ]
+        for future in as_completed(futures):
+            index, rows, elapsed = future.result()
+            total += rows
+            wall = time.perf_counter() - start
+            print(f"Range {index}: {rows:,} rows in {elapsed:.1f}s; "
+                  f"total {total:,} rows, {total / wall:,.0f} rows/s", flush=True)
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score every transaction and store the predictions.")
+    parser.add_argument("model", help="Compiled model (scoring_runtime.py export)")
+    parser.add_argument("--job", default=None, help="Checkpoint name (default: the model file name)")
+    parser.add_argument("--collection", default="transactions_indexed")
+    parser.add_argument("--scores-collection", default=None,
+                        help="Write {_id, fraud_score, fraud_pred} here instead of into the transactions")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--ranges", type=int, default=None, help="Default: 4 per worker")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoints of the job")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    total = backfill(
+        args.model,
+        job=args.job,
+        collection_name=args.collection,
+        scores_collection=args.scores_collection,
+        workers=args.workers,
+        n_ranges=args.ranges,
+        batch_size=args.batch_size,
+        restart=args.restart,
+    )
+    elapsed = time.perf_counter() - start
+    print(f"Scored {total:,} rows in {elapsed:.1f}s ({total / max(elapsed, 1e-9):,.0f} rows/s).")
+
+
+if __name__ == "__main__":
+    main()
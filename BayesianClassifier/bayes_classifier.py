@@ -1,13 +1,38 @@
 from collections import defaultdict
 from itertools import combinations
-from scipy.special import gammaln
-from itertools import product
-from pymongo import MongoClient
 import time
-import os
-from dotenv import load_dotenv
+import threading
 from functools import lru_cache
 import math
+import numpy as np
+from classifier_stats import ClassifierStats
+from compiled_model import CompiledModel
+from sparse_model import SparseModel
+from segmented_model import MIN_SUPPORT, SegmentedModel
+from count_min import DEFAULT_DELTA, DEFAULT_EPSILON
+from discretizer import AMOUNT_BINS, AMOUNT_LABELS, discretize, load_discretizers
+from packed_rows import CODE_VARIABLES, collection_count_tensor, has_codes
+from index_advisor import (
+    existing_index_keys,
+    hypothesis_count_queries,
+    plan_indexes,
+    precomputed_queries,
+)
+from count_backends import (
+    BUCKET_FIELD,
+    ADTreeCountBackend,
+    BucketedTensorCountBackend,
+    MongoCountBackend,
+    PrecomputedCountBackend,
+    TensorCountBackend,
+    bucket_count_tensor,
+    SketchCountBackend,
+    collection_row_batches,
+    collection_rows,
+    count_table,
+    fraction_filter,
+    joint_count_tensor,
+)
 
 
 available_hypotheses = {
@@ -47,30 +72,87 @@ available_hypotheses = {
 }
 
 
+# Attributes kept by `upload_dataset.py --extra`. Their joint space is far
+# too large for dense tensors, so they are only used when requested with
+# extra_variables, and then always counted sparsely (see sparse_model).
+HIGH_CARDINALITY_VARIABLES = ("merchant", "customer", "step")
+# Above this many cells dense tensors and tables are not built either
+MAX_DENSE_CELLS = 2**24
+
+
+def hypothesis_parents(hypothesis, variables):
+    """
+    Convert a hypothesis {parent: [children]} into {child: [parents]}.
+    """
+    parents = defaultdict(list)
+    for var in variables:
+        children = hypothesis.get(var, [])
+        for c in children:
+            parents[c].append(var)
+    return parents
+
+
 class BayesianClassifier:
     def __init__(
         self,
         alpha=1.0,
         hyphothesis_name="Naive Bayes",
         transactions_db_name="transactions_indexed",
-        use_lru_cache=True
+        use_lru_cache=True,
+        backend="precomputed",
+        instrument=False,
+        fraction=1.0,
+        compiled=False,
+        extra_variables=(),
     ):
-        # Load environment variables from .env file
-        load_dotenv()
-        self.client = MongoClient(
-            os.environ["ATLASMONGODB_CONNECTION_STRING"], readConcernLevel="local"
-        )
-        self.db = self.client["fraud_db"]
-        self.data_collection = self.db[transactions_db_name]
-        self.N = self.data_collection.estimated_document_count()
-        self.precomputed = self.db["precomputed"]
+        # Shared, pooled client (settings from .env, see mongo_connection).
+        # Imported here: scoring from a saved model (from_model) needs
+        # neither pymongo nor a connection string.
+        from mongo_connection import DB_NAME, counting_collection, get_client
+
+        self.client = get_client()
+        self.db = self.client[DB_NAME]
+        # Counting queries may be served by secondaries
+        self.data_collection = counting_collection(self.db, transactions_db_name)
+        # Only the transactions whose hash bucket falls in the first
+        # `fraction` of buckets are used (see count_backends.fraction_filter)
+        self.fraction = fraction
+        self.match = fraction_filter(fraction)
+        self.N = self.count_dataset()
+        self.precomputed = counting_collection(self.db, "precomputed")
         self.alpha = alpha
         self.cardinalities = self.load_cardinalities()
         # print(f'cardinalities: {self.cardinalities}')
-        self.variables = list(self.cardinalities.keys())
+        # Binned variables (amount_bin) whose raw value (amount) classify() accepts
+        self.discretizers = self.load_discretizers()
+        self.variables = [
+            var
+            for var in self.cardinalities
+            if var not in HIGH_CARDINALITY_VARIABLES or var in extra_variables
+        ]
         # print(f'variables: {self.variables}')
         self.target_variable = "fraud"
         self.parents = defaultdict(list)
+        self.backend = backend
+        self.count_backend = self.make_count_backend(backend)
+        # With compiled=True classify() reads a posterior table of the whole
+        # evidence space, rebuilt whenever the hypothesis, alpha or the counts
+        # change (see compiled_model).
+        self.compiled = compiled
+        # (key, CompiledModel) replaced as a whole, so concurrent readers
+        # never see a model paired with the wrong key
+        self._compiled = None
+        self._compile_lock = threading.Lock()
+        # Index key lists of data_collection, loaded on the first ensure_indexes()
+        self._index_keys = None
+        self._index_lock = threading.Lock()
+        self._model_version = 0
+        # Variable whose values get their own compiled model (see set_segment)
+        self.segment = None
+        self.min_support = MIN_SUPPORT
+        # Segmented models are always compiled; `compiled` as it was before
+        # set_segment(), restored by set_segment(None)
+        self._unsegmented_compiled = compiled
 
         self.set_hypothesis(available_hypotheses[hyphothesis_name])
 
@@ -78,6 +160,330 @@ class BayesianClassifier:
         # NOTE: Uncomment to benchmark
         #self.data_collection.drop_indexes()
 
+        # Instrumentation is opt-in: with stats=None the hot path only pays
+        # an `is None` check per call site.
+        self.stats = None
+        if instrument:
+            self.enable_stats()
+
+    @classmethod
+    def from_model(cls, model, use_lru_cache=True, instrument=False):
+        """
+        Build a classifier that scores from a CompiledModel (or the path of
+        one saved with CompiledModel.save) without connecting to MongoDB.
+        Counting, set_hypothesis() and K2 need a classifier built with
+        __init__.
+        """
+        if not isinstance(model, CompiledModel):
+            model = CompiledModel.load(model)
+        self = cls.__new__(cls)
+        self.client = self.db = self.data_collection = self.precomputed = None
+        self.fraction = 1.0
+        self.match = None
+        self.N = model.metadata.get("N")
+        self.alpha = model.metadata.get("alpha", 1.0)
+        self.cardinalities = model.cardinalities
+        self.discretizers = load_discretizers(
+            model.metadata.get("discretization", {}), self.cardinalities
+        )
+        self.variables = list(model.variables)
+        self.target_variable = model.target_variable
+        self.parents = defaultdict(list, model.metadata.get("parents", {}))
+        self.backend = "compiled"
+        self.count_backend = None
+        self.compiled = True
+        self._model_version = 0
+        self.segment = getattr(model, "segment", None)
+        self._unsegmented_compiled = True
+        self.min_support = model.metadata.get("min_support", MIN_SUPPORT)
+        self._compiled = ((self.alpha, self._model_version), model)
+        self._compile_lock = threading.Lock()
+        self._index_keys = None
+        self._index_lock = threading.Lock()
+        self.use_lru_cache = use_lru_cache
+        self.stats = None
+        if instrument:
+            self.enable_stats()
+        return self
+
+    def enable_stats(self):
+        """Start recording per-stage timings, round-trips and cache hits."""
+        if self.stats is None:
+            self.stats = ClassifierStats()
+        if self.count_backend is not None:
+            self.count_backend.stats = self.stats
+        return self.stats
+
+    def disable_stats(self):
+        self.stats = None
+        if self.count_backend is not None:
+            self.count_backend.stats = None
+
+    def stats_snapshot(self):
+        """Return the aggregated statistics as a dict (None if disabled)."""
+        return None if self.stats is None else self.stats.snapshot()
+
+    def stats_prometheus(self, prefix="bayes_classifier"):
+        """Return the statistics in the Prometheus text format ("" if disabled)."""
+        return "" if self.stats is None else self.stats.to_prometheus(prefix)
+
+    def make_count_backend(self, backend):
+        """
+        backend is one of:
+        - "mongo": every count is a count_documents query
+        - "precomputed": look up the `precomputed` collection first, then Mongo
+        - "memory": load the joint count tensor once and count in memory
+        - "adtree": read the rows once into an AD-tree (sparse, see ad_tree)
+        - "sketch": approximate counts from Count-Min sketches (see count_min)
+
+        With fraction < 1 the `precomputed` collection (counts of the full
+        dataset) cannot be used, so "precomputed" counts with Mongo, and
+        "memory" keeps one tensor per hash bucket.
+        """
+        if backend == "mongo" or (backend == "precomputed" and self.match):
+            return MongoCountBackend(self.data_collection, self.match)
+        if backend == "precomputed":
+            return PrecomputedCountBackend(self.data_collection, self.precomputed)
+        if backend == "memory":
+            if self.sparse_counts():
+                raise ValueError(
+                    f"The joint tensor of {self.variables} has {self.dense_cells():,} cells; "
+                    "use the adtree, mongo or precomputed backend"
+                )
+            if self.match:
+                bucket_counts = bucket_count_tensor(
+                    self.data_collection, self.variables, self.cardinalities
+                )
+                return BucketedTensorCountBackend(
+                    bucket_counts, self.variables, self.fraction
+                )
+            return TensorCountBackend(self.count_tensor(), self.variables)
+        if backend == "adtree":
+            from ad_tree import ADTree
+
+            rows = collection_rows(self.data_collection, self.variables, self.match)
+            arities = [len(self.cardinalities[var]) for var in self.variables]
+            return ADTreeCountBackend(ADTree(rows, arities), self.variables)
+        if backend == "sketch":
+            return self.sketch_count_backend()
+        raise ValueError(f"Unknown counting backend: {backend}")
+
+    def sketch_count_backend(self, epsilon=DEFAULT_EPSILON, delta=DEFAULT_DELTA, conservative=True):
+        """
+        Count-Min sketches of the count queries of every available hypothesis
+        (and the current one), filled in one streaming pass. Other queries
+        are counted exactly with Mongo.
+        """
+        families = set()
+        for hypothesis in available_hypotheses.values():
+            families |= hypothesis_count_queries(
+                hypothesis_parents(hypothesis, self.variables), self.variables
+            )
+        families |= hypothesis_count_queries(self.parents, self.variables)
+        backend = SketchCountBackend(
+            self.variables,
+            self.cardinalities,
+            families,
+            epsilon=epsilon,
+            delta=delta,
+            conservative=conservative,
+            fallback=MongoCountBackend(self.data_collection, self.match),
+        )
+        for rows in collection_row_batches(self.data_collection, self.variables, self.match):
+            backend.update(rows)
+        return backend
+
+    def set_count_backend(self, backend):
+        """Count with `backend` (e.g. a sketch with custom error bounds) from now on."""
+        backend.stats = self.stats
+        self.count_backend = backend
+        BayesianClassifier._cached_compute_counts.cache_clear()
+        self._model_version += 1
+
+    def dense_cells(self):
+        cells = 1
+        for var in self.variables:
+            cells *= len(self.cardinalities[var])
+        return cells
+
+    def sparse_counts(self):
+        """
+        True if the joint space is not to be held densely: it includes a
+        high-cardinality variable, or has more than MAX_DENSE_CELLS cells.
+        """
+        return (
+            any(var in HIGH_CARDINALITY_VARIABLES for var in self.variables)
+            or self.dense_cells() > MAX_DENSE_CELLS
+        )
+
+    def family_counts(self, variables):
+        """
+        Sparse table {values tuple: count} of the observed combinations of
+        `variables`, from the backend when it can, else with one $group.
+        """
+        family_counts = getattr(self.count_backend, "family_counts", None)
+        if family_counts is not None:
+            return family_counts(list(variables))
+        return count_table(self.data_collection, list(variables), self.match)
+
+    def count_dataset(self):
+        if self.match:
+            return self.data_collection.count_documents(self.match)
+        return self.data_collection.estimated_document_count()
+
+    def set_fraction(self, fraction):
+        """
+        Switch to another (nested) fraction of the data. With the memory
+        backend this is a slice of the per-bucket counts already loaded.
+        """
+        self.fraction = fraction
+        self.match = fraction_filter(fraction)
+        backend = self.count_backend
+        if isinstance(backend, BucketedTensorCountBackend):
+            backend.set_fraction(fraction)
+            self.N = int(backend.joint_counts.sum())
+        else:
+            self.N = self.count_dataset()
+            self.count_backend = self.make_count_backend(self.backend)
+            self.count_backend.stats = self.stats
+            self.ensure_indexes()
+        # Cached counts belong to the previous fraction
+        BayesianClassifier._cached_compute_counts.cache_clear()
+        self._model_version += 1
+
+    def refresh_counts(self):
+        """Reload N and the in-memory counts after the data has changed."""
+        self.N = self.count_dataset()
+        if self.backend in ("memory", "adtree", "sketch"):
+            self.count_backend = self.make_count_backend(self.backend)
+            self.count_backend.stats = self.stats
+        BayesianClassifier._cached_compute_counts.cache_clear()
+        self._model_version += 1
+
+    def joint_counts(self):
+        """Dense joint count tensor of self.variables (one $group if not in memory)."""
+        joint = getattr(self.count_backend, "joint_counts", None)
+        if joint is not None:
+            return joint
+        return self.count_tensor(self.match)
+
+    def count_tensor(self, match=None):
+        """
+        Dense joint count tensor of self.variables read with one $group: on
+        the packed `code` field when every transaction has it (see
+        packed_rows), on every variable otherwise.
+        """
+        if self.variables == CODE_VARIABLES and has_codes(self.data_collection):
+            return collection_count_tensor(
+                self.data_collection, self.variables, self.cardinalities, match
+            )
+        return joint_count_tensor(
+            self.data_collection, self.variables, self.cardinalities, match
+        )
+
+    def compiled_model(self):
+        """
+        Return the CompiledModel of the current hypothesis, alpha and counts,
+        compiling it again if any of them changed since the last call. With
+        high-cardinality variables it is a SparseModel instead, and after
+        set_segment() a SegmentedModel.
+        """
+        key = (self.alpha, self._model_version)
+        compiled = self._compiled
+        if compiled is None or compiled[0] != key:
+            with self._compile_lock:
+                compiled = self._compiled
+                if compiled is None or compiled[0] != key:
+                    metadata = {
+                        "parents": {c: list(p) for c, p in self.parents.items()},
+                        "alpha": self.alpha,
+                        "N": self.N,
+                        "discretization": {
+                            var: d.to_doc() for var, d in self.discretizers.items()
+                        },
+                    }
+                    if self.segment is not None:
+                        model = self.segmented_model(self.segment, self.min_support, metadata)
+                    elif self.sparse_counts():
+                        model = SparseModel.compile(
+                            self.family_counts,
+                            self.variables,
+                            self.cardinalities,
+                            self.parents,
+                            self.alpha,
+                            self.N,
+                            target_variable=self.target_variable,
+                            metadata=metadata,
+                        )
+                    else:
+                        model = CompiledModel.compile(
+                            self.joint_counts(),
+                            self.variables,
+                            self.cardinalities,
+                            self.parents,
+                            self.alpha,
+                            N=self.N,
+                            target_variable=self.target_variable,
+                            metadata=metadata,
+                        )
+                    compiled = (key, model)
+                    self._compiled = compiled
+        return compiled[1]
+
+    def segmented_model(self, segment, min_support=MIN_SUPPORT, metadata=None):
+        """
+        SegmentedModel of the current hypothesis and alpha, with one model per
+        value of `segment` (any variable in `cardinalities`, e.g. merchant or
+        category). The counts of every segment come from one grouped pass, or
+        from the joint tensor when the segment is an in-memory variable.
+        """
+        variables = [var for var in self.variables if var != segment]
+        cells = len(self.cardinalities[segment])
+        for var in variables:
+            cells *= len(self.cardinalities[var])
+        high_cardinality = [var for var in variables if var in HIGH_CARDINALITY_VARIABLES]
+        if high_cardinality:
+            raise ValueError(
+                f"Segmented models are dense: {high_cardinality} can only be the segment"
+            )
+        if cells > MAX_DENSE_CELLS:
+            raise ValueError(
+                f"Segment counts of {segment} x {variables} would take {cells:,} cells "
+                f"(more than {MAX_DENSE_CELLS:,})"
+            )
+        if segment in self.variables and isinstance(self.count_backend, TensorCountBackend):
+            axes = [self.variables.index(var) for var in [segment] + variables]
+            segment_counts = np.transpose(self.joint_counts(), axes)
+        else:
+            segment_counts = joint_count_tensor(
+                self.data_collection, [segment] + variables, self.cardinalities, self.match
+            )
+        return SegmentedModel.compile(
+            segment_counts,
+            segment,
+            variables,
+            self.cardinalities,
+            self.parents,
+            self.alpha,
+            min_support=min_support,
+            target_variable=self.target_variable,
+            metadata=metadata,
+            segment_in_model=segment in self.variables,
+        )
+
+    def set_segment(self, segment, min_support=MIN_SUPPORT):
+        """
+        Score with one compiled model per value of `segment`, falling back to
+        the global model for segments with fewer than `min_support`
+        transactions (segment=None goes back to a single model).
+        """
+        if segment is not None and self.segment is None:
+            self._unsegmented_compiled = self.compiled
+        self.segment = segment
+        self.min_support = min_support
+        self.compiled = True if segment is not None else self._unsegmented_compiled
+        self._model_version += 1
+
     def load_cardinalities(self):
         result = {}
         cardinalities_col = self.db["cardinalities"]
@@ -85,12 +491,41 @@ class BayesianClassifier:
             result[doc["variable"]] = doc["mapping"]
         return result
 
-    def ensure_indexes(self):
-        for var in self.variables:
-            if var == self.target_variable:
-                continue
-            for parent in self.parents[var]:
-                self.data_collection.create_index([(parent, 1), (var, 1)])
+    def load_discretizers(self):
+        """
+        Discretizers from the bin edges stored with the mappings (see
+        discretizer); collections indexed before the edges were stored use
+        the fixed amount bins (discretizer.AMOUNT_BINS).
+        """
+        docs = {}
+        for doc in self.db["cardinalities"].find({"edges": {"$exists": True}}):
+            docs[doc["variable"]] = doc
+        if "amount_bin" not in docs:
+            docs["amount_bin"] = {"source": "amount", "edges": AMOUNT_BINS, "labels": AMOUNT_LABELS}
+        return load_discretizers(docs, self.cardinalities)
+
+    def bin_amounts(self, amounts):
+        """Indexed amount_bin of every raw amount (one vectorized searchsorted)."""
+        return self.discretizers["amount_bin"].bin_indexed(amounts)
+
+    def ensure_indexes(self, parents=None):
+        """
+        Create the minimal set of compound indexes covering every count query
+        of `parents` (see index_advisor). Indexes that already cover a query
+        are not requested again.
+        """
+        if parents is None:
+            parents = self.parents
+        queries = hypothesis_count_queries(parents, self.variables)
+        if self.backend == "precomputed" and not self.match:
+            queries -= precomputed_queries(self.variables, self.target_variable)
+        suffix = [BUCKET_FIELD] if self.match else []
+        with self._index_lock:
+            if self._index_keys is None:
+                self._index_keys = existing_index_keys(self.data_collection)
+            for keys in plan_indexes(queries, self._index_keys, self.variables, suffix):
+                self.data_collection.create_index([(key, 1) for key in keys])
+                self._index_keys.append(keys)
 
     # The actual method decorated with lru_cache
     # It must take 'self' as the first argument, but lru_cache expects a hashable argument.
@@ -102,36 +537,46 @@ class BayesianClassifier:
         Takes a hashable tuple representation of evidence.
         """
         evidence = dict(evidence_tuple) # Convert tuple back to dict
-        
-        res = self.precomputed.find_one(evidence, {"count": 1})
-        if res is not None:
-            count = res["count"]
-        else:
-            count = self.data_collection.count_documents(evidence)
-        return count
+        if self.stats is not None:
+            self.stats.count_miss()
+        return self.count_backend.count(evidence)
 
     def compute_counts(self, evidence):
         """
         The public interface for compute_counts.
         Converts the dictionary evidence to a hashable tuple for caching.
         """
-        # NOTE: Uncomment to benchmark
-        # return self.data_collection.count_documents(evidence)
         # Convert the dictionary (which is not hashable) to a sorted tuple of (key, value) pairs
         # so it can be used as a cache key.
         hashable_evidence = tuple(sorted(evidence.items()))
+        if self.stats is not None:
+            return self._instrumented_compute_counts(hashable_evidence)
         if self.use_lru_cache:
             return self._cached_compute_counts(hashable_evidence)
         else:
             return BayesianClassifier._cached_compute_counts.__wrapped__(self, hashable_evidence)
 
+    def _instrumented_compute_counts(self, hashable_evidence):
+        # A lookup is a cache hit unless _cached_compute_counts' body runs
+        # (which records the miss).
+        self.stats.count_lookup()
+        start = time.perf_counter_ns()
+        if self.use_lru_cache:
+            count = self._cached_compute_counts(hashable_evidence)
+        else:
+            count = BayesianClassifier._cached_compute_counts.__wrapped__(self, hashable_evidence)
+        self.stats.stage("count_lookup", time.perf_counter_ns() - start)
+        return count
+
     def conditional_probability(self, variable, value, context, total):
         k = len(self.cardinalities[variable])
-        context[variable] = value
-        count = self.compute_counts(context)
+        # Build a new dict instead of writing into the caller's context
+        count = self.compute_counts({**context, variable: value})
         return (count + self.alpha) / (total + self.alpha * k)
 
     def compute_joint_distribution(self, evidence_indexed):
+        # Read the parent map once: set_hypothesis swaps it, never mutates it
+        parents_map = self.parents
         resultados = []
         # Obtain all possible (indexed) values for the target variable
         target_values = list(self.cardinalities[self.target_variable].values())
@@ -141,7 +586,7 @@ class BayesianClassifier:
             prob_total = 1.0
             # Traverse all variables to compute total probability
             for var in self.variables:
-                parents = self.parents.get(var, [])
+                parents = parents_map.get(var, [])
                 # Obtain the parent(s) context (indexed values)
                 context_parents = {p: context[p] for p in parents}
                 # If the variable is not conditioned, then the total is the size of the dataset
@@ -158,8 +603,14 @@ class BayesianClassifier:
         return resultados
 
     def classify(self, evidence, apply_index=True):
+        if self.discretizers:
+            evidence = discretize(evidence, self.discretizers, apply_index)
+        if self.compiled:
+            return self._classify_compiled(evidence, apply_index)
+        if self.stats is not None:
+            return self._instrumented_classify(evidence, apply_index)
         # Start recording how long it took
-        time_start = time.time()
+        time_start = time.perf_counter()
         # Convert all values to their indices
         evidence_indexed = {}
         if apply_index:
@@ -173,165 +624,82 @@ class BayesianClassifier:
         distribution.sort(key=lambda x: x[1], reverse=True)
         pred_clase, prob = distribution[0]
         # Record how long it took
-        time_total = time.time() - time_start
+        time_total = time.perf_counter() - time_start
         # print(f'Time: {time_total:.4f}s')
         # Return a tuple
         return (pred_clase == "1" or pred_clase == 1, prob, time_total)
 
-    def set_hypothesis(self, hypothesis, target_variable="fraud"):
+    def _instrumented_classify(self, evidence, apply_index):
+        """classify() recording the time of each stage into self.stats."""
+        stats = self.stats
+        stats.begin_call()
+        time_start = time.perf_counter_ns()
+        if apply_index:
+            evidence_indexed = {
+                var: self.cardinalities[var][val] for var, val in evidence.items()
+            }
+        else:
+            evidence_indexed = evidence
+        time_indexed = time.perf_counter_ns()
+        stats.stage("index_mapping", time_indexed - time_start)
+        distribution = self.compute_joint_distribution(evidence_indexed)
+        time_joint = time.perf_counter_ns()
+        stats.stage("joint_distribution", time_joint - time_indexed)
+        distribution.sort(key=lambda x: x[1], reverse=True)
+        pred_clase, prob = distribution[0]
+        elapsed_ns = time.perf_counter_ns() - time_start
+        stats.end_call(elapsed_ns)
+        return (pred_clase == "1" or pred_clase == 1, prob, elapsed_ns / 1e9)
+
+    def _classify_compiled(self, evidence, apply_index):
+        """classify() answered with a single read of the compiled table."""
+        stats = self.stats
+        if stats is not None:
+            stats.begin_call()
+        time_start = time.perf_counter_ns()
+        is_fraud, prob = self.compiled_model().classify(evidence, apply_index)
+        elapsed_ns = time.perf_counter_ns() - time_start
+        if stats is not None:
+            stats.stage("table_lookup", elapsed_ns)
+            stats.end_call(elapsed_ns)
+        return (is_fraud, prob, elapsed_ns / 1e9)
+
+    def set_hypothesis(self, hypothesis, target_variable="fraud", build_indexes=True):
         """ "
         parents should have the form {child1: [par11, par12, ...], child2: [par21, par22, ...]}
         E.g. {'age': ['fraud'], 'gender': ['fraud'], 'amount_bin': ['fraud'], 'category': ['fraud']})
+
+        The new parent map is built aside and swapped in with a single
+        assignment, so a classification running concurrently sees either the
+        old or the new hypothesis. Pass build_indexes=False to create the
+        indexes later (e.g. in the background with ensure_indexes).
         """
         self.target_variable = target_variable
-        self.parents = defaultdict(list)
-        for var in self.variables:
-            children = hypothesis.get(var, [])
-            for c in children:
-                self.parents[c].append(var)
-        self.ensure_indexes()
+        self.parents = hypothesis_parents(hypothesis, self.variables)
+        self._model_version += 1
+        if build_indexes:
+            self.ensure_indexes()
         #print(f"Changed hypothesis to: {self.parents}")
 
     def k2_score(self, child, parents):
-        """
-        Compute the K2 score for a child variable given a list of parent variables.
+        """K2 score of `child` given `parents` (see k2_learning.k2_score)."""
+        from k2_learning import k2_score
 
-        K2 score formula:
-        log P(D|G) = Σ_i [ log(Γ(α*r_i)) - log(Γ(N_i + α*r_i)) + Σ_j [log(Γ(N_ij + α)) - log(Γ(α))] ]
+        return k2_score(self, child, parents)
 
-        where:
-        - r_i is the number of values that variable X_i can take
-        - N_i is the number of instances where the parents of X_i take their i-th configuration
-        - N_ij is the number of instances where X_i takes its j-th value and parents take i-th configuration
-        """
-        r = len(self.cardinalities[child])  # Number of values child can take
-        total_score = 0
+    def learn_k2_structure(self, u=3, variable_order=None):
+        """Greedy K2 search (see k2_learning.learn_k2_structure)."""
+        from k2_learning import learn_k2_structure
 
-        # Get all possible parent value combinations
-        if not parents:
-            parent_combinations = [{}]  # Empty context if no parents
-        else:
-            parent_values = [list(self.cardinalities[p].values()) for p in parents]
-            parent_combinations = [
-                dict(zip(parents, combo)) for combo in product(*parent_values)
-            ]
-
-        for parent_config in parent_combinations:
-            # N_i: count of instances where parents take this configuration
-            # print(f"        parent_config: {parent_config}")
-            N_i = self.compute_counts(parent_config)
-            # print(f"        N_i: {N_i}")
-
-            # Skip configurations that don't occur in the data
-            if N_i == 0:
-                continue
-
-            # First term: log(Γ(α*r)) - log(Γ(N_i + α*r))
-            term1 = gammaln(self.alpha * r) - gammaln(N_i + self.alpha * r)
-
-            # Second term: Σ_j [log(Γ(N_ij + α)) - log(Γ(α))]
-            term2 = 0
-            for child_val in self.cardinalities[child].values():
-                context_with_child = dict(parent_config)
-                context_with_child[child] = child_val
-                # print(f"context_with_child: {context_with_child}")
-                N_ij = self.compute_counts(context_with_child)
-                term2 += gammaln(N_ij + self.alpha) - gammaln(self.alpha)
-
-            total_score += term1 + term2
-
-        return total_score
-
-    def learn_k2_structure(
-        self,
-        u=3,
-        variable_order=None,
-    ):
-        """
-        Simplest possible K2 algorithm implementation.
+        return learn_k2_structure(self, u=u, variable_order=variable_order)
 
-        Args:
-            data: list of dictionaries, each representing one data point
-            variable_order: list of variable names in topological order
-            max_parents: maximum number of parents per variable
-
-        Returns:
-            Dictionary {child: [list of parents]}
-        """
-        if variable_order is None:
-            # Use arbitrary order based on first data point
-            variable_order = self.variables
+    def learn_optimal_structure(self, variable_order=None, max_parents=None):
+        """Exact branch-and-bound K2 search (see k2_learning.learn_optimal_structure)."""
+        from k2_learning import learn_optimal_structure
 
-        print(f"Variable order: {variable_order}")
-
-        result = {}
-
-        for i, child in enumerate(variable_order):
-            print(f"\nLearning parents for {child}...")
-
-            # Possible parents are variables that come before in the ordering
-            possible_parents = variable_order[:i]
-
-            if not possible_parents:
-                result[child] = []
-                print(f"  No possible parents (first variable)")
-                continue
-
-            # Start with no parents
-            current_parents = []
-            current_score = self.k2_score(child, current_parents)
-            print(f"  Score with no parents: {current_score:.4f}")
-
-            # Greedily add parents while score improves
-            for num_parents in range(u):
-                if len(current_parents) >= len(possible_parents):
-                    break
-
-                best_candidate = None
-                best_score = current_score
-
-                # Try adding each possible parent
-                for candidate in possible_parents:
-                    if candidate in current_parents:
-                        continue
-
-                    candidate_parents = current_parents + [candidate]
-                    try:
-                        score = self.k2_score(child, candidate_parents)
-                        print(f"  Score with parents {candidate_parents}: {score:.4f}")
-
-                        if score > best_score:
-                            print(f"    Δscore = {score - current_score:.4f}")
-                            best_score = score
-                            best_candidate = candidate
-                    except Exception as e:
-                        print(f"  Error with parents {candidate_parents}: {e}")
-                        continue
-
-                # Add best candidate if it improves score
-                if best_candidate is not None:
-                    current_parents.append(best_candidate)
-                    current_score = best_score
-                    print(
-                        f"  Added parent {best_candidate}, new score: {current_score:.4f}"
-                    )
-                else:
-                    print(f"  No improvement found, stopping")
-                    break
-
-            result[child] = current_parents
-            print(f"  Final parents for {child}: {current_parents}")
-
-        print(f"Best hypothesis for u={u}: {result}")
-        return result
+        return learn_optimal_structure(self, variable_order=variable_order, max_parents=max_parents)
 
     def k2_parents_to_hypothesis(self, parents_dict):
-        """
-        Convert {child: [parents]} → {parent: [children]} format
-        to match self.set_hypothesis expectations.
-        """
-        hypothesis = defaultdict(list)
-        for child, parent_list in parents_dict.items():
-            for parent in parent_list:
-                hypothesis[parent].append(child)
-        return dict(hypothesis)
+        from k2_learning import k2_parents_to_hypothesis
+
+        return k2_parents_to_hypothesis(parents_dict)
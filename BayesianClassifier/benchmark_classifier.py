@@ -1,32 +1,8 @@
-import random
 import pandas as pd
 import sys # Import the sys module
 from bayes_classifier import BayesianClassifier
 from bayes_classifier import available_hypotheses
-
-# Parameters to test
-PARAMETERS = {
-    "category": [
-        "es_transportation",
-        "es_health",
-        "es_otherservices",
-        "es_food",
-        "es_hotelservices",
-        "es_barsandrestaurants",
-        "es_tech",
-        "es_sportsandtoys",
-        "es_wellnessandbeauty",
-        "es_hyper",
-        "es_fashion",
-        "es_home",
-        "es_contents",
-        "es_travel",
-        "es_leisure",
-    ],
-    "gender": ["M", "F", "E", "U"],
-    "age": ["0", "1", "2", "3", "4", "5", "6", "U"],
-    "amount_bin": ["very low", "low", "medium", "high"],
-}
+from benchmark_suite import generate_evidences
 
 # How many unique combinations to test
 NUM_COMBINATIONS = 30
@@ -37,17 +13,7 @@ def benchmark_classifier(hyphothesis_name):
     classifier = BayesianClassifier(hyphothesis_name=hyphothesis_name)
 
     # Random but reproducible combinations
-    random.seed(42)
-
-    combinations = [
-        {
-            "category": random.choice(PARAMETERS["category"]),
-            "gender": random.choice(PARAMETERS["gender"]),
-            "age": random.choice(PARAMETERS["age"]),
-            "amount_bin": random.choice(PARAMETERS["amount_bin"]),
-        }
-        for _ in range(NUM_COMBINATIONS)
-    ]
+    combinations = generate_evidences(NUM_COMBINATIONS)
     #print(combinations)
 
     results = []
@@ -72,22 +38,28 @@ def benchmark_classifier(hyphothesis_name):
             print(f"Test {idx}-{i}: {elapsed:.4f}s")
     return results
 
-# --- Get the additional string from command-line arguments ---
-# sys.argv[0] is the script name itself
-# sys.argv[1] would be the first argument, sys.argv[2] the second, etc.
-if len(sys.argv) > 1:
-    # Use the first argument provided after the script name
-    optimization_tag = sys.argv[1]
-    output_filename = f"benchmarks/benchmark_results-{optimization_tag}.csv"
-    print(f"Using output filename: {output_filename}")
-else:
-    # Default filename if no argument is provided
-    output_filename = "benchmarks/benchmark_results.csv"
-    print(f"No optimization tag provided. Using default filename: {output_filename}")
 
-# Store timing results -- Just do Naive bayes
-results = benchmark_classifier("Naive Bayes")
-df = pd.DataFrame(results)
-df.to_csv(output_filename, index=False) # Use the dynamically generated filename
+def main():
+    # --- Get the additional string from command-line arguments ---
+    # sys.argv[0] is the script name itself
+    # sys.argv[1] would be the first argument, sys.argv[2] the second, etc.
+    if len(sys.argv) > 1:
+        # Use the first argument provided after the script name
+        optimization_tag = sys.argv[1]
+        output_filename = f"benchmarks/benchmark_results-{optimization_tag}.csv"
+        print(f"Using output filename: {output_filename}")
+    else:
+        # Default filename if no argument is provided
+        output_filename = "benchmarks/benchmark_results.csv"
+        print(f"No optimization tag provided. Using default filename: {output_filename}")
+
+    # Store timing results -- Just do Naive bayes
+    results = benchmark_classifier("Naive Bayes")
+    df = pd.DataFrame(results)
+    df.to_csv(output_filename, index=False) # Use the dynamically generated filename
+
+    print(f"Benchmarking complete. Saved to {output_filename}.")
+
 
-print(f"Benchmarking complete. Saved to {output_filename}.")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+# benchmark_sketch.py
+"""
+Accuracy/memory trade-off of the Count-Min sketch backend against exact counts.
+
+The rows of transactions_indexed are read once. For every error bound
+(epsilon) and update rule, the sketches of all hypotheses' count queries are
+built in parallel worker processes (one part of the rows each) and merged,
+then compared with the exact counts:
+- count errors over every observed configuration (mean, max, relative),
+- memory of the sketches vs an exact sparse table (int64 key + count),
+- classifications that change with respect to exact counting.
+
+Usage:
+    python3 benchmark_sketch.py
+    python3 benchmark_sketch.py --epsilons 0.01 0.001 --evidences 500 --workers 4
+"""
+import argparse
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from bayes_classifier import BayesianClassifier, available_hypotheses, hypothesis_parents
+from benchmark_suite import generate_evidences
+from count_backends import SketchCountBackend, collection_rows
+from count_min import DEFAULT_DELTA
+from index_advisor import hypothesis_count_queries
+
+EPSILONS = [1e-2, 3e-3, 1e-3, 3e-4, 1e-4]
+OUTPUT_FILENAME = "benchmarks/sketch_results.csv"
+
+
+def sketch_part(task):
+    """Worker: sketch one part of the rows."""
+    variables, cardinalities, families, epsilon, conservative, rows = task
+    backend = SketchCountBackend(
+        variables, cardinalities, families, epsilon=epsilon, delta=DEFAULT_DELTA, conservative=conservative
+    )
+    backend.update(rows)
+    return backend
+
+
+def build_sketches(pool, classifier, families, rows, epsilon, conservative, workers):
+    parts = np.array_split(rows, workers)
+    tasks = [
+        (classifier.variables, classifier.cardinalities, families, epsilon, conservative, part)
+        for part in parts
+    ]
+    backends = list(pool.map(sketch_part, tasks))
+    merged = backends[0]
+    for backend in backends[1:]:
+        merged.merge(backend)
+    return merged
+
+
+def count_errors(backend, exact_tables):
+    errors, relative, exact_entries = [], [], 0
+    for family, table in exact_tables.items():
+        exact_entries += len(table)
+        for key, n in table.items():
+            estimate = backend.count(dict(zip(family, key)))
+            errors.append(estimate - n)
+            relative.append((estimate - n) / n)
+    errors = np.array(errors)
+    return {
+        "mean_abs_error": float(errors.mean()),
+        "max_abs_error": int(errors.max()),
+        "mean_rel_error": float(np.mean(relative)),
+        "exact_fraction": float(np.mean(errors == 0)),
+        "undercounts": int(np.sum(errors < 0)),
+        "exact_sparse_bytes": 16 * exact_entries,
+    }
+
+
+def classification_changes(classifier, exact_backend, sketch_backend, evidences):
+    changed, prob_errors = 0, []
+    for hypothesis in available_hypotheses.values():
+        classifier.set_hypothesis(hypothesis, build_indexes=False)
+        classifier.set_count_backend(exact_backend)
+        expected = [classifier.classify(e)[:2] for e in evidences]
+        classifier.set_count_backend(sketch_backend)
+        for evidence, (fraud, prob) in zip(evidences, expected):
+            sketch_fraud, sketch_prob = classifier.classify(evidence)[:2]
+            changed += sketch_fraud != fraud
+            prob_errors.append(abs(sketch_prob - prob) / prob)
+    classifier.set_count_backend(exact_backend)
+    return changed / (len(evidences) * len(available_hypotheses)), float(np.mean(prob_errors))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--epsilons", nargs="+", type=float, default=EPSILONS)
+    parser.add_argument("--evidences", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--output", default=OUTPUT_FILENAME)
+    args = parser.parse_args()
+
+    classifier = BayesianClassifier(backend="memory", use_lru_cache=False)
+    exact_backend = classifier.count_backend
+    print(f"Reading {classifier.N:,} rows...")
+    rows = collection_rows(classifier.data_collection, classifier.variables)
+
+    families = set()
+    for hypothesis in available_hypotheses.values():
+        parents = hypothesis_parents(hypothesis, classifier.variables)
+        families |= hypothesis_count_queries(parents, classifier.variables)
+    exact_tables = {}
+    for family in families:
+        family = tuple(sorted(family, key=classifier.variables.index))
+        exact_tables[family] = exact_backend.family_counts(family)
+    evidences = generate_evidences(args.evidences)
+
+    results = []
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        for conservative in (False, True):
+            for epsilon in args.epsilons:
+                start = time.perf_counter()
+                backend = build_sketches(
+                    pool, classifier, families, rows, epsilon, conservative, args.workers
+                )
+                build_s = time.perf_counter() - start
+                result = {
+                    "update": "conservative" if conservative else "standard",
+                    "epsilon": epsilon,
+                    "delta": DEFAULT_DELTA,
+                    "families": len(families),
+                    "sketch_bytes": backend.nbytes,
+                    "error_bound": epsilon * len(rows),
+                    "build_s": build_s,
+                    **count_errors(backend, exact_tables),
+                }
+                changed, prob_error = classification_changes(
+                    classifier, exact_backend, backend, evidences
+                )
+                result["changed_predictions"] = changed
+                result["mean_rel_prob_error"] = prob_error
+                results.append(result)
+                print(
+                    f"{result['update']:>12} eps={epsilon:<7g} {backend.nbytes / 2**10:9.1f} KiB "
+                    f"(exact {result['exact_sparse_bytes'] / 2**10:.1f} KiB)  "
+                    f"mean err {result['mean_abs_error']:8.2f}  max err {result['max_abs_error']:6d}  "
+                    f"changed predictions {100 * changed:5.2f}%"
+                )
+
+    pd.DataFrame(results).to_csv(args.output, index=False)
+    print(f"Results saved to {args.output}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+# benchmark_suite.py
+"""
+Unified benchmark runner for BayesianClassifier.
+
+For every (backend, hypothesis, dataset fraction) it reports warm latency
+(p50/p95/p99 measured with perf_counter_ns), warm throughput, setup time and
+peak Python allocations, cold latency for the backends that have a cache,
+and optionally compares the results against a stored baseline to flag
+regressions.
+
+Only two backends keep something between calls: `cache` (the LRU count
+cache) and `compiled` (the posterior table, compiled on first use). For
+them a "cold" call is the first classification of an evidence after that
+cache has been emptied (see reset_cache) and every following repeat is
+"warm". The other backends do the same work on every call, so all their
+repeats are reported as warm and they have no cold row.
+
+Usage:
+    python3 benchmark_suite.py
+    python3 benchmark_suite.py --backends memory cache --fractions 10 50 100
+    python3 benchmark_suite.py --save-baseline
+    python3 benchmark_suite.py --baseline benchmarks/baseline.json
+"""
+import argparse
+import json
+import random
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from bayes_classifier import BayesianClassifier, available_hypotheses
+
+# Parameters to test
+PARAMETERS = {
+    "category": [
+        "es_transportation",
+        "es_health",
+        "es_otherservices",
+        "es_food",
+        "es_hotelservices",
+        "es_barsandrestaurants",
+        "es_tech",
+        "es_sportsandtoys",
+        "es_wellnessandbeauty",
+        "es_hyper",
+        "es_fashion",
+        "es_home",
+        "es_contents",
+        "es_travel",
+        "es_leisure",
+    ],
+    "gender": ["M", "F", "E", "U"],
+    "age": ["0", "1", "2", "3", "4", "5", "6", "U"],
+    "amount_bin": ["very low", "low", "medium", "high"],
+}
+
+# Classifier settings for each benchmarked backend
+BACKENDS = {
+    "mongo": {"backend": "mongo", "use_lru_cache": False},
+    "precomputed": {"backend": "precomputed", "use_lru_cache": False},
+    "cache": {"backend": "precomputed", "use_lru_cache": True},
+    "memory": {"backend": "memory", "use_lru_cache": False},
+    "adtree": {"backend": "adtree", "use_lru_cache": False},
+    "sketch": {"backend": "sketch", "use_lru_cache": False},
+    "compiled": {"backend": "memory", "use_lru_cache": False, "compiled": True},
+}
+# The `precomputed` collection holds counts of the full dataset, so with
+# fraction < 1 these backends fall back to plain Mongo counting.
+FULL_DATASET_ONLY_BACKENDS = {"precomputed", "cache"}
+
+FRACTIONS = [10, 30, 50, 70, 90, 100]
+NUM_COMBINATIONS = 30
+REPEATS_PER_COMBINATION = 10
+
+BASELINE_FILENAME = "benchmarks/baseline.json"
+OUTPUT_FILENAME = "benchmarks/suite_results.csv"
+# A metric regresses when it is `tolerance` slower than the baseline AND
+# at least `min_delta_ms` slower (so microsecond jitter is not reported).
+REGRESSION_TOLERANCE = 0.20
+REGRESSION_MIN_DELTA_MS = 0.05
+REGRESSION_METRICS = ["p50_ms", "p95_ms"]
+
+
+def generate_evidences(n, seed=42):
+    """Return n random but reproducible evidence dictionaries."""
+    rng = random.Random(seed)
+    return [
+        {
+            "category": rng.choice(PARAMETERS["category"]),
+            "gender": rng.choice(PARAMETERS["gender"]),
+            "age": rng.choice(PARAMETERS["age"]),
+            "amount_bin": rng.choice(PARAMETERS["amount_bin"]),
+        }
+        for _ in range(n)
+    ]
+
+
+def summarize(samples_ns):
+    """Latency summary (in milliseconds) of a list of perf_counter_ns samples."""
+    samples_ms = np.asarray(samples_ns, dtype=np.float64) / 1e6
+    p50, p95, p99 = np.percentile(samples_ms, [50, 95, 99])
+    total_s = samples_ms.sum() / 1e3
+    return {
+        "n": len(samples_ms),
+        "mean_ms": float(samples_ms.mean()),
+        "p50_ms": float(p50),
+        "p95_ms": float(p95),
+        "p99_ms": float(p99),
+        "max_ms": float(samples_ms.max()),
+        "throughput_per_s": float(len(samples_ms) / total_s) if total_s > 0 else float("inf"),
+    }
+
+
+def make_classifier(backend, hypothesis_name, fraction):
+    return BayesianClassifier(
+        hyphothesis_name=hypothesis_name,
+        fraction=fraction / 100,
+        **BACKENDS[backend],
+    )
+
+
+def measure_memory(backend, hypothesis_name, fraction, evidences):
+    """Peak Python allocations (KiB) of building the classifier and one pass."""
+    BayesianClassifier._cached_compute_counts.cache_clear()
+    tracemalloc.start()
+    classifier = make_classifier(backend, hypothesis_name, fraction)
+    for evidence in evidences:
+        classifier.classify(evidence)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 1024
+
+
+def reset_cache(classifier, backend):
+    """
+    Empty the cache `backend` fills on its first call, so the next call is
+    cold. Returns False for backends without one.
+    """
+    settings = BACKENDS[backend]
+    if settings.get("use_lru_cache"):
+        BayesianClassifier._cached_compute_counts.cache_clear()
+        return True
+    if settings.get("compiled"):
+        # Compiled again from the in-memory tensor on the next call
+        classifier._compiled = None
+        return True
+    return False
+
+
+def benchmark_configuration(backend, hypothesis_name, fraction, evidences, repeats):
+    """Time one (backend, hypothesis, fraction) configuration."""
+    setup_start = time.perf_counter_ns()
+    classifier = make_classifier(backend, hypothesis_name, fraction)
+    setup_ms = (time.perf_counter_ns() - setup_start) / 1e6
+
+    cold_ns = []
+    warm_ns = []
+    for evidence in evidences:
+        # Every evidence starts cold, if the backend has a cache to empty
+        cold = reset_cache(classifier, backend)
+        for i in range(repeats):
+            start = time.perf_counter_ns()
+            classifier.classify(evidence)
+            elapsed = time.perf_counter_ns() - start
+            (cold_ns if cold and i == 0 else warm_ns).append(elapsed)
+
+    peak_kib = measure_memory(backend, hypothesis_name, fraction, evidences)
+
+    rows = []
+    for phase, samples in (("cold", cold_ns), ("warm", warm_ns)):
+        if not samples:
+            continue
+        row = {
+            "backend": backend,
+            "hypothesis": hypothesis_name,
+            "fraction": fraction,
+            "phase": phase,
+        }
+        row.update(summarize(samples))
+        row["setup_ms"] = setup_ms
+        row["peak_alloc_kib"] = peak_kib
+        rows.append(row)
+    return rows
+
+
+def run_suite(backends, hypotheses, fractions, num_combinations, repeats):
+    evidences = generate_evidences(num_combinations)
+    results = []
+    for backend in backends:
+        for hypothesis_name in hypotheses:
+            for fraction in fractions:
+                if fraction != 100 and backend in FULL_DATASET_ONLY_BACKENDS:
+                    continue
+                print(f"[{backend}] {hypothesis_name} @ {fraction}% ...", flush=True)
+                rows = benchmark_configuration(
+                    backend, hypothesis_name, fraction, evidences, repeats
+                )
+                for row in rows:
+                    print(
+                        f"   {row['phase']:>4}: p50={row['p50_ms']:.4f}ms "
+                        f"p95={row['p95_ms']:.4f}ms p99={row['p99_ms']:.4f}ms "
+                        f"throughput={row['throughput_per_s']:.1f}/s"
+                    )
+                results.extend(rows)
+    return results
+
+
+def result_key(row):
+    return f"{row['backend']}|{row['hypothesis']}|{row['fraction']}|{row['phase']}"
+
+
+def save_baseline(results, filename):
+    baseline = {
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime()),
+        "results": {result_key(row): row for row in results},
+    }
+    with open(filename, "w") as f:
+        json.dump(baseline, f, indent=2)
+    print(f"Baseline saved to {filename}.")
+
+
+def compare_with_baseline(
+    results,
+    filename,
+    tolerance=REGRESSION_TOLERANCE,
+    min_delta_ms=REGRESSION_MIN_DELTA_MS,
+):
+    """Return a list of regressions (dicts) against the stored baseline."""
+    with open(filename) as f:
+        baseline = json.load(f)["results"]
+
+    regressions = []
+    for row in results:
+        reference = baseline.get(result_key(row))
+        if reference is None:
+            continue
+        for metric in REGRESSION_METRICS:
+            current, previous = row[metric], reference[metric]
+            if current > previous * (1 + tolerance) and current - previous > min_delta_ms:
+                regressions.append(
+                    {
+                        "key": result_key(row),
+                        "metric": metric,
+                        "baseline": previous,
+                        "current": current,
+                        "ratio": current / previous if previous > 0 else float("inf"),
+                    }
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=list(BACKENDS))
+    parser.add_argument("--hypotheses", nargs="+", default=list(available_hypotheses))
+    parser.add_argument("--fractions", nargs="+", type=int, default=FRACTIONS)
+    parser.add_argument("--combinations", type=int, default=NUM_COMBINATIONS)
+    parser.add_argument("--repeats", type=int, default=REPEATS_PER_COMBINATION)
+    parser.add_argument("--output", default=OUTPUT_FILENAME)
+    parser.add_argument("--baseline", default=None, help="Baseline JSON to compare against")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE)
+    args = parser.parse_args()
+
+    results = run_suite(
+        args.backends, args.hypotheses, args.fractions, args.combinations, args.repeats
+    )
+    pd.DataFrame(results).to_csv(args.output, index=False)
+    print(f"Benchmarking complete. Saved to {args.output}.")
+
+    if args.save_baseline:
+        save_baseline(results, args.baseline or BASELINE_FILENAME)
+        return 0
+
+    if args.baseline:
+        regressions = compare_with_baseline(results, args.baseline, args.tolerance)
+        if not regressions:
+            print("No regressions against the baseline.")
+            return 0
+        print(f"{len(regressions)} regression(s) against the baseline:")
+        for r in regressions:
+            print(
+                f"   {r['key']} {r['metric']}: {r['baseline']:.4f}ms -> "
+                f"{r['current']:.4f}ms (x{r['ratio']:.2f})"
+            )
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,199 @@
+# classifier_stats.py
+"""
+Opt-in instrumentation for BayesianClassifier.
+
+When enabled (BayesianClassifier(instrument=True) or classifier.enable_stats())
+every classify() call records:
+- the time spent in each stage (index mapping, count lookups, each backend
+  operation, the whole joint distribution),
+- the number of database round-trips it issued,
+- how many count lookups were answered by the LRU cache.
+
+When disabled, the classifier only pays an `is None` check per call site.
+"""
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict, deque
+
+import numpy as np
+
+# Upper bounds (seconds) of the classify() latency histogram buckets
+LATENCY_BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+)
+# How many recent classify() latencies are kept for exact percentiles
+RECENT_LATENCIES = 10000
+
+
+class _CallRecord:
+    """Per-call accumulator, private to the thread running classify()."""
+
+    __slots__ = ("stage_ns", "stage_calls", "round_trips", "lookups", "misses")
+
+    def __init__(self):
+        self.stage_ns = defaultdict(int)
+        self.stage_calls = defaultdict(int)
+        self.round_trips = 0
+        self.lookups = 0
+        self.misses = 0
+
+
+class ClassifierStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.calls = 0
+            self.total_ns = 0
+            self.stage_ns = defaultdict(int)
+            self.stage_calls = defaultdict(int)
+            self.round_trips = 0
+            self.lookups = 0
+            self.misses = 0
+            self.histogram = [0] * (len(LATENCY_BUCKETS) + 1)
+            self.recent_ns = deque(maxlen=RECENT_LATENCIES)
+            self.last_call = None
+
+    # --- Recording (called by the classifier and the backends) ---
+
+    def begin_call(self):
+        self._local.record = _CallRecord()
+
+    def end_call(self, elapsed_ns):
+        record = self._local.record
+        self._local.record = None
+        with self._lock:
+            self.calls += 1
+            self.total_ns += elapsed_ns
+            for stage, ns in record.stage_ns.items():
+                self.stage_ns[stage] += ns
+                self.stage_calls[stage] += record.stage_calls[stage]
+            self.round_trips += record.round_trips
+            self.lookups += record.lookups
+            self.misses += record.misses
+            self.histogram[bisect_left(LATENCY_BUCKETS, elapsed_ns / 1e9)] += 1
+            self.recent_ns.append(elapsed_ns)
+            self.last_call = {
+                "elapsed_ms": elapsed_ns / 1e6,
+                "round_trips": record.round_trips,
+                "count_lookups": record.lookups,
+                "cache_misses": record.misses,
+                "stages_ms": {s: ns / 1e6 for s, ns in record.stage_ns.items()},
+            }
+
+    def stage(self, name, elapsed_ns, round_trips=0):
+        record = getattr(self._local, "record", None)
+        if record is None:
+            with self._lock:
+                self.stage_ns[name] += elapsed_ns
+                self.stage_calls[name] += 1
+                self.round_trips += round_trips
+            return
+        record.stage_ns[name] += elapsed_ns
+        record.stage_calls[name] += 1
+        record.round_trips += round_trips
+
+    def count_lookup(self):
+        record = getattr(self._local, "record", None)
+        if record is None:
+            with self._lock:
+                self.lookups += 1
+            return
+        record.lookups += 1
+
+    def count_miss(self):
+        record = getattr(self._local, "record", None)
+        if record is None:
+            with self._lock:
+                self.misses += 1
+            return
+        record.misses += 1
+
+    # --- Reporting ---
+
+    def snapshot(self):
+        """Return a plain dict with the aggregated statistics."""
+        with self._lock:
+            calls = self.calls
+            recent = np.asarray(self.recent_ns, dtype=np.float64) / 1e6
+            snapshot = {
+                "calls": calls,
+                "mean_ms": self.total_ns / calls / 1e6 if calls else 0.0,
+                "round_trips": self.round_trips,
+                "round_trips_per_call": self.round_trips / calls if calls else 0.0,
+                "count_lookups": self.lookups,
+                "cache_hits": self.lookups - self.misses,
+                "cache_misses": self.misses,
+                "cache_hit_ratio": (
+                    (self.lookups - self.misses) / self.lookups if self.lookups else 0.0
+                ),
+                "stages": {
+                    stage: {
+                        "calls": self.stage_calls[stage],
+                        "total_ms": ns / 1e6,
+                        "mean_ms": ns / self.stage_calls[stage] / 1e6,
+                    }
+                    for stage, ns in self.stage_ns.items()
+                },
+                "last_call": self.last_call,
+            }
+        if len(recent):
+            p50, p95, p99 = np.percentile(recent, [50, 95, 99])
+            snapshot.update(p50_ms=float(p50), p95_ms=float(p95), p99_ms=float(p99))
+        return snapshot
+
+    def to_prometheus(self, prefix="bayes_classifier"):
+        """Render the statistics in the Prometheus text exposition format."""
+        with self._lock:
+            lines = [
+                f"# HELP {prefix}_classify_seconds Latency of classify().",
+                f"# TYPE {prefix}_classify_seconds histogram",
+            ]
+            cumulative = 0
+            for bound, n in zip(LATENCY_BUCKETS, self.histogram):
+                cumulative += n
+                lines.append(f'{prefix}_classify_seconds_bucket{{le="{bound}"}} {cumulative}')
+            lines.append(f'{prefix}_classify_seconds_bucket{{le="+Inf"}} {self.calls}')
+            lines.append(f"{prefix}_classify_seconds_sum {self.total_ns / 1e9}")
+            lines.append(f"{prefix}_classify_seconds_count {self.calls}")
+
+            lines.append(f"# HELP {prefix}_stage_seconds_total Time spent per classify() stage.")
+            lines.append(f"# TYPE {prefix}_stage_seconds_total counter")
+            for stage, ns in sorted(self.stage_ns.items()):
+                lines.append(f'{prefix}_stage_seconds_total{{stage="{stage}"}} {ns / 1e9}')
+
+            lines.append(f"# HELP {prefix}_db_round_trips_total Database round-trips issued.")
+            lines.append(f"# TYPE {prefix}_db_round_trips_total counter")
+            lines.append(f"{prefix}_db_round_trips_total {self.round_trips}")
+
+            lines.append(f"# HELP {prefix}_count_lookups_total Count lookups by cache result.")
+            lines.append(f"# TYPE {prefix}_count_lookups_total counter")
+            lines.append(f'{prefix}_count_lookups_total{{result="hit"}} {self.lookups - self.misses}')
+            lines.append(f'{prefix}_count_lookups_total{{result="miss"}} {self.misses}')
+        return "\n".join(lines) + "\n"
+
+
+def timed(stats, name, func, *args, round_trips=0):
+    """Call func(*args), recording its duration as stage `name` in `stats`."""
+    start = time.perf_counter_ns()
+    result = func(*args)
+    stats.stage(name, time.perf_counter_ns() - start, round_trips)
+    return result
@@ -0,0 +1,185 @@
+# compiled_model.py
+"""
+Compile a hypothesis into a lookup table over the whole evidence space.
+
+With the current variables there are only 8 x 4 x 15 x 4 = 1920 possible
+evidences, so every answer classify() can give is enumerable. The table is
+computed from the joint count tensor in one vectorized pass and holds, for
+every evidence code and target value, exactly the number
+compute_joint_distribution() returns. Serving is then a single array read.
+
+Evidence codes are mixed-radix numbers over the evidence variables (every
+variable except the target, in `variables` order):
+    code = ((v1 * r2 + v2) * r3 + v3) * r4 + v4
+
+This module only needs NumPy: a saved model (CompiledModel.save) can be
+loaded and served without scipy, pymongo or a database connection.
+"""
+import json
+
+import numpy as np
+
+
+def joint_probability_tensor(joint_counts, variables, parents, alpha, N):
+    """
+    Return P(v1, ..., vn) (unnormalized as in compute_joint_distribution)
+    for every cell of the joint tensor, as the product over variables of
+    (N(var, parents) + alpha) / (N(parents) + alpha * k).
+
+    A vector of alphas adds a leading alpha axis to the result; the counts
+    are summed once for all of them (see alpha_sweep).
+    """
+    n_vars = len(variables)
+    alpha = np.asarray(alpha, dtype=np.float64)
+    alpha = alpha.reshape(alpha.shape + (1,) * n_vars)
+    prob = np.ones(alpha.shape[:-n_vars] + joint_counts.shape, dtype=np.float64)
+    for i, var in enumerate(variables):
+        parent_axes = {variables.index(p) for p in parents.get(var, [])}
+        family_axes = parent_axes | {i}
+        # keepdims leaves size-1 axes so the counts broadcast over the joint
+        family_counts = joint_counts.sum(
+            axis=tuple(a for a in range(n_vars) if a not in family_axes), keepdims=True
+        )
+        if parent_axes:
+            parent_counts = joint_counts.sum(
+                axis=tuple(a for a in range(n_vars) if a not in parent_axes),
+                keepdims=True,
+            )
+        else:
+            parent_counts = N
+        k = joint_counts.shape[i]
+        prob = prob * ((family_counts + alpha) / (parent_counts + alpha * k))
+    return prob
+
+
+class CompiledModel:
+    """
+    Lookup table of a hypothesis: table[code, t] is the joint probability of
+    the evidence with code `code` and the target taking its t-th value.
+    """
+
+    def __init__(self, table, variables, cardinalities, target_variable, metadata=None):
+        self.table = table
+        self.variables = list(variables)
+        self.cardinalities = cardinalities
+        self.target_variable = target_variable
+        self.evidence_variables = [v for v in self.variables if v != target_variable]
+        # Indexed fields classify_batch() reads
+        self.input_variables = list(self.evidence_variables)
+        self.radices = [len(cardinalities[v]) for v in self.evidence_variables]
+        self.strides = [int(np.prod(self.radices[i + 1 :])) for i in range(len(self.radices))]
+        self.metadata = metadata or {}
+
+    @classmethod
+    def compile(
+        cls,
+        joint_counts,
+        variables,
+        cardinalities,
+        parents,
+        alpha,
+        N=None,
+        target_variable="fraud",
+        metadata=None,
+    ):
+        """Evaluate the hypothesis `parents` over the whole evidence space."""
+        if N is None:
+            N = int(joint_counts.sum())
+        prob = joint_probability_tensor(joint_counts, variables, parents, alpha, N)
+        target_axis = variables.index(target_variable)
+        table = np.moveaxis(prob, target_axis, -1).reshape(-1, prob.shape[target_axis])
+        return cls(
+            np.ascontiguousarray(table),
+            variables,
+            cardinalities,
+            target_variable,
+            metadata,
+        )
+
+    def header(self):
+        """Everything but the table, as JSON-serializable data."""
+        return {
+            "variables": self.variables,
+            "cardinalities": self.cardinalities,
+            "target_variable": self.target_variable,
+            "shape": list(self.table.shape),
+            "metadata": self.metadata,
+        }
+
+    @classmethod
+    def from_header(cls, table, header):
+        if cls is CompiledModel and "segment" in header:
+            # Saved or published by a segmented model (see segmented_model)
+            from segmented_model import SegmentedModel
+
+            return SegmentedModel.from_header(table, header)
+        return cls(
+            table,
+            header["variables"],
+            header["cardinalities"],
+            header["target_variable"],
+            header["metadata"],
+        )
+
+    def save(self, path):
+        """Write the table and header to an .npz file."""
+        header = np.frombuffer(json.dumps(self.header()).encode(), dtype=np.uint8)
+        np.savez(path, table=self.table, header=header)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            header = json.loads(data["header"].tobytes())
+            if "sparse" in header:
+                # Saved by a SparseModel: CPT counts instead of a table
+                from sparse_model import SparseModel
+
+                return SparseModel.from_header(
+                    {name: data[name] for name in data.files if name != "header"}, header
+                )
+            table = data["table"]
+        table.flags.writeable = False
+        return cls.from_header(table, header)
+
+    def evidence_code(self, evidence_indexed):
+        code = 0
+        for var, stride in zip(self.evidence_variables, self.strides):
+            code += evidence_indexed[var] * stride
+        return code
+
+    def index_evidence(self, evidence):
+        return {var: self.cardinalities[var][evidence[var]] for var in self.evidence_variables}
+
+    def classify(self, evidence, apply_index=True):
+        """Return (is_fraud, probability) as BayesianClassifier.classify does."""
+        if apply_index:
+            evidence = self.index_evidence(evidence)
+        row = self.table[self.evidence_code(evidence)]
+        pred_clase = int(row.argmax())
+        return (pred_clase == 1, float(row[pred_clase]))
+
+    def evidence_codes(self, columns):
+        """Vectorized evidence_code: {var: array of indexed values} -> array of codes."""
+        codes = 0
+        for var, stride in zip(self.evidence_variables, self.strides):
+            codes = codes + np.asarray(columns[var], dtype=np.int64) * stride
+        return codes
+
+    def table_rows(self, columns):
+        return self.table[self.evidence_codes(columns)]
+
+    def classify_batch(self, columns):
+        """
+        classify() of many indexed evidences at once: `columns` maps every
+        variable of input_variables to an array of indexed values. Returns
+        (predicted target index, P(target | evidence)) arrays.
+        """
+        rows = self.table_rows(columns)
+        return rows.argmax(axis=1), rows / rows.sum(axis=1, keepdims=True)
+
+    def posterior(self, evidence, apply_index=True):
+        """Return P(target | evidence) for every target value."""
+        if apply_index:
+            evidence = self.index_evidence(evidence)
+        row = self.table[self.evidence_code(evidence)]
+        return row / row.sum()
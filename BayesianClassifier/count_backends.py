@@ -0,0 +1,347 @@
+# count_backends.py
+"""
+Counting backends used by BayesianClassifier.compute_counts.
+
+Every backend exposes ``count(evidence)``, where ``evidence`` is a dict of
+indexed values ({variable: value_index}), and returns the number of
+transactions matching all of them.
+
+Backends may also expose ``family_counts(variables)``, returning the sparse
+table {values tuple: count} of the observed combinations of `variables`;
+count_table() computes it in MongoDB for the others.
+
+Backends record their operations into ``self.stats`` (a ClassifierStats)
+when the classifier has instrumentation enabled.
+"""
+import numpy as np
+
+from classifier_stats import timed
+from count_min import DEFAULT_DELTA, DEFAULT_EPSILON, CountMinSketch
+
+# Every indexed transaction stores a deterministic hash bucket in
+# [0, NUM_BUCKETS) (see index_dataset.bucket_of). A fraction f of the data is
+# the set of transactions with bucket < round(f * NUM_BUCKETS), so fractions
+# are nested: the 10% sample is contained in the 30% one.
+BUCKET_FIELD = "bucket"
+NUM_BUCKETS = 100
+
+
+def fraction_filter(fraction):
+    """Mongo filter selecting `fraction` of the data (None for all of it)."""
+    if fraction >= 1:
+        return None
+    return {BUCKET_FIELD: {"$lt": bucket_limit(fraction)}}
+
+
+def bucket_limit(fraction):
+    if not 0 < fraction <= 1:
+        raise ValueError(f"fraction must be in (0, 1], got {fraction}")
+    return max(1, round(fraction * NUM_BUCKETS))
+
+
+class MongoCountBackend:
+    """Count every query with count_documents (no precomputation)."""
+
+    name = "mongo"
+    stats = None
+
+    def __init__(self, data_collection, match=None):
+        self.data_collection = data_collection
+        # Extra filter (e.g. the fraction's bucket range) added to every query
+        self.match = match
+
+    def count(self, evidence):
+        if self.match:
+            evidence = {**evidence, **self.match}
+        if self.stats is not None:
+            return timed(
+                self.stats,
+                "count_documents",
+                self.data_collection.count_documents,
+                evidence,
+                round_trips=1,
+            )
+        return self.data_collection.count_documents(evidence)
+
+
+class PrecomputedCountBackend:
+    """Look the count up in the `precomputed` collection, fall back to Mongo."""
+
+    name = "precomputed"
+    stats = None
+
+    def __init__(self, data_collection, precomputed):
+        self.data_collection = data_collection
+        self.precomputed = precomputed
+
+    def count(self, evidence):
+        if self.stats is not None:
+            return self._instrumented_count(evidence)
+        res = self.precomputed.find_one(evidence, {"count": 1})
+        if res is not None:
+            return res["count"]
+        return self.data_collection.count_documents(evidence)
+
+    def _instrumented_count(self, evidence):
+        res = timed(
+            self.stats,
+            "precomputed_find_one",
+            self.precomputed.find_one,
+            evidence,
+            {"count": 1},
+            round_trips=1,
+        )
+        if res is not None:
+            return res["count"]
+        return timed(
+            self.stats,
+            "count_documents",
+            self.data_collection.count_documents,
+            evidence,
+            round_trips=1,
+        )
+
+
+class TensorCountBackend:
+    """
+    Answer counts from a dense joint count tensor held in memory.
+
+    The tensor has one axis per variable (in `variables` order) and its
+    cell [v1, v2, ...] holds how many transactions take those values.
+    """
+
+    name = "memory"
+    stats = None
+
+    def __init__(self, joint_counts, variables):
+        self.joint_counts = joint_counts
+        self.variables = list(variables)
+        self.axis = {var: i for i, var in enumerate(self.variables)}
+
+    def count(self, evidence):
+        if self.stats is not None:
+            return timed(self.stats, "memory_count", self._count, evidence)
+        return self._count(evidence)
+
+    def _count(self, evidence):
+        index = [slice(None)] * len(self.variables)
+        for var, val in evidence.items():
+            index[self.axis[var]] = val
+        return int(self.joint_counts[tuple(index)].sum())
+
+    def family_counts(self, variables):
+        axes = [self.axis[var] for var in variables]
+        others = tuple(a for a in range(len(self.variables)) if a not in axes)
+        # The kept axes stay in increasing order: reorder them as `variables`
+        marginal = np.transpose(
+            self.joint_counts.sum(axis=others), np.argsort(np.argsort(axes))
+        )
+        return {
+            tuple(int(v) for v in key): int(marginal[tuple(key)])
+            for key in np.argwhere(marginal)
+        }
+
+
+class BucketedTensorCountBackend(TensorCountBackend):
+    """
+    In-memory counts for nested fractions of the data.
+
+    Keeps one joint count tensor per hash bucket, accumulated along the
+    bucket axis, so the tensor of any fraction is a slice of it and
+    changing the fraction never goes back to the database.
+    """
+
+    def __init__(self, bucket_counts, variables, fraction=1.0):
+        self.cumulative_counts = np.cumsum(bucket_counts, axis=0)
+        super().__init__(self.cumulative_counts[-1], variables)
+        self.set_fraction(fraction)
+
+    def set_fraction(self, fraction):
+        self.fraction = fraction
+        self.joint_counts = self.cumulative_counts[bucket_limit(fraction) - 1]
+
+
+class ADTreeCountBackend:
+    """
+    Answer counts from an AD-tree (see ad_tree): sparse, so it also fits
+    variables whose joint tensor would be too large to hold densely.
+    """
+
+    name = "adtree"
+    stats = None
+
+    def __init__(self, tree, variables):
+        self.tree = tree
+        self.variables = list(variables)
+        self.axis = {var: i for i, var in enumerate(self.variables)}
+
+    def count(self, evidence):
+        if self.stats is not None:
+            return timed(self.stats, "adtree_count", self._count, evidence)
+        return self._count(evidence)
+
+    def _count(self, evidence):
+        return self.tree.count({self.axis[var]: val for var, val in evidence.items()})
+
+    def family_counts(self, variables):
+        return self.tree.contingency([self.axis[var] for var in variables])
+
+
+def count_table(data_collection, variables, match=None):
+    """
+    Sparse table {values tuple: count} of the observed combinations of
+    `variables`, with one $group (only observed combinations come back).
+    """
+    pipeline = [{"$match": match}] if match else []
+    pipeline.append(
+        {
+            "$group": {
+                "_id": {var: f"${var}" for var in variables},
+                "count": {"$sum": 1},
+            }
+        }
+    )
+    return {
+        tuple(doc["_id"][var] for var in variables): doc["count"]
+        for doc in data_collection.aggregate(pipeline, allowDiskUse=True)
+    }
+
+
+class SketchCountBackend:
+    """
+    Approximate counts from one Count-Min sketch per family of variables
+    (see count_min). Memory is fixed by width x depth per family however
+    many distinct configurations stream in, and counts are never below the
+    true ones. Families without a sketch are counted by `fallback`.
+    """
+
+    name = "sketch"
+    stats = None
+
+    def __init__(
+        self,
+        variables,
+        cardinalities,
+        families,
+        epsilon=DEFAULT_EPSILON,
+        delta=DEFAULT_DELTA,
+        conservative=True,
+        seed=0,
+        fallback=None,
+    ):
+        self.variables = list(variables)
+        self.axis = {var: i for i, var in enumerate(self.variables)}
+        self.radix = {var: len(cardinalities[var]) for var in self.variables}
+        self.fallback = fallback
+        self.rows = 0
+        self.sketches = {}
+        for family in families:
+            if family:
+                self.sketches[self.family_key(family)] = CountMinSketch.from_error(
+                    epsilon, delta, seed=seed, conservative=conservative
+                )
+
+    def family_key(self, family):
+        return tuple(sorted(family, key=self.axis.__getitem__))
+
+    @property
+    def nbytes(self):
+        return sum(sketch.nbytes for sketch in self.sketches.values())
+
+    def update(self, rows):
+        """Add rows ((n, len(variables)) indexed values) to every sketch."""
+        rows = np.asarray(rows)
+        self.rows += len(rows)
+        for family, sketch in self.sketches.items():
+            columns = tuple(rows[:, self.axis[var]] for var in family)
+            sketch.add(np.ravel_multi_index(columns, [self.radix[var] for var in family]))
+
+    def merge(self, other):
+        """Add the counts of a backend sketched with the same settings (e.g. by another worker)."""
+        for family, sketch in self.sketches.items():
+            sketch.merge(other.sketches[family])
+        self.rows += other.rows
+        return self
+
+    def count(self, evidence):
+        if self.stats is not None:
+            return timed(self.stats, "sketch_count", self._count, evidence)
+        return self._count(evidence)
+
+    def _count(self, evidence):
+        if not evidence:
+            return self.rows
+        family = self.family_key(evidence)
+        sketch = self.sketches.get(family)
+        if sketch is None:
+            if self.fallback is None:
+                raise KeyError(f"No sketch for the family {family}")
+            return self.fallback.count(evidence)
+        key = np.ravel_multi_index(
+            tuple([evidence[var]] for var in family), [self.radix[var] for var in family]
+        )
+        return int(sketch.query(key)[0])
+
+
+def collection_row_batches(data_collection, variables, match=None, batch_size=100_000):
+    """
+    Yield (n, len(variables)) arrays of the indexed values of the documents,
+    batch_size rows at a time (one pass, bounded memory).
+    """
+    projection = {var: 1 for var in variables}
+    projection["_id"] = 0
+    cursor = data_collection.find(match or {}, projection, batch_size=batch_size)
+    batch = []
+    for doc in cursor:
+        batch.append([doc[var] for var in variables])
+        if len(batch) == batch_size:
+            yield np.array(batch, dtype=np.int64)
+            batch = []
+    if batch:
+        yield np.array(batch, dtype=np.int64)
+
+
+def collection_rows(data_collection, variables, match=None, batch_size=100_000):
+    """
+    (n, len(variables)) array of the indexed values of every document,
+    read in one pass.
+    """
+    batches = list(collection_row_batches(data_collection, variables, match, batch_size))
+    if not batches:
+        return np.zeros((0, len(variables)), dtype=np.int64)
+    return np.concatenate(batches)
+
+
+def joint_count_tensor(data_collection, variables, cardinalities, match=None):
+    """
+    Build the dense joint count tensor of `variables` with a single
+    $group aggregation (one round-trip, no documents shipped to the client).
+    """
+    shape = tuple(len(cardinalities[var]) for var in variables)
+    pipeline = []
+    if match:
+        pipeline.append({"$match": match})
+    pipeline.append(
+        {
+            "$group": {
+                "_id": {var: f"${var}" for var in variables},
+                "count": {"$sum": 1},
+            }
+        }
+    )
+    joint = np.zeros(shape, dtype=np.int64)
+    for doc in data_collection.aggregate(pipeline, allowDiskUse=True):
+        joint[tuple(doc["_id"][var] for var in variables)] = doc["count"]
+    return joint
+
+
+def bucket_count_tensor(data_collection, variables, cardinalities):
+    """
+    Like joint_count_tensor, with a leading axis for the hash bucket:
+    result[b, v1, v2, ...] counts the transactions of bucket b.
+    """
+    return joint_count_tensor(
+        data_collection,
+        [BUCKET_FIELD] + list(variables),
+        {BUCKET_FIELD: range(NUM_BUCKETS), **cardinalities},
+    )
@@ -0,0 +1,107 @@
+# count_min.py
+"""
+Count-Min sketch (Cormode & Muthukrishnan 2005) for approximate counts in
+fixed memory, whatever the number of distinct keys.
+
+A sketch is a (depth, width) table of counters; every key increments one
+counter per row, chosen by an independent hash. The estimate of a key is
+the minimum over its counters, so it never undercounts, and with
+    width = ceil(e / epsilon), depth = ceil(ln(1 / delta))
+it overcounts by at most epsilon * (total count) with probability 1 - delta.
+
+With conservative=True (conservative update) a batch only raises the
+counters that are below the new estimate of its key, which keeps the same
+guarantee with (much) smaller overestimates.
+
+Sketches with the same width, depth and seed merge by adding their tables,
+so workers can each sketch part of the data (a merged conservative sketch
+still never undercounts).
+"""
+import math
+
+import numpy as np
+
+DEFAULT_EPSILON = 1e-4
+DEFAULT_DELTA = 0.01
+
+_GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+_MIX_1 = np.uint64(0xBF58476D1CE4E5B9)
+_MIX_2 = np.uint64(0x94D049BB133111EB)
+
+
+def _splitmix64(x):
+    """Vectorized SplitMix64 finalizer (uint64 arithmetic wraps around)."""
+    z = x + _GOLDEN
+    z = (z ^ (z >> np.uint64(30))) * _MIX_1
+    z = (z ^ (z >> np.uint64(27))) * _MIX_2
+    return z ^ (z >> np.uint64(31))
+
+
+class CountMinSketch:
+    def __init__(self, width, depth, seed=0, conservative=False):
+        self.width = int(width)
+        self.depth = int(depth)
+        self.seed = seed
+        self.conservative = conservative
+        self.table = np.zeros((self.depth, self.width), dtype=np.int64)
+        self.total = 0
+        rng = np.random.default_rng(seed)
+        self._salts = rng.integers(0, 2**63, size=self.depth, dtype=np.uint64)
+
+    @classmethod
+    def from_error(cls, epsilon=DEFAULT_EPSILON, delta=DEFAULT_DELTA, **kwargs):
+        """Sketch overcounting by at most epsilon * total with probability 1 - delta."""
+        return cls(math.ceil(math.e / epsilon), math.ceil(math.log(1 / delta)), **kwargs)
+
+    @property
+    def epsilon(self):
+        return math.e / self.width
+
+    @property
+    def delta(self):
+        return math.exp(-self.depth)
+
+    @property
+    def nbytes(self):
+        return self.table.nbytes
+
+    def error_bound(self):
+        """Overcount bound holding with probability 1 - delta."""
+        return self.epsilon * self.total
+
+    def _buckets(self, keys):
+        keys = np.asarray(keys, dtype=np.uint64)
+        return [(_splitmix64(keys ^ salt) % np.uint64(self.width)).astype(np.intp) for salt in self._salts]
+
+    def add(self, keys, counts=None):
+        """Add `counts` (default 1 each) to the integer `keys`."""
+        keys = np.asarray(keys, dtype=np.int64).ravel()
+        if counts is None:
+            counts = np.ones(len(keys), dtype=np.int64)
+        # One update per distinct key (the conservative update relies on it)
+        keys, inverse = np.unique(keys, return_inverse=True)
+        counts = np.bincount(inverse.ravel(), weights=counts, minlength=len(keys)).astype(np.int64)
+        buckets = self._buckets(keys)
+        if self.conservative:
+            # Raise each key's counters to (current estimate + count) at most
+            estimate = np.min([row[b] for row, b in zip(self.table, buckets)], axis=0)
+            target = estimate + counts
+            for row, b in zip(self.table, buckets):
+                np.maximum.at(row, b, target)
+        else:
+            for row, b in zip(self.table, buckets):
+                np.add.at(row, b, counts)
+        self.total += int(counts.sum())
+
+    def query(self, keys):
+        """Estimated counts of the integer `keys` (never below the true ones)."""
+        buckets = self._buckets(np.atleast_1d(keys))
+        return np.min([row[b] for row, b in zip(self.table, buckets)], axis=0)
+
+    def merge(self, other):
+        """Add the counts of a sketch with the same width, depth and seed."""
+        if (self.width, self.depth, self.seed) != (other.width, other.depth, other.seed):
+            raise ValueError("Only sketches with the same width, depth and seed can be merged")
+        self.table += other.table
+        self.total += other.total
+        return self
@@ -0,0 +1,199 @@
+# discretizer.py
+"""
+Bin edges for `amount` learned from a streaming quantile sketch, and the
+vectorized binning used at scoring time.
+
+QuantileSketch (after DDSketch, Masson et al. 2019) counts the values in
+logarithmic buckets of ratio gamma = (1 + a) / (1 - a): any quantile it
+returns is within a relative error `a` of the true one, its memory only
+grows with the logarithm of the value range, and two sketches merge by
+adding their bucket counts. The raw CSV is sketched in one parallel pass
+over chunks (see local_counts) and the edges are the quantiles
+1/n, 2/n, ... of the amounts, so every bin holds about the same number of
+transactions.
+
+Bins are right-closed like pd.cut(..., include_lowest=True):
+    edges[i] < amount <= edges[i + 1]   ->   labels[i]
+
+The edges and labels are stored with the `amount_bin` mapping in the
+`cardinalities` collection, and the classifier uses them to accept a raw
+`amount` in the evidence (Discretizer.bin_indexed bins a whole array with
+one searchsorted).
+
+Usage:
+    python3 discretizer.py fraud_credit_card.csv --bins 6
+"""
+import argparse
+import math
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+RELATIVE_ACCURACY = 0.005
+
+# Fixed bins of `amount`, used unless quantile edges were stored
+# (upload_dataset.py --amount-quantiles). On the full dataset:
+# 0 <= x < 10  : 107373 (very low)
+# 10 <= x < 50 : 386499 (low)
+# 50 <= x < 100: 80210  (medium)
+# 100 <= x     : 20561  (high)
+AMOUNT_BINS = [0, 10, 50, 100, float("inf")]
+AMOUNT_LABELS = ["very low", "low", "medium", "high"]
+
+
+class QuantileSketch:
+    def __init__(self, relative_accuracy=RELATIVE_ACCURACY):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        # {bucket k: count} of the values in (gamma^(k-1), gamma^k]
+        self.buckets = {}
+        self.zero_count = 0
+        self.count = 0
+
+    def add(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        positive = values[values > 0]
+        self.zero_count += len(values) - len(positive)
+        keys, counts = np.unique(np.ceil(np.log(positive) / self._log_gamma), return_counts=True)
+        for key, n in zip(keys.astype(np.int64).tolist(), counts.tolist()):
+            self.buckets[key] = self.buckets.get(key, 0) + n
+        self.count += len(values)
+
+    def merge(self, other):
+        if other.gamma != self.gamma:
+            raise ValueError("Only sketches with the same relative accuracy can be merged")
+        for key, n in other.buckets.items():
+            self.buckets[key] = self.buckets.get(key, 0) + n
+        self.zero_count += other.zero_count
+        self.count += other.count
+        return self
+
+    def quantiles(self, qs):
+        """Values at the quantiles `qs` (within the relative accuracy)."""
+        if self.count == 0:
+            raise ValueError("The sketch is empty")
+        keys = np.array(sorted(self.buckets), dtype=np.int64)
+        counts = np.array([self.buckets[k] for k in keys], dtype=np.int64)
+        cumulative = self.zero_count + np.cumsum(counts)
+        ranks = np.asarray(qs, dtype=np.float64) * (self.count - 1)
+        positions = np.searchsorted(cumulative, ranks, side="right")
+        values = 2 * self.gamma ** keys[np.minimum(positions, len(keys) - 1)] / (self.gamma + 1)
+        return np.where(ranks < self.zero_count, 0.0, values)
+
+
+def quantile_edges(sketch, n_bins):
+    """[0, q(1/n), ..., q((n-1)/n), inf], without repeated edges."""
+    inner = sketch.quantiles(np.arange(1, n_bins) / n_bins)
+    inner = np.unique(np.round(inner[inner > 0], 2))
+    return [0.0] + inner.tolist() + [math.inf]
+
+
+def interval_labels(edges):
+    return [f"({low:g}, {high:g}]" for low, high in zip(edges[:-1], edges[1:])]
+
+
+class Discretizer:
+    """Bins raw values of `source` into the indexed values of `variable`."""
+
+    def __init__(self, variable, source, edges, labels, mapping):
+        self.variable = variable
+        self.source = source
+        self.edges = np.asarray(edges, dtype=np.float64)
+        self.labels = list(labels)
+        # Bin position -> indexed value (-1 for a bin absent from the data,
+        # rejected by known_positions)
+        self.index = np.array([mapping.get(label, -1) for label in self.labels])
+
+    def known_positions(self, values):
+        """positions(), raising for a bin no indexed transaction fell into."""
+        positions = self.positions(values)
+        unknown = self.index[positions] < 0
+        if np.any(unknown):
+            bins = sorted({self.labels[p] for p in np.atleast_1d(positions)[np.atleast_1d(unknown)]})
+            raise ValueError(f"{self.variable} bins {bins} never occur in the data and have no index")
+        return positions
+
+    def positions(self, values):
+        positions = np.searchsorted(self.edges, values, side="left") - 1
+        return np.clip(positions, 0, len(self.labels) - 1)
+
+    def bin_labels(self, values):
+        return np.asarray(self.labels, dtype=object)[self.positions(values)]
+
+    def bin_indexed(self, values):
+        return self.index[self.known_positions(values)]
+
+    def to_doc(self):
+        """The fields stored next to the variable's mapping in `cardinalities`."""
+        return {"source": self.source, "edges": self.edges.tolist(), "labels": self.labels}
+
+    @classmethod
+    def from_doc(cls, variable, doc, mapping):
+        return cls(variable, doc["source"], doc["edges"], doc["labels"], mapping)
+
+
+def load_discretizers(docs, cardinalities):
+    """{variable: doc with source/edges/labels} -> {variable: Discretizer}"""
+    return {
+        var: Discretizer.from_doc(var, doc, cardinalities[var])
+        for var, doc in docs.items()
+        if var in cardinalities
+    }
+
+
+def discretize(evidence, discretizers, apply_index=True):
+    """
+    Replace raw values in `evidence` (e.g. amount=37.5) by their bin
+    (amount_bin='low', or its indexed value with apply_index=False).
+    """
+    for d in discretizers.values():
+        if d.source in evidence:
+            position = int(d.known_positions(float(evidence[d.source])))
+            evidence = {var: val for var, val in evidence.items() if var != d.source}
+            evidence[d.variable] = d.labels[position] if apply_index else int(d.index[position])
+    return evidence
+
+
+def sketch_chunk(task):
+    """Worker: sketch the amounts of one byte range of the raw CSV."""
+    from local_counts import read_csv_range
+
+    path, header, start, end, relative_accuracy = task
+    df = read_csv_range(path, header, start, end)
+    amounts = df["amount"].astype(str).str.replace(",", ".").astype(float)
+    sketch = QuantileSketch(relative_accuracy)
+    sketch.add(amounts.to_numpy())
+    return sketch
+
+
+def sketch_csv_amounts(path, relative_accuracy=RELATIVE_ACCURACY, chunk_bytes=None, max_workers=None):
+    """Sketch every amount of the raw CSV in one parallel, bounded-memory pass."""
+    from local_counts import CHUNK_BYTES, csv_chunks
+
+    header, ranges = csv_chunks(path, chunk_bytes or CHUNK_BYTES)
+    tasks = [(path, header, start, end, relative_accuracy) for start, end in ranges]
+    sketch = QuantileSketch(relative_accuracy)
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        for part in pool.map(sketch_chunk, tasks):
+            sketch.merge(part)
+    return sketch
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Learn quantile bin edges for `amount`.")
+    parser.add_argument("path", nargs="?", default="fraud_credit_card.csv")
+    parser.add_argument("--bins", type=int, default=4)
+    parser.add_argument("--accuracy", type=float, default=RELATIVE_ACCURACY)
+    args = parser.parse_args()
+
+    sketch = sketch_csv_amounts(args.path, args.accuracy)
+    edges = quantile_edges(sketch, args.bins)
+    print(f"{sketch.count:,} amounts, {len(sketch.buckets)} sketch buckets")
+    print(f"Edges: {edges}")
+    print(f"Labels: {interval_labels(edges)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+# index_advisor.py
+"""
+Index advisor for the count queries issued by the classifier. (K2 counts each
+family with a single $group scan, which no equality index serves.)
+
+Every count query is a conjunction of equalities, e.g.
+count_documents({fraud, age, gender}). A compound index serves it as a
+covered query (counted from index keys alone, no document fetched) when the
+query's fields are exactly a prefix of the index keys, in any order.
+
+One index therefore serves a chain of nested queries
+{fraud} ⊂ {fraud, age} ⊂ {fraud, age, gender}, and the minimal set of indexes
+serving a family of queries is a minimum chain cover of the queries ordered
+by inclusion (Dilworth), found here with a bipartite matching.
+
+Usage:
+    python3 index_advisor.py                        # report for all hypotheses
+    python3 index_advisor.py --hypotheses "Naive Bayes" --apply --explain
+"""
+import argparse
+
+from count_backends import BUCKET_FIELD
+
+
+def hypothesis_count_queries(parents, variables):
+    """
+    Field sets of the count queries compute_joint_distribution issues:
+    N(parents) and N(var, parents) for every variable (N alone is not a query).
+    """
+    queries = set()
+    for var in variables:
+        var_parents = parents.get(var, [])
+        if var_parents:
+            queries.add(frozenset(var_parents))
+        queries.add(frozenset(var_parents) | {var})
+    return queries
+
+
+def precomputed_queries(variables, target_variable="fraud"):
+    """Field sets answered by the `precomputed` collection (see index_dataset)."""
+    queries = {frozenset([var]) for var in variables}
+    queries |= {frozenset([var, target_variable]) for var in variables}
+    return queries
+
+
+def index_serves(index_keys, query):
+    """True if an index with these keys counts `query` from its keys alone."""
+    return len(index_keys) >= len(query) and set(index_keys[: len(query)]) == query
+
+
+def minimal_indexes(queries, variables):
+    """
+    Return the fewest index key lists such that every query is a prefix of
+    one of them (minimum chain cover of the queries ordered by inclusion).
+    """
+    order = {var: i for i, var in enumerate(variables)}
+
+    def sorted_fields(fields):
+        return sorted(fields, key=lambda f: (order.get(f, len(order)), f))
+
+    qs = sorted(queries, key=lambda q: (len(q), sorted_fields(q)))
+    supersets = [[j for j in range(len(qs)) if qs[i] < qs[j]] for i in range(len(qs))]
+
+    # Maximum matching i -> j (qs[i] ⊂ qs[j]); every matched edge links two
+    # queries of the same chain
+    matched_from = [None] * len(qs)
+
+    def augment(i, seen):
+        for j in supersets[i]:
+            if j in seen:
+                continue
+            seen.add(j)
+            if matched_from[j] is None or augment(matched_from[j], seen):
+                matched_from[j] = i
+                return True
+        return False
+
+    for i in range(len(qs)):
+        augment(i, set())
+
+    following = {i: j for j, i in enumerate(matched_from) if i is not None}
+    indexes = []
+    for start in range(len(qs)):
+        if matched_from[start] is not None:
+            continue
+        keys = sorted_fields(qs[start])
+        current = start
+        while current in following:
+            nxt = following[current]
+            keys += sorted_fields(qs[nxt] - qs[current])
+            current = nxt
+        indexes.append(keys)
+    return indexes
+
+
+def existing_index_keys(collection):
+    """Key lists of the collection's indexes (without _id)."""
+    return [
+        [field for field, _ in info["key"]]
+        for name, info in collection.index_information().items()
+        if name != "_id_"
+    ]
+
+
+def plan_indexes(queries, existing, variables, suffix=()):
+    """
+    Indexes to create so every query is covered, given the existing key lists.
+    `suffix` (e.g. the bucket field) is appended after the equality fields.
+    """
+    suffix = list(suffix)
+    missing = {
+        q
+        for q in queries
+        if not any(index_serves(keys, q) and keys[len(q) :][: len(suffix)] == suffix for keys in existing)
+    }
+    return [keys + suffix for keys in minimal_indexes(missing, variables)]
+
+
+def explain_count(collection, query):
+    """Plan stages of count_documents(query), e.g. ['IXSCAN'] or ['FETCH', 'COLLSCAN']."""
+    explain = collection.database.command(
+        "explain",
+        {
+            "aggregate": collection.name,
+            "pipeline": [{"$match": query}, {"$group": {"_id": 1, "n": {"$sum": 1}}}],
+            "cursor": {},
+        },
+        verbosity="queryPlanner",
+    )
+    stages = []
+
+    def walk(node):
+        if isinstance(node, dict):
+            if "stage" in node and isinstance(node["stage"], str):
+                stages.append(node["stage"])
+            for key, value in node.items():
+                if key != "rejectedPlans":
+                    walk(value)
+        elif isinstance(node, list):
+            for value in node:
+                walk(value)
+
+    walk(explain)
+    return stages
+
+
+def is_covered(stages):
+    return "COLLSCAN" not in stages and "FETCH" not in stages
+
+
+def advise(classifier, hypotheses):
+    """
+    Report, for the count queries of every hypothesis in `hypotheses`, which
+    ones the current indexes cover, which would scan the collection and the
+    minimal set of indexes to add.
+    """
+    from bayes_classifier import hypothesis_parents
+
+    queries = set()
+    for hypothesis in hypotheses.values():
+        parents = hypothesis_parents(hypothesis, classifier.variables)
+        queries |= hypothesis_count_queries(parents, classifier.variables)
+    if classifier.backend == "precomputed" and not classifier.match:
+        queries -= precomputed_queries(classifier.variables, classifier.target_variable)
+
+    existing = existing_index_keys(classifier.data_collection)
+    suffix = [BUCKET_FIELD] if classifier.match else []
+    report = {"covered": [], "collection_scan": [], "unused_indexes": []}
+    for q in sorted(queries, key=lambda q: (len(q), sorted(q))):
+        served_by = [keys for keys in existing if index_serves(keys, q)]
+        (report["covered"] if served_by else report["collection_scan"]).append(sorted(q))
+    report["unused_indexes"] = [
+        keys
+        for keys in existing
+        if keys != [BUCKET_FIELD] and not any(index_serves(keys, q) for q in queries)
+    ]
+    report["to_create"] = plan_indexes(queries, existing, classifier.variables, suffix)
+    report["minimal_indexes"] = [
+        keys + suffix for keys in minimal_indexes(queries, classifier.variables)
+    ]
+    return report
+
+
+def main():
+    from bayes_classifier import BayesianClassifier, available_hypotheses
+
+    parser = argparse.ArgumentParser(description="Advise indexes for the classifier's count queries.")
+    parser.add_argument("--hypotheses", nargs="+", default=list(available_hypotheses))
+    parser.add_argument("--backend", default="precomputed", choices=["mongo", "precomputed"])
+    parser.add_argument("--apply", action="store_true", help="Create the missing indexes")
+    parser.add_argument("--explain", action="store_true", help="Check every query's plan")
+    args = parser.parse_args()
+
+    classifier = BayesianClassifier(backend=args.backend)
+    hypotheses = {name: available_hypotheses[name] for name in args.hypotheses}
+    report = advise(classifier, hypotheses)
+
+    print(f"Minimal index set ({len(report['minimal_indexes'])}):")
+    for keys in report["minimal_indexes"]:
+        print(f"   {keys}")
+    print(f"Covered by existing indexes: {len(report['covered'])} queries")
+    print(f"Would scan the collection: {len(report['collection_scan'])} queries")
+    for q in report["collection_scan"]:
+        print(f"   {q}")
+    print(f"Existing indexes no query uses: {report['unused_indexes']}")
+    print(f"Indexes to create: {report['to_create']}")
+
+    if args.apply:
+        for keys in report["to_create"]:
+            classifier.data_collection.create_index([(k, 1) for k in keys])
+            print(f"   created {keys}")
+
+    if args.explain:
+        print("Query plans:")
+        for q in report["covered"] + report["collection_scan"]:
+            query = {field: 0 for field in q}
+            stages = explain_count(classifier.data_collection, query)
+            status = "covered" if is_covered(stages) else "NOT covered"
+            print(f"   {q}: {status} ({' > '.join(stages)})")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,30 +1,41 @@
 # index_dataset.py
 
-from pymongo import MongoClient
+from pymongo import UpdateOne
 from collections import defaultdict
 import math
-import os
-from dotenv import load_dotenv
-
-# Load environment variables from .env file
-load_dotenv()
-
-client = MongoClient(os.environ["ATLASMONGODB_CONNECTION_STRING"])
-db = client["fraud_db"]
-original = db["transactions"]
-indexed = db["transactions_indexed"]
-precomputed = db["precomputed"]
-cardinalities_col = db["cardinalities"]
+import sys
+import zlib
+from count_backends import BUCKET_FIELD, NUM_BUCKETS
+from packed_rows import CODE_FIELD, CODE_VARIABLES, joint_shape
+from mongo_connection import get_db
+
+# Collections are looked up on the shared client when used, so importing
+# this module (e.g. for bucket_of) does not connect to MongoDB.
+ORIGINAL_COLLECTION = "transactions"
+INDEXED_COLLECTION = "transactions_indexed"
+PRECOMPUTED_COLLECTION = "precomputed"
+CARDINALITIES_COLLECTION = "cardinalities"
+DISCRETIZATION_COLLECTION = "discretization"
 
 BATCH_SIZE = 10000
 
 
 variables = ["age", "gender", "category", "amount_bin", "fraud"]
+# Kept by `upload_dataset.py --extra`; indexed after the base variables
+EXTRA_VARIABLES = ["merchant", "customer", "step"]
+
+
+def dataset_variables(original):
+    """The base variables plus the extra ones present in `original`."""
+    doc = original.find_one({}, {"_id": 0}) or {}
+    return variables + [var for var in EXTRA_VARIABLES if var in doc]
 
 
 def compute_cardinalities():
     cardinalities = defaultdict(dict)
     reverse_maps = defaultdict(dict)
+    original = get_db()[ORIGINAL_COLLECTION]
+    keys = dataset_variables(original)
     for doc in original.find({}, {"_id": 0}):
         # for k, v in doc.items():
         #     if k == "_id":
@@ -33,7 +44,7 @@ def compute_cardinalities():
         #         idx = len(cardinalities[k])
         #         cardinalities[k][v] = idx
         #         reverse_maps[k][idx] = v
-        for key in variables:
+        for key in keys:
             value = doc[key]
             if value not in cardinalities[key]:
                 idx = len(cardinalities[key])
@@ -42,14 +53,49 @@ def compute_cardinalities():
     return dict(cardinalities), dict(reverse_maps)
 
 
+def bucket_of(object_id):
+    """
+    Deterministic bucket in [0, NUM_BUCKETS) of a document, from a hash of
+    its _id. The classifier selects nested fractions of the data with
+    bucket < fraction * NUM_BUCKETS.
+    """
+    return zlib.crc32(object_id.binary) % NUM_BUCKETS
+
+
+def load_discretization():
+    """
+    {variable: {"source", "edges", "labels"}} of the binned variables, as
+    stored by upload_dataset.py (the fixed amount bins for older uploads).
+    """
+    from discretizer import AMOUNT_BINS, AMOUNT_LABELS
+
+    docs = {
+        doc["variable"]: {key: doc[key] for key in ("source", "edges", "labels")}
+        for doc in get_db()[DISCRETIZATION_COLLECTION].find({})
+    }
+    docs.setdefault(
+        "amount_bin", {"source": "amount", "edges": AMOUNT_BINS, "labels": AMOUNT_LABELS}
+    )
+    return docs
+
+
 def store_cardinalties(cardinalities):
+    cardinalities_col = get_db()[CARDINALITIES_COLLECTION]
     cardinalities_col.drop()
+    # Bin edges are stored with the mapping so raw values can be binned at scoring time
+    discretization = load_discretization()
     for var, cardinality in cardinalities.items():
-        cardinalities_col.insert_one({"variable": var, "mapping": cardinality})
+        cardinalities_col.insert_one(
+            {"variable": var, "mapping": cardinality, **discretization.get(var, {})}
+        )
 
 
 def index_and_store(cardinalities):
+    db = get_db()
+    original = db[ORIGINAL_COLLECTION]
+    indexed = db[INDEXED_COLLECTION]
     total = original.count_documents({})
+    code_shape = joint_shape(CODE_VARIABLES, cardinalities)
     indexed.drop()
     # for i in range(0, total, BATCH_SIZE):
     for i in range(math.ceil(total / BATCH_SIZE)):
@@ -60,11 +106,82 @@ def index_and_store(cardinalities):
         for doc in batch:
             for k in cardinalities:
                 doc[k] = cardinalities[k][doc[k]]
+            doc[BUCKET_FIELD] = bucket_of(doc["_id"])
+            doc[CODE_FIELD] = packed_code(doc, code_shape)
         indexed.insert_many(batch)
         # print(f"{min(i + BATCH_SIZE, total)}/{total} docs indexed", flush=True)
+    indexed.create_index(BUCKET_FIELD)
+    indexed.create_index(CODE_FIELD)
+
+
+def packed_code(doc, shape):
+    """Packed code (see packed_rows) of an indexed document."""
+    code = 0
+    for var, radix in zip(CODE_VARIABLES, shape):
+        code = code * radix + doc[var]
+    return code
+
+
+def assign_buckets(collection=None):
+    """Add the `bucket` field to a collection indexed before buckets existed."""
+    if collection is None:
+        collection = get_db()[INDEXED_COLLECTION]
+    total = collection.estimated_document_count()
+    done = 0
+    requests = []
+    for doc in collection.find({BUCKET_FIELD: {"$exists": False}}, {"_id": 1}):
+        requests.append(
+            UpdateOne({"_id": doc["_id"]}, {"$set": {BUCKET_FIELD: bucket_of(doc["_id"])}})
+        )
+        if len(requests) == BATCH_SIZE:
+            collection.bulk_write(requests, ordered=False)
+            done += len(requests)
+            requests = []
+            print_progress(done, total)
+    if requests:
+        collection.bulk_write(requests, ordered=False)
+        done += len(requests)
+        print_progress(done, total)
+    collection.create_index(BUCKET_FIELD)
+
+
+def assign_codes(collection=None):
+    """
+    Store every transaction's packed code (see packed_rows) in the `code`
+    field and index it, for collections indexed before index_and_store
+    wrote it.
+    """
+    db = get_db()
+    if collection is None:
+        collection = db[INDEXED_COLLECTION]
+    cardinalities = {
+        doc["variable"]: doc["mapping"] for doc in db[CARDINALITIES_COLLECTION].find({})
+    }
+    shape = joint_shape(CODE_VARIABLES, cardinalities)
+    total = collection.estimated_document_count()
+    done = 0
+    requests = []
+    projection = {var: 1 for var in CODE_VARIABLES}
+    for doc in collection.find({CODE_FIELD: {"$exists": False}}, projection):
+        requests.append(
+            UpdateOne({"_id": doc["_id"]}, {"$set": {CODE_FIELD: packed_code(doc, shape)}})
+        )
+        if len(requests) == BATCH_SIZE:
+            collection.bulk_write(requests, ordered=False)
+            done += len(requests)
+            requests = []
+            print_progress(done, total)
+    if requests:
+        collection.bulk_write(requests, ordered=False)
+        done += len(requests)
+        print_progress(done, total)
+    collection.create_index(CODE_FIELD)
 
 
 def precompute_counts_and_store(cardinalities):
+    db = get_db()
+    indexed = db[INDEXED_COLLECTION]
+    precomputed = db[PRECOMPUTED_COLLECTION]
     precomputed.drop()
     # precomputing Naive Bayes counts
     target_variable = "fraud"
@@ -73,6 +190,9 @@ def precompute_counts_and_store(cardinalities):
         count = indexed.count_documents({target_variable: target_val})
         precomputed.insert_one({target_variable: target_val, "count": count})
     for var, cardinality in cardinalities.items():
+        # High-cardinality variables are counted on demand
+        if var in EXTRA_VARIABLES:
+            continue
         for val in cardinality.values():
             precomputed.insert_one({var: val, "count": indexed.count_documents({var: val})})
             for target_val in target_values:
@@ -88,6 +208,16 @@ def print_progress(current, total, bar_length=40):
 
 
 if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "buckets":
+        print("Assigning buckets...")
+        assign_buckets()
+        print("\nDone.")
+        sys.exit(0)
+    if len(sys.argv) > 1 and sys.argv[1] == "codes":
+        print("Assigning packed codes...")
+        assign_codes()
+        print("\nDone.")
+        sys.exit(0)
     print("Computing cardinalities...")
     cardinalities, _ = compute_cardinalities()
     print("Storing cardinalities...")
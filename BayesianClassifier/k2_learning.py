@@ -0,0 +1,335 @@
+# k2_learning.py
+"""
+K2 structure learning (training only).
+
+Kept apart from bayes_classifier so that scoring never imports scipy: these
+functions are imported lazily by BayesianClassifier.k2_score() and
+learn_k2_structure(), and take the classifier as the source of counts,
+cardinalities and alpha.
+"""
+from collections import defaultdict
+from math import comb
+
+import numpy as np
+from scipy.special import gammaln
+
+
+def k2_score(classifier, child, parents):
+    """
+    Compute the K2 score for a child variable given a list of parent variables.
+
+    K2 score formula:
+    log P(D|G) = Σ_i [ log(Γ(α*r_i)) - log(Γ(N_i + α*r_i)) + Σ_j [log(Γ(N_ij + α)) - log(Γ(α))] ]
+
+    where:
+    - r_i is the number of values that variable X_i can take
+    - N_i is the number of instances where the parents of X_i take their i-th configuration
+    - N_ij is the number of instances where X_i takes its j-th value and parents take i-th configuration
+
+    Unobserved parent configurations and child values add exactly 0 to the
+    score, so only the observed ones are visited: the counts come from one
+    sparse family table (classifier.family_counts) instead of one query per
+    cell of the Cartesian product of the parents' values.
+    """
+    r = len(classifier.cardinalities[child])  # Number of values child can take
+    family = classifier.family_counts(list(parents) + [child])
+    return float(family_k2_scores(family, r, [classifier.alpha])[0])
+
+
+def family_k2_scores(family, r, alphas):
+    """
+    K2 scores of one sparse family table {(parent values..., child value): N_ij}
+    for every alpha in `alphas` at once (the counts are read once and
+    broadcast along a leading alpha axis).
+    """
+    alphas = np.asarray(alphas, dtype=np.float64)
+    if not family:
+        return np.zeros(len(alphas))
+
+    # N_ij of every observed (parent configuration, child value)
+    N_ij = np.fromiter(family.values(), dtype=np.float64, count=len(family))
+    # N_i of every observed parent configuration
+    N_i = defaultdict(int)
+    for key, n in family.items():
+        N_i[key[:-1]] += n
+    N_i = np.fromiter(N_i.values(), dtype=np.float64, count=len(N_i))
+
+    a = alphas[:, None]
+    term1 = len(N_i) * gammaln(alphas * r) - np.sum(gammaln(N_i + a * r), axis=1)
+    term2 = np.sum(gammaln(N_ij + a), axis=1) - len(N_ij) * gammaln(alphas)
+    return term1 + term2
+
+
+def _silent(*args, **kwargs):
+    pass
+
+
+def learn_k2_structure(
+    classifier,
+    u=3,
+    variable_order=None,
+    verbose=True,
+):
+    """
+    Simplest possible K2 algorithm implementation.
+
+    Args:
+        data: list of dictionaries, each representing one data point
+        variable_order: list of variable names in topological order
+        max_parents: maximum number of parents per variable
+        verbose: print every step (off when many orders are searched, see order_search)
+
+    Returns:
+        Dictionary {child: [list of parents]}
+    """
+    log = print if verbose else _silent
+
+    if variable_order is None:
+        # Use arbitrary order based on first data point
+        variable_order = classifier.variables
+
+    log(f"Variable order: {variable_order}")
+
+    result = {}
+
+    for i, child in enumerate(variable_order):
+        log(f"\nLearning parents for {child}...")
+
+        # Possible parents are variables that come before in the ordering
+        possible_parents = variable_order[:i]
+
+        if not possible_parents:
+            result[child] = []
+            log(f"  No possible parents (first variable)")
+            continue
+
+        # Start with no parents
+        current_parents = []
+        current_score = classifier.k2_score(child, current_parents)
+        log(f"  Score with no parents: {current_score:.4f}")
+
+        # Greedily add parents while score improves
+        for num_parents in range(u):
+            if len(current_parents) >= len(possible_parents):
+                break
+
+            best_candidate = None
+            best_score = current_score
+
+            # Try adding each possible parent
+            for candidate in possible_parents:
+                if candidate in current_parents:
+                    continue
+
+                candidate_parents = current_parents + [candidate]
+                try:
+                    score = classifier.k2_score(child, candidate_parents)
+                    log(f"  Score with parents {candidate_parents}: {score:.4f}")
+
+                    if score > best_score:
+                        log(f"    Δscore = {score - current_score:.4f}")
+                        best_score = score
+                        best_candidate = candidate
+                except Exception as e:
+                    log(f"  Error with parents {candidate_parents}: {e}")
+                    continue
+
+            # Add best candidate if it improves score
+            if best_candidate is not None:
+                current_parents.append(best_candidate)
+                current_score = best_score
+                log(
+                    f"  Added parent {best_candidate}, new score: {current_score:.4f}"
+                )
+            else:
+                log(f"  No improvement found, stopping")
+                break
+
+        result[child] = current_parents
+        log(f"  Final parents for {child}: {current_parents}")
+
+    log(f"Best hypothesis for u={u}: {result}")
+    return result
+
+
+def family_upper_bound(family, r, alpha):
+    """
+    Upper bound of the K2 score of the child with any superset of the
+    family's parents.
+
+    Adding parents only splits each parent configuration j into finer ones.
+    The K2 term of a configuration is the log-probability of its child
+    values under a Dirichlet-multinomial, and it is largest when every
+    configuration holds a single child value and is not split further, so
+    no superset scores above
+        Σ_jk [ log Γ(α r) - log Γ(N_jk + α r) + log Γ(N_jk + α) - log Γ(α) ]
+    over the observed cells (N_jk > 0) of the current family. It only binds
+    once the configurations are small (sparse families).
+    """
+    return float(np.sum(_pure_terms(family, r, alpha)))
+
+
+def _pure_terms(family, r, alpha):
+    N_jk = np.fromiter(family.values(), dtype=np.float64, count=len(family))
+    return gammaln(alpha * r) - gammaln(N_jk + alpha * r) + gammaln(N_jk + alpha) - gammaln(alpha)
+
+
+def superset_upper_bound(family, n_parents, r, alpha):
+    """
+    Upper bound of the K2 score of the child with any parent set T such that
+    S ⊆ T ⊆ U, from the family table of U whose keys start with the
+    `n_parents` values of S.
+
+    Within each configuration j of S, the K2 terms of T are at most:
+    - the maximum-likelihood log-likelihood Σ N_ujk log(N_ujk / N_uj) over
+      the configurations u of U inside j (a marginal likelihood averages the
+      likelihood over the prior, so it cannot exceed its maximum, and finer
+      configurations fit at least as well);
+    - the pure-configuration bound of family_upper_bound() for j.
+    The bound is the sum over j of the smaller of the two; the first binds
+    when U leaves out strong parents.
+    """
+    if not family:
+        return 0.0
+    N_u = defaultdict(int)
+    for key, n in family.items():
+        N_u[key[:-1]] += n
+    # Per configuration j of S: log-likelihood under U, and N_jk
+    loglik = defaultdict(float)
+    N_jk = defaultdict(int)
+    for key, n in family.items():
+        loglik[key[:n_parents]] += n * np.log(n / N_u[key[:-1]])
+        N_jk[key[:n_parents] + key[-1:]] += n
+    pure = defaultdict(float)
+    for key, term in zip(N_jk, _pure_terms(N_jk, r, alpha)):
+        pure[key[:-1]] += term
+    return float(sum(min(loglik[j], pure[j]) for j in pure))
+
+
+def optimal_parents(classifier, child, candidates, max_parents=None):
+    """
+    Exact best parent set of `child` among the subsets of `candidates` (at
+    most `max_parents` of them), by branch and bound.
+
+    Subsets are enumerated depth-first, each one extended only with the
+    candidates after its last one, so the subtree entered by extending a set
+    S with candidates[i] holds sets between S and S ∪ candidates[i:] only;
+    family_upper_bound() of S's table, then (if that is not enough and the
+    set has at most max_parents parents) superset_upper_bound() of the table
+    of S ∪ candidates[i:] bound their K2 scores, so no table outside the
+    search space is ever counted.
+    Once the bound does not beat the best score found so far, the subtree
+    and every later sibling (whose candidate sets are smaller still) are
+    pruned without being counted. Candidates are tried in decreasing order of
+    their score as a single parent, so good sets are found early.
+
+    Returns (parents, score, report) where report counts the sets scored,
+    the sets pruned, the family tables counted (for scores and bounds) and
+    the sets a brute-force search would score (one table each).
+    """
+    alpha = classifier.alpha
+    r = len(classifier.cardinalities[child])
+    if max_parents is None:
+        max_parents = len(candidates)
+    max_parents = min(max_parents, len(candidates))
+    report = {
+        "evaluated": 0,
+        "pruned": 0,
+        "tables": 0,
+        "brute_force": sum(comb(len(candidates), k) for k in range(max_parents + 1)),
+    }
+    tables = {}
+
+    def family_counts(parents):
+        # The bound of a set's first subtree and of its first child's first
+        # subtree read the same table (S + candidates[i:] in both)
+        key = tuple(parents)
+        if key not in tables:
+            tables[key] = classifier.family_counts(list(parents) + [child])
+            report["tables"] += 1
+        return tables[key]
+
+    def evaluate(parents):
+        report["evaluated"] += 1
+        return float(family_k2_scores(family_counts(parents), r, [alpha])[0])
+
+    empty_score = evaluate([])
+    singles = {c: evaluate([c]) for c in candidates} if max_parents else {}
+    candidates = sorted(singles, key=singles.get, reverse=True)
+    best = {"parents": [], "score": empty_score}
+
+    def subtree_sizes(start, size):
+        # Sets reachable by extending a set of `size` with candidates[start:],
+        # except the single parents (all scored above)
+        n = len(candidates) - start
+        return sum(comb(n, k) for k in range(max(1, 2 - size), max_parents - size + 1))
+
+    def visit(parents, start, score):
+        if score > best["score"]:
+            best["parents"], best["score"] = parents, score
+        if len(parents) == max_parents:
+            return
+        # Needs no new table. The table of U = S ∪ candidates[i:] is read only
+        # if this does not prune and U is itself in the search space (so
+        # brute force would read it too)
+        pure_bound = family_upper_bound(family_counts(parents), r, alpha)
+        for i in range(start, len(candidates)):
+            remaining = candidates[i:]
+            if pure_bound <= best["score"] or (
+                len(parents) + len(remaining) <= max_parents
+                and superset_upper_bound(
+                    family_counts(parents + remaining), len(parents), r, alpha
+                ) <= best["score"]
+            ):
+                report["pruned"] += subtree_sizes(i, len(parents))
+                return
+            extended = parents + [candidates[i]]
+            if len(extended) == 1:
+                visit(extended, i + 1, singles[candidates[i]])
+            else:
+                visit(extended, i + 1, evaluate(extended))
+
+    visit([], 0, empty_score)
+    return best["parents"], best["score"], report
+
+
+def learn_optimal_structure(classifier, variable_order=None, max_parents=None):
+    """
+    Optimal K2 structure for a fixed variable order: every variable gets the
+    best-scoring parent set among its predecessors (optimal_parents).
+
+    Returns ({child: [parents]}, {child: report}).
+    """
+    if variable_order is None:
+        variable_order = classifier.variables
+
+    print(f"Variable order: {variable_order}")
+
+    result = {}
+    reports = {}
+    for i, child in enumerate(variable_order):
+        parents, score, report = optimal_parents(
+            classifier, child, variable_order[:i], max_parents
+        )
+        result[child] = parents
+        reports[child] = {**report, "score": score}
+        print(
+            f"  {child} ← {parents if parents else '(no parents)'}: score {score:.4f}, "
+            f"{report['evaluated']}/{report['brute_force']} parent sets scored, "
+            f"{report['pruned']} pruned, {report['tables']} tables counted"
+        )
+
+    print(f"Optimal structure: {result}")
+    return result, reports
+
+
+def k2_parents_to_hypothesis(parents_dict):
+    """
+    Convert {child: [parents]} → {parent: [children]} format
+    to match set_hypothesis expectations.
+    """
+    hypothesis = defaultdict(list)
+    for child, parent_list in parents_dict.items():
+        for parent in parent_list:
+            hypothesis[parent].append(child)
+    return dict(hypothesis)
@@ -1,12 +1,16 @@
+import argparse
 import json
+import sys
 import time
 from bayes_classifier import BayesianClassifier, available_hypotheses
 
 
-def learn_and_save_structures(alpha=1.0):
+def learn_and_save_structures(alpha=1.0, search_order=False):
     """
     Learn Bayesian network structures using K2 algorithm with different u values
     and save them to available_hypotheses and a JSON file.
+    With search_order=True the variable order of each u is the best one found
+    by order_search instead of the fixed one.
     """
     # Initialize classifier
     print(f"Initializing Bayesian Classifier (alpha={alpha})...")
@@ -33,6 +37,13 @@ def learn_and_save_structures(alpha=1.0):
 
         #variable_order=['fraud', 'amount_bin', 'category', 'gender', 'age']
         variable_order=['age', 'gender', 'amount_bin', 'category', 'fraud']
+        if search_order:
+            from order_search import search_orders
+
+            search = search_orders(classifier, u=u)
+            variable_order = search["order"]
+            print(f"Best of {search['orders_scored']} orders ({search['mode']}): "
+                  f"{variable_order}, score {search['score']:.4f}")
         try:
             # Learn the structure
             structure = classifier.learn_k2_structure(u=u, variable_order=variable_order)
@@ -48,6 +59,7 @@ def learn_and_save_structures(alpha=1.0):
                 "structure": structure,
                 "hypothesis": hypothesis,
                 "u": u,
+                "variable_order": variable_order,
                 "learning_time": time.time() - start_time,
             }
 
@@ -102,6 +114,7 @@ def learn_and_save_structures(alpha=1.0):
                 name: {
                     "structure": details["structure"],
                     "u": details["u"],
+                    "variable_order": details["variable_order"],
                     "learning_time": details["learning_time"],
                 }
                 for name, details in learned_structures.items()
@@ -130,6 +143,49 @@ def learn_and_save_structures(alpha=1.0):
     return learned_structures
 
 
+def learn_and_save_optimal_structure(alpha=1.0, max_parents=None):
+    """
+    Learn the optimal K2 structure for the same variable order with the
+    branch-and-bound search (no greedy steps, no u sweep) and save it to
+    optimal_hypothesis.json together with the pruning report.
+    """
+    print(f"Initializing Bayesian Classifier (alpha={alpha})...")
+    # All the parent sets are counted from the same in-memory tensor
+    classifier = BayesianClassifier(alpha=alpha, backend="memory")
+
+    variable_order = ['age', 'gender', 'amount_bin', 'category', 'fraud']
+    start_time = time.time()
+    structure, report = classifier.learn_optimal_structure(
+        variable_order=variable_order, max_parents=max_parents
+    )
+    learning_time = time.time() - start_time
+    hypothesis = classifier.k2_parents_to_hypothesis(structure)
+    evaluated = sum(r["evaluated"] for r in report.values())
+    brute_force = sum(r["brute_force"] for r in report.values())
+    print(f"Learning completed in {learning_time:.2f} seconds")
+    print(f"Parent sets scored: {evaluated} of {brute_force} "
+          f"({sum(r['pruned'] for r in report.values())} pruned, "
+          f"{sum(r['tables'] for r in report.values())} family tables counted)")
+    print(f"Converted hypothesis: {hypothesis}")
+
+    available_hypotheses["K2 optimal"] = hypothesis
+    with open("optimal_hypothesis.json", "w") as f:
+        json.dump(
+            {
+                "alpha": alpha,
+                "max_parents": max_parents,
+                "structure": structure,
+                "hypothesis": hypothesis,
+                "report": report,
+                "learning_time": learning_time,
+            },
+            f,
+            indent=2,
+        )
+    print("Saved the optimal structure to 'optimal_hypothesis.json'")
+    return structure
+
+
 # def validate_learned_structures():
 #     """
 #     Validate that learned structures are reasonable and don't contain cycles.
@@ -172,11 +228,25 @@ def learn_and_save_structures(alpha=1.0):
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Learn K2 structures for u=1..5.")
+    parser.add_argument("--alpha", type=float, default=0.5,
+                        help="Smoothing parameter (see alpha_sweep.py to choose it)")
+    parser.add_argument("--exact", action="store_true",
+                        help="Branch-and-bound optimal parent sets instead of the greedy u sweep")
+    parser.add_argument("--max-parents", type=int, default=None)
+    parser.add_argument("--search-order", action="store_true",
+                        help="Search the best variable order for each u (see order_search.py)")
+    args = parser.parse_args()
+
     print("K2 Structure Learning Script")
     print("=" * 40)
 
+    if args.exact:
+        learn_and_save_optimal_structure(alpha=args.alpha, max_parents=args.max_parents)
+        sys.exit(0)
+
     # Learn structures
-    learned_structures = learn_and_save_structures(alpha=0.5)
+    learned_structures = learn_and_save_structures(alpha=args.alpha, search_order=args.search_order)
 
     # Validate structures
     # validate_learned_structures()
@@ -0,0 +1,252 @@
+# local_counts.py
+"""
+Build the joint count tensor straight from the raw dataset, without MongoDB.
+
+The raw fraud_credit_card.csv (or a Parquet copy of it) is split into chunks:
+byte ranges of the CSV, row groups of the Parquet file. Worker processes
+each read one chunk, clean it as upload_dataset does, encode it with the
+stored cardinalities into packed codes (see packed_rows) and bincount them;
+the per-chunk count tensors are summed. Every core is used and memory stays
+bounded by the chunk size times the number of workers.
+
+The result is the same joint count tensor the classifier builds with
+$group, so it can be compiled into a model (and scored with
+scoring_runtime) on a machine with no database.
+
+Usage:
+    python3 local_counts.py cardinalities cardinalities.json   # once, from MongoDB
+    python3 local_counts.py build fraud_credit_card.csv --cardinalities cardinalities.json --out counts.npz
+    python3 local_counts.py compile counts.npz model.npz --hypothesis "Fraud as Mediator"
+    python3 local_counts.py compile transactions.npy model.npz  # packed_rows.py export
+"""
+import argparse
+import io
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from packed_rows import joint_shape, load_count_tensor, pack
+from discretizer import AMOUNT_BINS, AMOUNT_LABELS
+from upload_dataset import EXTRA_COLUMNS, clean_transactions
+
+CHUNK_BYTES = 32 * 1024 * 1024
+
+
+def load_cardinalities_file(path):
+    """
+    Return (variables, cardinalities) from a JSON file: either {var: mapping}
+    or a packed_rows header ({"variables": ..., "cardinalities": ...}).
+    """
+    with open(path) as f:
+        data = json.load(f)
+    cardinalities = data.get("cardinalities", data)
+    variables = data.get("variables", list(cardinalities))
+    # Dense count tensors leave the high-cardinality columns out
+    return [var for var in variables if var not in EXTRA_COLUMNS], cardinalities
+
+
+def load_amount_bins(path):
+    """(edges, labels) of amount_bin saved by dump_cardinalities (the fixed bins otherwise)."""
+    with open(path) as f:
+        data = json.load(f)
+    amount_bin = data.get("discretization", {}).get("amount_bin")
+    if amount_bin is None:
+        return AMOUNT_BINS, AMOUNT_LABELS
+    return amount_bin["edges"], amount_bin["labels"]
+
+
+def dump_cardinalities(path):
+    """Save the `cardinalities` collection (and the bin edges) to a JSON file."""
+    from mongo_connection import get_db
+
+    docs = list(get_db()["cardinalities"].find({}))
+    cardinalities = {doc["variable"]: doc["mapping"] for doc in docs}
+    discretization = {
+        doc["variable"]: {key: doc[key] for key in ("source", "edges", "labels")}
+        for doc in docs
+        if "edges" in doc
+    }
+    with open(path, "w") as f:
+        json.dump({"cardinalities": cardinalities, "discretization": discretization}, f, indent=2)
+    return cardinalities
+
+
+def csv_chunks(path, chunk_bytes=CHUNK_BYTES):
+    """Return the header line and the (start, end) byte ranges of the data rows."""
+    with open(path, "rb") as f:
+        header = f.readline()
+    size = os.path.getsize(path)
+    starts = range(len(header), size, chunk_bytes)
+    return header, [(start, min(start + chunk_bytes, size)) for start in starts]
+
+
+def read_csv_range(path, header, start, end):
+    """
+    Read the rows starting in [start, end): a row that crosses `end` belongs
+    to this chunk, the partial row at `start` to the previous one.
+    """
+    with open(path, "rb") as f:
+        # Back up one byte so a chunk starting exactly at a row keeps it
+        f.seek(start - 1)
+        f.readline()
+        position = f.tell()
+        data = bytearray(header)
+        while position < end:
+            line = f.readline()
+            if not line:
+                break
+            data += line
+            position += len(line)
+    return pd.read_csv(io.BytesIO(bytes(data)), sep=",", quotechar='"')
+
+
+def read_parquet_group(path, group):
+    import pyarrow.parquet as pq
+
+    return pq.ParquetFile(path).read_row_group(group).to_pandas()
+
+
+def encode(df, variables, cardinalities):
+    """Cleaned DataFrame -> packed codes (raises on values missing from the cardinalities)."""
+    columns = []
+    for var in variables:
+        values = df[var].astype(object)
+        indexed = values.map(cardinalities[var])
+        unknown = values[indexed.isna()]
+        if len(unknown):
+            raise ValueError(
+                f"Values of '{var}' missing from the cardinalities: {sorted(map(str, set(unknown)))}"
+            )
+        columns.append(indexed.to_numpy(dtype=np.int64))
+    return pack(np.stack(columns, axis=1), joint_shape(variables, cardinalities))
+
+
+def count_chunk(task):
+    """Map step, run in a worker: read, clean, encode and count one chunk."""
+    kind, path, chunk, variables, cardinalities, (amount_bins, amount_labels) = task
+    if kind == "csv":
+        header, start, end = chunk
+        df = read_csv_range(path, header, start, end)
+    else:
+        df = read_parquet_group(path, chunk)
+    df = clean_transactions(df, amount_bins=amount_bins, amount_labels=amount_labels)
+    codes = encode(df, variables, cardinalities)
+    size = int(np.prod(joint_shape(variables, cardinalities)))
+    return np.bincount(codes, minlength=size)
+
+
+def build_counts(
+    path,
+    variables,
+    cardinalities,
+    chunk_bytes=CHUNK_BYTES,
+    max_workers=None,
+    amount_bins=(AMOUNT_BINS, AMOUNT_LABELS),
+):
+    """
+    Joint count tensor of the raw CSV/Parquet file at `path`, binning amount
+    with `amount_bins` = (edges, labels).
+    """
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+
+        kind = "parquet"
+        chunks = range(pq.ParquetFile(path).num_row_groups)
+    else:
+        kind = "csv"
+        header, ranges = csv_chunks(path, chunk_bytes)
+        chunks = [(header, start, end) for start, end in ranges]
+    tasks = [(kind, path, chunk, variables, cardinalities, amount_bins) for chunk in chunks]
+
+    shape = joint_shape(variables, cardinalities)
+    joint = np.zeros(int(np.prod(shape)), dtype=np.int64)
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        # Reduce step: results arrive in order and are summed as they come
+        for counts in pool.map(count_chunk, tasks):
+            joint += counts
+    return joint.reshape(shape)
+
+
+def save_counts(path, joint, variables, cardinalities):
+    header = json.dumps({"variables": list(variables), "cardinalities": cardinalities})
+    np.savez(path, joint=joint, header=np.frombuffer(header.encode(), dtype=np.uint8))
+
+
+def load_counts(path):
+    """
+    Return (joint_counts, variables, cardinalities) saved by save_counts, or
+    counted from a packed .npy column (packed_rows.py export).
+    """
+    if path.endswith(".npy"):
+        return load_count_tensor(path)
+    with np.load(path, allow_pickle=False) as data:
+        header = json.loads(data["header"].tobytes())
+        joint = data["joint"]
+    return joint, header["variables"], header["cardinalities"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build count tensors without MongoDB.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    dump = commands.add_parser("cardinalities", help="Save the cardinalities from MongoDB")
+    dump.add_argument("out")
+    build = commands.add_parser("build", help="Count a raw .csv/.parquet file")
+    build.add_argument("path")
+    build.add_argument("--cardinalities", required=True)
+    build.add_argument("--out", default="counts.npz")
+    build.add_argument("--chunk-mb", type=float, default=CHUNK_BYTES / 2**20)
+    build.add_argument("--workers", type=int, default=None)
+    compile_ = commands.add_parser("compile", help="Compile a hypothesis from saved counts")
+    compile_.add_argument("counts", help="counts.npz, or a packed .npy column")
+    compile_.add_argument("out")
+    compile_.add_argument("--hypothesis", default="Naive Bayes")
+    compile_.add_argument("--alpha", type=float, default=1.0)
+    args = parser.parse_args()
+
+    if args.command == "cardinalities":
+        cardinalities = dump_cardinalities(args.out)
+        print(f"Saved the cardinalities of {list(cardinalities)} to {args.out}.")
+    elif args.command == "build":
+        variables, cardinalities = load_cardinalities_file(args.cardinalities)
+        start = time.perf_counter()
+        joint = build_counts(
+            args.path,
+            variables,
+            cardinalities,
+            chunk_bytes=int(args.chunk_mb * 2**20),
+            max_workers=args.workers,
+            amount_bins=load_amount_bins(args.cardinalities),
+        )
+        elapsed = time.perf_counter() - start
+        save_counts(args.out, joint, variables, cardinalities)
+        rows = int(joint.sum())
+        print(f"Counted {rows:,} rows in {elapsed:.2f}s ({rows / elapsed:,.0f} rows/s), saved to {args.out}.")
+    else:
+        from bayes_classifier import available_hypotheses, hypothesis_parents
+        from compiled_model import CompiledModel
+
+        joint, variables, cardinalities = load_counts(args.counts)
+        parents = hypothesis_parents(available_hypotheses[args.hypothesis], variables)
+        model = CompiledModel.compile(
+            joint,
+            variables,
+            cardinalities,
+            parents,
+            args.alpha,
+            metadata={
+                "hypothesis": args.hypothesis,
+                "parents": {child: list(p) for child, p in parents.items()},
+                "alpha": args.alpha,
+                "N": int(joint.sum()),
+            },
+        )
+        model.save(args.out)
+        print(f"Saved '{args.hypothesis}' compiled from {args.counts} to {args.out}.")
+
+
+if __name__ == "__main__":
+    main()
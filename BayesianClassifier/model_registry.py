@@ -0,0 +1,201 @@
+# model_registry.py
+"""
+Registry of compiled models with atomic hot-swap between hypotheses.
+
+Every hypothesis (from available_hypotheses or learned_hypotheses.json) is
+compiled in the background into an immutable CompiledModel (served from its
+table, so no count query and no index is needed). The active model is
+published with a single reference assignment, so:
+- a request reads the active model once and finishes on it even if a
+  switch happens meanwhile,
+- switching to an already built hypothesis costs no latency (no
+  recompilation).
+The last activate() wins: a hypothesis still building when another one is
+activated is not swapped in when it finishes.
+
+Usage:
+    registry = ModelRegistry(BayesianClassifier(backend="memory"))
+    registry.build_all()
+    registry.activate("Naive Bayes", wait=True)
+    registry.classify(evidence)
+    registry.activate("Fraud as Mediator")  # swaps as soon as it is built
+"""
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bayes_classifier import available_hypotheses, hypothesis_parents
+from compiled_model import CompiledModel
+from sparse_model import SparseModel
+
+
+class ModelRegistry:
+    def __init__(self, classifier, hypotheses=None, max_workers=2):
+        """
+        classifier provides the counts, cardinalities and alpha every model
+        is compiled from.
+        """
+        self.classifier = classifier
+        self.hypotheses = dict(available_hypotheses if hypotheses is None else hypotheses)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._lock = threading.Lock()
+        self._joint_counts = None
+        self._models = {}
+        self._futures = {}
+        # (name, CompiledModel), replaced as a whole by activate()
+        self._active = None
+        # Name of the last activate() call; only that model may be swapped in
+        self._requested = None
+
+    @classmethod
+    def from_json(cls, classifier, filename="learned_hypotheses.json", **kwargs):
+        with open(filename) as f:
+            data = json.load(f)
+        return cls(classifier, data.get("hypotheses", data), **kwargs)
+
+    def joint_counts(self):
+        with self._lock:
+            if self._joint_counts is None:
+                self._joint_counts = self.classifier.joint_counts()
+            return self._joint_counts
+
+    def _build(self, name):
+        classifier = self.classifier
+        parents = hypothesis_parents(self.hypotheses[name], classifier.variables)
+        metadata = {
+            "hypothesis": name,
+            "parents": {child: list(p) for child, p in parents.items()},
+            "alpha": classifier.alpha,
+            "N": classifier.N,
+        }
+        start = time.perf_counter()
+        if classifier.sparse_counts():
+            # High-cardinality variables: sparse CPTs from family counts
+            model = SparseModel.compile(
+                classifier.family_counts,
+                classifier.variables,
+                classifier.cardinalities,
+                parents,
+                classifier.alpha,
+                classifier.N,
+                target_variable=classifier.target_variable,
+                metadata=metadata,
+            )
+        else:
+            model = CompiledModel.compile(
+                self.joint_counts(),
+                classifier.variables,
+                classifier.cardinalities,
+                parents,
+                classifier.alpha,
+                N=classifier.N,
+                target_variable=classifier.target_variable,
+                metadata=metadata,
+            )
+        model.metadata["compile_time_s"] = time.perf_counter() - start
+        return model
+
+    def _store_built(self, name, future):
+        """Keep a finished build, unless rebuild() or add_hypothesis() superseded it."""
+        if future.exception() is not None:
+            return
+        with self._lock:
+            if self._futures.get(name) is future:
+                self._models[name] = future.result()
+
+    def build(self, name):
+        """Compile `name` in the background. Returns a Future of its model."""
+        if name not in self.hypotheses:
+            raise KeyError(f"Unknown hypothesis: {name}")
+        with self._lock:
+            future = self._futures.get(name)
+            if future is None:
+                future = self._executor.submit(self._build, name)
+                self._futures[name] = future
+                future.add_done_callback(lambda f: self._store_built(name, f))
+            return future
+
+    def build_all(self):
+        return {name: self.build(name) for name in self.hypotheses}
+
+    def add_hypothesis(self, name, hypothesis):
+        """Register a new hypothesis (e.g. freshly learned) and start building it."""
+        with self._lock:
+            self.hypotheses[name] = hypothesis
+            self._models.pop(name, None)
+            self._futures.pop(name, None)
+        return self.build(name)
+
+    def rebuild(self):
+        """
+        Reload the counts and recompile every hypothesis in the background.
+        The active model keeps serving until its rebuilt version is ready;
+        the other models are dropped, and builds started before the rebuild
+        are discarded when they finish.
+        """
+        self.classifier.refresh_counts()
+        with self._lock:
+            self._joint_counts = None
+            self._models = {}
+            self._futures = {}
+        futures = self.build_all()
+        name = self._requested
+        if name is not None:
+            futures[name].add_done_callback(lambda f: self._activate_built(name, f))
+        return futures
+
+    def is_ready(self, name):
+        return name in self._models
+
+    def activate(self, name, wait=False):
+        """
+        Make `name` the active model. If it is already built the switch is a
+        single reference swap. Otherwise it is built in the background and
+        swapped in when ready (or now, if wait=True).
+        """
+        with self._lock:
+            self._requested = name
+            model = self._models.get(name)
+            if model is not None:
+                self._active = (name, model)
+                return
+        future = self.build(name)
+        if wait:
+            future.result()
+        # Runs at once if the build is already done
+        future.add_done_callback(lambda f: self._activate_built(name, f))
+
+    def _activate_built(self, name, future):
+        """
+        Swap in a finished build, unless another hypothesis was activated
+        since or the build was superseded by rebuild().
+        """
+        if future.exception() is not None:
+            return
+        with self._lock:
+            if self._requested == name and self._futures.get(name) is future:
+                self._active = (name, future.result())
+
+    @property
+    def active_name(self):
+        active = self._active
+        return None if active is None else active[0]
+
+    def active_model(self):
+        active = self._active
+        if active is None:
+            raise RuntimeError("No model is active yet; call activate() first")
+        return active[1]
+
+    def classify(self, evidence, apply_index=True):
+        """Return (is_fraud, probability, time) using the active model."""
+        time_start = time.perf_counter()
+        # One read of the active model: a concurrent switch does not affect
+        # this request
+        model = self.active_model()
+        is_fraud, prob = model.classify(evidence, apply_index)
+        return (is_fraud, prob, time.perf_counter() - time_start)
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
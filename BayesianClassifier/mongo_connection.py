@@ -0,0 +1,112 @@
+# mongo_connection.py
+"""
+Shared MongoDB connections for every module.
+
+One pooled MongoClient is kept per (URI, settings) and process, so building a
+BayesianClassifier (or running several scripts' functions in one process) no
+longer pays a TCP/TLS handshake and a server selection each time.
+
+Settings come from the environment (.env) and can be overridden per call:
+- ATLASMONGODB_CONNECTION_STRING      connection string (required)
+- MONGO_MAX_POOL_SIZE                 default 50
+- MONGO_MIN_POOL_SIZE                 default 0
+- MONGO_COMPRESSORS                   default: the available ones of zstd, snappy, zlib
+- MONGO_CONNECT_TIMEOUT_MS            default 5000
+- MONGO_SERVER_SELECTION_TIMEOUT_MS   default 10000
+- MONGO_SOCKET_TIMEOUT_MS             default 120000 (unindexed counts take seconds)
+- MONGO_COUNT_READ_PREFERENCE         default secondaryPreferred
+
+Counting queries go through counting_collection(), which reads from
+secondaries when the cluster has them, spreading the load across replicas.
+"""
+import os
+import threading
+
+from dotenv import load_dotenv
+from pymongo import MongoClient, ReadPreference
+
+DB_NAME = "fraud_db"
+
+READ_PREFERENCES = {
+    "primary": ReadPreference.PRIMARY,
+    "primaryPreferred": ReadPreference.PRIMARY_PREFERRED,
+    "secondary": ReadPreference.SECONDARY,
+    "secondaryPreferred": ReadPreference.SECONDARY_PREFERRED,
+    "nearest": ReadPreference.NEAREST,
+}
+
+_clients = {}
+_lock = threading.Lock()
+
+
+def _available_compressors():
+    compressors = []
+    try:
+        import zstandard  # noqa: F401
+
+        compressors.append("zstd")
+    except ImportError:
+        pass
+    try:
+        import snappy  # noqa: F401
+
+        compressors.append("snappy")
+    except ImportError:
+        pass
+    compressors.append("zlib")
+    return ",".join(compressors)
+
+
+def connection_settings(**overrides):
+    """MongoClient keyword arguments from the environment, with overrides."""
+    load_dotenv()
+    env = os.environ
+    settings = {
+        "maxPoolSize": int(env.get("MONGO_MAX_POOL_SIZE", 50)),
+        "minPoolSize": int(env.get("MONGO_MIN_POOL_SIZE", 0)),
+        "compressors": env.get("MONGO_COMPRESSORS", _available_compressors()),
+        "connectTimeoutMS": int(env.get("MONGO_CONNECT_TIMEOUT_MS", 5000)),
+        "serverSelectionTimeoutMS": int(env.get("MONGO_SERVER_SELECTION_TIMEOUT_MS", 10000)),
+        "socketTimeoutMS": int(env.get("MONGO_SOCKET_TIMEOUT_MS", 120000)),
+        "readConcernLevel": "local",
+        "retryReads": True,
+    }
+    settings.update(overrides)
+    return settings
+
+
+def get_client(uri=None, **overrides):
+    """
+    Return the shared MongoClient for `uri` (default: the .env connection
+    string) and settings. MongoClient is not fork-safe, so each process gets
+    its own.
+    """
+    settings = connection_settings(**overrides)
+    if uri is None:
+        uri = os.environ["ATLASMONGODB_CONNECTION_STRING"]
+    key = (os.getpid(), uri, tuple(sorted(settings.items())))
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                client = MongoClient(uri, **settings)
+                _clients[key] = client
+    return client
+
+
+def get_db(name=DB_NAME, uri=None, **overrides):
+    return get_client(uri, **overrides)[name]
+
+
+def counting_collection(db, name):
+    """Collection handle for read-only counting queries (secondary reads allowed)."""
+    mode = os.environ.get("MONGO_COUNT_READ_PREFERENCE", "secondaryPreferred")
+    return db.get_collection(name, read_preference=READ_PREFERENCES[mode])
+
+
+def close_all():
+    with _lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
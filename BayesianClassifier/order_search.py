@@ -0,0 +1,246 @@
+# order_search.py
+"""
+Search the variable order of K2 in parallel.
+
+K2 only picks parents among the variables earlier in the order, so the
+learned network depends heavily on it. An order is scored by running K2 on
+it (k2_learning.learn_k2_structure) and summing the K2 scores of the
+resulting families. With few variables every order is scored (5! = 120);
+beyond EXHAUSTIVE_LIMIT orders, independent simulated-annealing runs from
+random orders (random restarts) search the order space instead.
+
+Orders are scored in a process pool. The joint count tensor is read from
+the database once and sent to every worker, which answers family counts
+from it. K2 family scores are memoized per worker and shared, best effort,
+through a dict of a multiprocessing.Manager. The shared dict is not touched
+per family: a worker reads it at the start of each task and, every
+SYNC_ORDERS orders, writes back the scores it computed and reads the other
+workers' ones (two round trips to the manager per sync). Two workers can
+still score the same family between syncs; the report gives both the
+distinct families and the scores computed overall.
+
+Usage:
+    python3 order_search.py --u 3 --workers 8
+    python3 learn_k2_structures.py --search-order
+"""
+import argparse
+import itertools
+import math
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import Manager
+
+from count_backends import TensorCountBackend
+from k2_learning import k2_score, learn_k2_structure
+
+EXHAUSTIVE_LIMIT = math.factorial(7)
+ANNEALING_STEPS = 300
+# Initial temperature, as a fraction of the |score| of the starting order
+INITIAL_TEMPERATURE = 0.01
+FINAL_TEMPERATURE = 1e-4
+# Orders a worker scores between two syncs with the shared memo
+SYNC_ORDERS = 20
+
+
+class FamilyScores:
+    """
+    Count source standing in for the classifier in the K2 functions of a
+    worker: family counts from the joint tensor, K2 scores memoized
+    locally and merged with the shared memo by sync().
+    """
+
+    def __init__(self, joint_counts, variables, cardinalities, alpha, shared=None):
+        self.backend = TensorCountBackend(joint_counts, variables)
+        self.variables = list(variables)
+        self.cardinalities = cardinalities
+        self.alpha = alpha
+        self.shared = shared
+        self.memo = {}
+        # Scores computed since the last sync
+        self.new = {}
+        self.computed = 0
+
+    def family_counts(self, variables):
+        return self.backend.family_counts(variables)
+
+    def k2_score(self, child, parents):
+        key = (child, tuple(sorted(parents)))
+        score = self.memo.get(key)
+        if score is None:
+            score = k2_score(self, child, parents)
+            self.memo[key] = self.new[key] = score
+            self.computed += 1
+        return score
+
+    def sync(self):
+        """Publish the scores computed since the last sync and read everyone's."""
+        if self.shared is None:
+            return
+        if self.new:
+            self.shared.update(self.new)
+            self.new = {}
+        self.memo.update(self.shared.copy())
+
+    def score_order(self, order, u):
+        """(network score, {child: [parents]}) of K2 run on `order`."""
+        structure = learn_k2_structure(self, u=u, variable_order=list(order), verbose=False)
+        return sum(self.k2_score(child, parents) for child, parents in structure.items()), structure
+
+
+# Set in every worker by the pool initializer
+_source = None
+
+
+def _init_worker(source):
+    global _source
+    _source = source
+
+
+def score_orders(task):
+    """Worker: score a chunk of orders and return the best one."""
+    orders, u = task
+    computed = _source.computed
+    _source.sync()
+    best = (-math.inf, None, None)
+    for i, order in enumerate(orders, 1):
+        score, structure = _source.score_order(order, u)
+        if score > best[0]:
+            best = (score, list(order), structure)
+        if i % SYNC_ORDERS == 0:
+            _source.sync()
+    _source.sync()
+    return {
+        "best": best,
+        "orders_scored": len(orders),
+        "scores_computed": _source.computed - computed,
+    }
+
+
+def anneal(task):
+    """
+    Worker: simulated annealing over orders from a random one; a move swaps
+    two variables, and the temperature decays geometrically.
+    """
+    seed, variables, u, steps = task
+    rng = random.Random(seed)
+    computed = _source.computed
+    _source.sync()
+    order = list(variables)
+    rng.shuffle(order)
+    score, structure = _source.score_order(order, u)
+    best = (score, list(order), structure)
+    start_temperature = INITIAL_TEMPERATURE * max(abs(score), 1.0)
+    decay = (FINAL_TEMPERATURE / INITIAL_TEMPERATURE) ** (1 / max(steps - 1, 1))
+    temperature = start_temperature
+    for step in range(1, steps + 1):
+        if step % SYNC_ORDERS == 0:
+            _source.sync()
+        i, j = rng.sample(range(len(order)), 2)
+        candidate = list(order)
+        candidate[i], candidate[j] = candidate[j], candidate[i]
+        candidate_score, candidate_structure = _source.score_order(candidate, u)
+        delta = candidate_score - score
+        if delta >= 0 or rng.random() < math.exp(delta / temperature):
+            order, score = candidate, candidate_score
+            if score > best[0]:
+                best = (score, list(order), candidate_structure)
+        temperature *= decay
+    _source.sync()
+    return {
+        "best": best,
+        "orders_scored": steps + 1,
+        "scores_computed": _source.computed - computed,
+    }
+
+
+def search_orders(
+    classifier,
+    u=3,
+    max_workers=None,
+    exhaustive_limit=EXHAUSTIVE_LIMIT,
+    restarts=None,
+    steps=ANNEALING_STEPS,
+    seed=0,
+):
+    """
+    Best K2 network over the variable orders of the classifier's variables.
+
+    Returns {"order", "structure", "score", "mode", "orders_scored",
+    "families_scored", "scores_computed", "elapsed_s"}: families_scored
+    counts distinct families, scores_computed every K2 score computed by
+    the workers (the difference was scored by several workers between
+    syncs).
+    """
+    variables = list(classifier.variables)
+    max_workers = max_workers or os.cpu_count()
+    joint = classifier.joint_counts()
+    start = time.perf_counter()
+    with Manager() as manager:
+        source = FamilyScores(
+            joint, variables, classifier.cardinalities, classifier.alpha, manager.dict()
+        )
+        with ProcessPoolExecutor(
+            max_workers=max_workers, initializer=_init_worker, initargs=(source,)
+        ) as pool:
+            if math.factorial(len(variables)) <= exhaustive_limit:
+                mode = "exhaustive"
+                orders = list(itertools.permutations(variables))
+                n_chunks = min(len(orders), 4 * max_workers)
+                tasks = [(orders[i::n_chunks], u) for i in range(n_chunks)]
+                results = list(pool.map(score_orders, tasks))
+            else:
+                mode = "annealing"
+                restarts = restarts or 2 * max_workers
+                tasks = [(seed + i, variables, u, steps) for i in range(restarts)]
+                results = list(pool.map(anneal, tasks))
+        families_scored = len(source.shared)
+    score, order, structure = max((r["best"] for r in results), key=lambda best: best[0])
+    return {
+        "order": order,
+        "structure": structure,
+        "score": score,
+        "mode": mode,
+        "orders_scored": sum(r["orders_scored"] for r in results),
+        "families_scored": families_scored,
+        "scores_computed": sum(r["scores_computed"] for r in results),
+        "elapsed_s": time.perf_counter() - start,
+    }
+
+
+def main():
+    from bayes_classifier import BayesianClassifier
+
+    parser = argparse.ArgumentParser(description="Search the variable order of K2.")
+    parser.add_argument("--u", type=int, default=3)
+    parser.add_argument("--alpha", type=float, default=1.0)
+    parser.add_argument("--workers", type=int, nargs="+", default=[os.cpu_count()],
+                        help="Several values to measure the scaling")
+    parser.add_argument("--exhaustive-limit", type=int, default=EXHAUSTIVE_LIMIT)
+    parser.add_argument("--restarts", type=int, default=None)
+    parser.add_argument("--steps", type=int, default=ANNEALING_STEPS)
+    args = parser.parse_args()
+
+    classifier = BayesianClassifier(alpha=args.alpha, backend="memory")
+    for workers in args.workers:
+        result = search_orders(
+            classifier,
+            u=args.u,
+            max_workers=workers,
+            exhaustive_limit=args.exhaustive_limit,
+            restarts=args.restarts,
+            steps=args.steps,
+        )
+        print(
+            f"{workers:>3} workers: {result['orders_scored']} orders ({result['mode']}), "
+            f"{result['families_scored']} families, {result['scores_computed']} scores "
+            f"computed, {result['elapsed_s']:.2f}s"
+        )
+    print(f"Best order: {result['order']}")
+    print(f"Best score: {result['score']:.4f}")
+    print(f"Structure: {result['structure']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+# packed_rows.py
+"""
+Packed single-integer encoding of the indexed transactions.
+
+Every transaction is one mixed-radix code over the variables (in
+cardinalities order, the target included):
+    code = (((age * 4 + gender) * 15 + category) * 4 + amount_bin) * 2 + fraud
+The whole joint space (8 x 4 x 15 x 4 x 2 = 3840 states) fits in a uint16,
+so the dataset takes 2 bytes per row in a .npy column (memory-mapped when
+read) and the joint count tensor is a single np.bincount plus a reshape.
+
+The same code is stored in the `code` field of transactions_indexed
+(index_dataset), so the memory backend builds its joint count tensor with a
+$group on that one field (collection_count_tensor).
+
+Files:
+- <name>.npy   the codes
+- <name>.json  variables and cardinalities, in the order the codes use
+
+Usage:
+    python3 packed_rows.py export transactions.npy   # from transactions_indexed
+    python3 packed_rows.py counts transactions.npy   # joint counts, no database
+    python3 local_counts.py compile transactions.npy model.npz --hypothesis "Fraud as Mediator"
+"""
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+# Rows decoded or counted at a time when reading a memory-mapped column
+CHUNK_SIZE = 10_000_000
+# Field holding the code in transactions_indexed (see index_dataset.assign_codes)
+CODE_FIELD = "code"
+# Variables of the `code` field, in packing order
+CODE_VARIABLES = ["age", "gender", "category", "amount_bin", "fraud"]
+
+
+def joint_shape(variables, cardinalities):
+    return tuple(len(cardinalities[var]) for var in variables)
+
+
+def code_dtype(shape):
+    """Smallest unsigned dtype holding every code of the joint space."""
+    size = int(np.prod(shape))
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if size <= np.iinfo(dtype).max + 1:
+            return np.dtype(dtype)
+    return np.dtype(np.uint64)
+
+
+def pack(rows, shape):
+    """(n, len(shape)) array of indexed values -> n codes."""
+    rows = np.asarray(rows)
+    codes = np.ravel_multi_index(tuple(rows.T), shape)
+    return codes.astype(code_dtype(shape), copy=False)
+
+
+def unpack(codes, shape):
+    """n codes -> (n, len(shape)) array of indexed values."""
+    return np.stack(np.unravel_index(codes, shape), axis=1)
+
+
+def count_tensor(codes, shape, chunk_size=CHUNK_SIZE):
+    """
+    Dense joint count tensor of the codes: one bincount per chunk, so a
+    memory-mapped column is never loaded as a whole.
+    """
+    size = int(np.prod(shape))
+    counts = np.zeros(size, dtype=np.int64)
+    for start in range(0, len(codes), chunk_size):
+        counts += np.bincount(codes[start : start + chunk_size], minlength=size)
+    return counts.reshape(shape)
+
+
+def save(path, codes, variables, cardinalities):
+    np.save(path, codes)
+    write_header(path, variables, cardinalities)
+
+
+def write_header(path, variables, cardinalities):
+    with open(header_path(path), "w") as f:
+        json.dump({"variables": list(variables), "cardinalities": cardinalities}, f)
+
+
+def header_path(path):
+    return os.path.splitext(path)[0] + ".json"
+
+
+def load(path, mmap=True):
+    """Return (codes, variables, cardinalities); codes are memory-mapped by default."""
+    with open(header_path(path)) as f:
+        header = json.load(f)
+    codes = np.load(path, mmap_mode="r" if mmap else None)
+    return codes, header["variables"], header["cardinalities"]
+
+
+def load_count_tensor(path):
+    """Return (joint_counts, variables, cardinalities) of a packed file."""
+    codes, variables, cardinalities = load(path)
+    return count_tensor(codes, joint_shape(variables, cardinalities)), variables, cardinalities
+
+
+def export_collection(data_collection, path, variables, cardinalities, batch_size=100_000):
+    """Write the codes of every document of an indexed collection to `path`."""
+    shape = joint_shape(variables, cardinalities)
+    total = data_collection.count_documents({})
+    out = np.lib.format.open_memmap(path, mode="w+", dtype=code_dtype(shape), shape=(total,))
+    written = 0
+    batch = []
+    projection = {var: 1 for var in variables}
+    projection["_id"] = 0
+    for doc in data_collection.find({}, projection, batch_size=batch_size):
+        batch.append([doc[var] for var in variables])
+        if len(batch) == batch_size:
+            out[written : written + len(batch)] = pack(batch, shape)
+            written += len(batch)
+            batch = []
+    if batch:
+        out[written : written + len(batch)] = pack(batch, shape)
+        written += len(batch)
+    out.flush()
+    write_header(path, variables, cardinalities)
+    return written
+
+
+def has_codes(data_collection):
+    """True if every document of the collection has the `code` field."""
+    return (
+        data_collection.find_one({}, {"_id": 1}) is not None
+        and data_collection.find_one({CODE_FIELD: {"$exists": False}}, {"_id": 1}) is None
+    )
+
+
+def collection_count_tensor(data_collection, variables, cardinalities, match=None):
+    """
+    Joint count tensor from the `code` field (see index_dataset.assign_codes):
+    a $group on one integer field instead of five.
+    """
+    shape = joint_shape(variables, cardinalities)
+    pipeline = [{"$match": match}] if match else []
+    pipeline.append({"$group": {"_id": f"${CODE_FIELD}", "count": {"$sum": 1}}})
+    counts = np.zeros(int(np.prod(shape)), dtype=np.int64)
+    for doc in data_collection.aggregate(pipeline, allowDiskUse=True):
+        counts[doc["_id"]] = doc["count"]
+    return counts.reshape(shape)
+
+
+def main():
+    if len(sys.argv) != 3 or sys.argv[1] not in ("export", "counts"):
+        print(__doc__)
+        sys.exit(1)
+    command, path = sys.argv[1], sys.argv[2]
+    if command == "export":
+        from bayes_classifier import BayesianClassifier
+
+        classifier = BayesianClassifier(backend="mongo")
+        start = time.perf_counter()
+        rows = export_collection(
+            classifier.data_collection, path, classifier.variables, classifier.cardinalities
+        )
+        print(f"Exported {rows:,} rows to {path} in {time.perf_counter() - start:.1f}s.")
+        return
+    start = time.perf_counter()
+    joint, variables, _ = load_count_tensor(path)
+    elapsed = time.perf_counter() - start
+    print(f"Joint counts of {variables} {joint.shape}: {int(joint.sum()):,} rows in {elapsed:.3f}s.")
+
+
+if __name__ == "__main__":
+    main()
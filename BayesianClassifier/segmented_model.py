@@ -0,0 +1,173 @@
+# segmented_model.py
+"""
+One compiled model per segment (e.g. per merchant or per category), all in
+one array.
+
+The counts of every segment come from a single $group with the segment as
+a leading axis (segment_counts[s, v1, v2, ...]), the same way
+bucket_count_tensor adds the hash bucket. Each segment's posterior table
+is compiled from its slice, so the model is a single (slots, evidence
+codes, target values) array.
+
+Scoring reads `slots[segment]`, the row of the table to use, and then the
+evidence code: two array reads whatever the number of segments. Segments
+with fewer than `min_support` transactions (and segment values never seen)
+are mapped to the global model, the classifier's own hypothesis, since
+their own counts are too few to estimate the CPTs.
+
+The segment variable is not a variable of the per-segment models: within a
+segment it takes a single value. When it is a variable of the hypothesis
+(e.g. category), the global model does depend on it: its table has one
+slot per segment value (the global model with the segment observed), used
+for the rare values, plus a last slot with the segment summed out, used for
+unseen ones.
+"""
+import numpy as np
+
+from compiled_model import CompiledModel, joint_probability_tensor
+
+MIN_SUPPORT = 1000
+
+
+def segment_tables(segment_counts, variables, parents, alpha, target_variable="fraud"):
+    """(segments, evidence codes, target values) posterior tables, one per segment slice."""
+    target_axis = variables.index(target_variable)
+    tables = []
+    for counts in segment_counts:
+        prob = joint_probability_tensor(counts, variables, parents, alpha, int(counts.sum()))
+        tables.append(np.moveaxis(prob, target_axis, -1).reshape(-1, prob.shape[target_axis]))
+    return np.stack(tables)
+
+
+class SegmentedModel(CompiledModel):
+    """
+    CompiledModel whose table has a leading slot axis: table[slots[s]] is
+    the table of segment s (or of the global model with the segment
+    observed), table[-1] the global one for unseen segment values.
+    """
+
+    def __init__(
+        self, table, slots, segment, variables, cardinalities, target_variable, metadata=None
+    ):
+        super().__init__(table, variables, cardinalities, target_variable, metadata)
+        self.segment = segment
+        self.slots = np.asarray(slots)
+        self.global_slot = len(table) - 1
+        self.input_variables = [segment] + self.evidence_variables
+
+    @classmethod
+    def compile(
+        cls,
+        segment_counts,
+        segment,
+        variables,
+        cardinalities,
+        parents,
+        alpha,
+        min_support=MIN_SUPPORT,
+        target_variable="fraud",
+        metadata=None,
+        segment_in_model=False,
+    ):
+        """
+        Compile the hypothesis `parents` for every segment of
+        segment_counts[s, ...] (axes: segment, then `variables`).
+        segment_in_model tells whether the segment is a variable of the
+        hypothesis, whose families then include it in the global model.
+        """
+        n_segments = len(segment_counts)
+        support = segment_counts.reshape(n_segments, -1).sum(axis=1)
+        kept = np.flatnonzero(support >= min_support)
+        # The segment is constant within a segment: drop it from the families
+        segment_parents = {
+            child: [p for p in family if p != segment]
+            for child, family in parents.items()
+            if child != segment
+        }
+        tables = []
+        if len(kept):
+            tables.append(
+                segment_tables(
+                    segment_counts[kept], variables, segment_parents, alpha, target_variable
+                )
+            )
+        if segment_in_model:
+            # Global model of [segment] + variables, one slot per segment value
+            joint_variables = [segment] + list(variables)
+            prob = joint_probability_tensor(
+                segment_counts, joint_variables, parents, alpha, int(segment_counts.sum())
+            )
+            target_axis = joint_variables.index(target_variable)
+            per_value = np.moveaxis(prob, target_axis, -1).reshape(
+                n_segments, -1, prob.shape[target_axis]
+            )
+            tables += [per_value, per_value.sum(axis=0, keepdims=True)]
+            slots = len(kept) + np.arange(n_segments)
+        else:
+            tables.append(
+                segment_tables(
+                    segment_counts.sum(axis=0, keepdims=True),
+                    variables,
+                    parents,
+                    alpha,
+                    target_variable,
+                )
+            )
+            slots = np.full(n_segments, len(kept))
+        table = np.concatenate(tables)
+        slots[kept] = np.arange(len(kept))
+        metadata = {**(metadata or {}), "min_support": min_support, "segments": int(len(kept))}
+        return cls(
+            np.ascontiguousarray(table),
+            slots,
+            segment,
+            variables,
+            cardinalities,
+            target_variable,
+            metadata,
+        )
+
+    def header(self):
+        return {**super().header(), "segment": self.segment, "slots": self.slots.tolist()}
+
+    @classmethod
+    def from_header(cls, table, header):
+        return cls(
+            table,
+            header["slots"],
+            header["segment"],
+            header["variables"],
+            header["cardinalities"],
+            header["target_variable"],
+            header["metadata"],
+        )
+
+    def slot(self, evidence, apply_index=True):
+        """Table row of the evidence's segment (the global one if unknown or rare)."""
+        value = evidence.get(self.segment)
+        if apply_index:
+            value = self.cardinalities[self.segment].get(value)
+        if value is None or not 0 <= value < len(self.slots):
+            return self.global_slot
+        return self.slots[value]
+
+    def table_rows(self, columns):
+        segments = np.asarray(columns[self.segment], dtype=np.int64)
+        known = (segments >= 0) & (segments < len(self.slots))
+        slots = np.where(known, self.slots[np.where(known, segments, 0)], self.global_slot)
+        return self.table[slots, self.evidence_codes(columns)]
+
+    def classify(self, evidence, apply_index=True):
+        row = self.table[self.slot(evidence, apply_index)]
+        if apply_index:
+            evidence = self.index_evidence(evidence)
+        row = row[self.evidence_code(evidence)]
+        pred_clase = int(row.argmax())
+        return (pred_clase == 1, float(row[pred_clase]))
+
+    def posterior(self, evidence, apply_index=True):
+        row = self.table[self.slot(evidence, apply_index)]
+        if apply_index:
+            evidence = self.index_evidence(evidence)
+        row = row[self.evidence_code(evidence)]
+        return row / row.sum()
@@ -0,0 +1,256 @@
+# shared_model.py
+"""
+Share one compiled model across worker processes with shared memory.
+
+A parent process compiles the model once (BayesianClassifier.compiled_model())
+and publishes it with SharedModelPublisher. Workers attach with
+SharedModelReader: they map the table read-only, need no MongoClient, no LRU
+cache and no count tensor of their own, and pick up new snapshots through a
+generation counter without restarting.
+
+Layout:
+- control block `<name>`: generation (uint64) + name of the current data block
+- data block `<name>_g<generation>`: header length (uint64), JSON header
+  (variables, cardinalities, target, table shape) and the float64 table
+
+Publishing follows a seqlock: the generation is odd while the control block
+is being written and even once it is consistent, so readers never see a
+half-written snapshot.
+
+Usage (parent):
+    publisher = SharedModelPublisher()
+    publisher.publish(classifier.compiled_model())
+Usage (worker):
+    reader = SharedModelReader()
+    is_fraud, prob = reader.classify(evidence)
+"""
+import json
+import struct
+import sys
+import threading
+import time
+import weakref
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from compiled_model import CompiledModel
+
+DEFAULT_NAME = "bayes_model"
+# generation (uint64) + name length (uint32) + name
+CONTROL_FORMAT = "<QI"
+CONTROL_NAME_SIZE = 128
+CONTROL_SIZE = struct.calcsize(CONTROL_FORMAT) + CONTROL_NAME_SIZE
+HEADER_LEN_FORMAT = "<Q"
+ALIGNMENT = 8
+
+
+_attach_lock = threading.Lock()
+
+
+def _attach(name):
+    """Attach to an existing block without letting this process unlink it at exit."""
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    # Before 3.13 every attaching process registers the block with its
+    # resource tracker, which unlinks it when the process exits. Skip the
+    # registration, as track=False does.
+    with _attach_lock:
+        register = resource_tracker.register
+        resource_tracker.register = lambda name, rtype: None
+        try:
+            return shared_memory.SharedMemory(name=name)
+        finally:
+            resource_tracker.register = register
+
+
+class SharedModelPublisher:
+    def __init__(self, name=DEFAULT_NAME):
+        self.name = name
+        try:
+            self.control = shared_memory.SharedMemory(name=name, create=True, size=CONTROL_SIZE)
+        except FileExistsError:
+            # Left over by a publisher that did not shut down cleanly
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+            self.control = shared_memory.SharedMemory(name=name, create=True, size=CONTROL_SIZE)
+        self.control.buf[:CONTROL_SIZE] = bytes(CONTROL_SIZE)
+        self.generation = 0
+        # The previous snapshot is kept until the next publish so that
+        # workers still reading it can finish.
+        self.blocks = []
+
+    def publish(self, model):
+        """Write `model` to a new data block and make it current. Returns the generation."""
+        if not hasattr(model, "table"):
+            raise TypeError(
+                f"Only models with a posterior table can be shared, not a {type(model).__name__} "
+                "(high-cardinality variables); save it and load it in each worker instead"
+            )
+        generation = self.generation + 1
+        header = json.dumps(model.header()).encode()
+        header_start = struct.calcsize(HEADER_LEN_FORMAT)
+        offset = header_start + len(header)
+        offset += -offset % ALIGNMENT
+        table = np.ascontiguousarray(model.table, dtype=np.float64)
+
+        data_name = f"{self.name}_g{generation}"
+        block = shared_memory.SharedMemory(name=data_name, create=True, size=offset + table.nbytes)
+        struct.pack_into(HEADER_LEN_FORMAT, block.buf, 0, len(header))
+        block.buf[header_start : header_start + len(header)] = header
+        np.ndarray(table.shape, dtype=np.float64, buffer=block.buf, offset=offset)[:] = table
+
+        encoded_name = data_name.encode()
+        if len(encoded_name) > CONTROL_NAME_SIZE:
+            raise ValueError(f"Shared memory name too long: {data_name}")
+        # Seqlock: odd while writing, even when the control block is consistent
+        struct.pack_into(CONTROL_FORMAT, self.control.buf, 0, 2 * generation - 1, len(encoded_name))
+        offset_name = struct.calcsize(CONTROL_FORMAT)
+        self.control.buf[offset_name : offset_name + len(encoded_name)] = encoded_name
+        struct.pack_into("<Q", self.control.buf, 0, 2 * generation)
+        self.generation = generation
+
+        self.blocks.append(block)
+        while len(self.blocks) > 2:
+            old = self.blocks.pop(0)
+            old.close()
+            old.unlink()
+        return generation
+
+    def close(self):
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+        self.control.close()
+        self.control.unlink()
+
+
+class SharedModelReader:
+    def __init__(self, name=DEFAULT_NAME):
+        self.name = name
+        self.control = _attach(name)
+        self.generation = 0
+        self.block = None
+        self._model = None
+        # (block, weakref to its table) of older snapshots whose table may
+        # still be in use
+        self._retired = []
+        # Serializes attaching a snapshot and retiring the previous one
+        self._lock = threading.Lock()
+
+    def current_generation(self):
+        """Return (generation, data block name) as last published."""
+        while True:
+            before = struct.unpack_from("<Q", self.control.buf, 0)[0]
+            if before % 2:
+                time.sleep(0)
+                continue
+            _, length = struct.unpack_from(CONTROL_FORMAT, self.control.buf, 0)
+            offset = struct.calcsize(CONTROL_FORMAT)
+            data_name = bytes(self.control.buf[offset : offset + length]).decode()
+            after = struct.unpack_from("<Q", self.control.buf, 0)[0]
+            if before == after:
+                return before // 2, data_name
+
+    def model(self):
+        """Return the CompiledModel of the latest published generation."""
+        generation, _ = self.current_generation()
+        if generation != 0 and generation == self.generation:
+            return self._model
+        with self._lock:
+            while True:
+                generation, data_name = self.current_generation()
+                if generation == 0:
+                    raise RuntimeError(f"No model has been published to '{self.name}' yet")
+                if generation == self.generation:
+                    # Attached meanwhile by another thread
+                    return self._model
+                try:
+                    self._attach_snapshot(generation, data_name)
+                    return self._model
+                except FileNotFoundError:
+                    # Overtaken by two publishes: the block was already
+                    # unlinked, read the control block again
+                    continue
+
+    def _attach_snapshot(self, generation, data_name):
+        block = _attach(data_name)
+        (header_len,) = struct.unpack_from(HEADER_LEN_FORMAT, block.buf, 0)
+        start = struct.calcsize(HEADER_LEN_FORMAT)
+        header = json.loads(bytes(block.buf[start : start + header_len]))
+        offset = start + header_len
+        offset += -offset % ALIGNMENT
+        table = np.ndarray(tuple(header["shape"]), dtype=np.float64, buffer=block.buf, offset=offset)
+        table.flags.writeable = False
+
+        if self.block is not None:
+            self._retired.append((self.block, weakref.ref(self._model.table)))
+        self.block = block
+        self._model = CompiledModel.from_header(table, header)
+        self.generation = generation
+        self._close_retired()
+
+    def _close_retired(self):
+        # NumPy does not keep the block's buffer exported, so close() would
+        # unmap a table that a request is still reading: wait for the table
+        # (and every view of it) to be freed instead
+        still_used = []
+        for block, table in self._retired:
+            if table() is None:
+                block.close()
+            else:
+                still_used.append((block, table))
+        self._retired = still_used
+
+    def classify(self, evidence, apply_index=True):
+        return self.model().classify(evidence, apply_index)
+
+    def close(self):
+        with self._lock:
+            if self.block is not None:
+                self._retired.append((self.block, weakref.ref(self._model.table)))
+                self.block = None
+            self._model = None
+            self._close_retired()
+            self.control.close()
+
+
+def main():
+    import argparse
+
+    from bayes_classifier import BayesianClassifier, available_hypotheses
+
+    parser = argparse.ArgumentParser(description="Compile a model and share it with workers.")
+    parser.add_argument("--name", default=DEFAULT_NAME)
+    parser.add_argument("--hypothesis", default="Naive Bayes", choices=list(available_hypotheses))
+    parser.add_argument("--alpha", type=float, default=1.0)
+    parser.add_argument(
+        "--refresh-seconds", type=float, default=None, help="Recompile and republish periodically"
+    )
+    args = parser.parse_args()
+
+    classifier = BayesianClassifier(
+        alpha=args.alpha, hyphothesis_name=args.hypothesis, backend="memory"
+    )
+    publisher = SharedModelPublisher(args.name)
+    try:
+        generation = publisher.publish(classifier.compiled_model())
+        print(f"Published '{args.hypothesis}' to '{args.name}' (generation {generation}).")
+        while True:
+            if args.refresh_seconds is None:
+                time.sleep(3600)
+                continue
+            time.sleep(args.refresh_seconds)
+            classifier.refresh_counts()
+            generation = publisher.publish(classifier.compiled_model())
+            print(f"Republished (generation {generation}).")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        publisher.close()
+
+
+if __name__ == "__main__":
+    main()
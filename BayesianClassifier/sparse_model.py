@@ -0,0 +1,228 @@
+# sparse_model.py
+"""
+Sparse CPTs for hypotheses over high-cardinality variables.
+
+A dense table over merchant (50) x customer (4112) x step (180) values is out
+of the question, but the data only ever shows a small part of it. A
+SparseCPT stores, in a dict, the counts of the observed parent
+configurations only; any other configuration gets an explicit smoothed
+default. Memory and compile time therefore follow the observed data, not
+the product of the cardinalities.
+
+The probabilities are exactly those of compute_joint_distribution:
+    P(v | parents) = (N(v, parents) + alpha) / (N(parents) + alpha * r)
+which for an unobserved parent configuration is alpha / (alpha * r) = 1 / r.
+
+A SparseModel saves to the same kind of .npz file as a CompiledModel (one
+key and one count array per CPT instead of the table), and
+CompiledModel.load returns it as such.
+"""
+import json
+
+import numpy as np
+
+
+class SparseCPT:
+    def __init__(self, child, parents, family_counts, arity, alpha, N):
+        """
+        family_counts: {(parent values..., child value): count} of the
+        observed configurations (see BayesianClassifier.family_counts).
+        """
+        self.child = child
+        self.parents = list(parents)
+        self.arity = arity
+        self.alpha = alpha
+        # {parent values: [N(parents), {child value: N(child, parents)}]}
+        self.table = {}
+        for key, n in family_counts.items():
+            entry = self.table.setdefault(key[:-1], [0, {}])
+            entry[0] += n
+            entry[1][key[-1]] = n
+        if not self.parents:
+            # Unconditioned variables are normalized by the dataset size
+            self.table.setdefault((), [0, {}])[0] = N
+        self.default = 1 / arity if alpha else 0.0
+
+    def family_arrays(self):
+        """The family counts as ((entries, parents + 1) keys, (entries,) counts) arrays."""
+        keys = [
+            parent_values + (value,)
+            for parent_values, (_, counts) in self.table.items()
+            for value in counts
+        ]
+        counts = [n for _, counts in self.table.values() for n in counts.values()]
+        width = len(self.parents) + 1
+        return (
+            np.array(keys, dtype=np.int64).reshape(-1, width),
+            np.array(counts, dtype=np.int64),
+        )
+
+    def probabilities(self, values, parent_columns):
+        """Vectorized probability(): one value per row of the columns."""
+        if not self.parents:
+            return np.array([self.probability(v, ()) for v in range(self.arity)])[values]
+        rows = np.stack(list(parent_columns) + [values], axis=1)
+        # Each distinct (parents, value) combination is looked up once
+        unique, inverse = np.unique(rows, axis=0, return_inverse=True)
+        probs = np.array(
+            [self.probability(int(row[-1]), tuple(int(v) for v in row[:-1])) for row in unique]
+        )
+        return probs[inverse.reshape(-1)]
+
+    def __len__(self):
+        return sum(len(counts) for _, counts in self.table.values())
+
+    def probability(self, value, parent_values):
+        entry = self.table.get(parent_values)
+        if entry is None:
+            return self.default
+        total, counts = entry
+        return (counts.get(value, 0) + self.alpha) / (total + self.alpha * self.arity)
+
+
+class SparseModel:
+    """
+    A hypothesis as one SparseCPT per variable. Like CompiledModel it
+    answers classify() without counting, but its size follows the data.
+    """
+
+    def __init__(self, cpts, variables, cardinalities, target_variable, metadata=None):
+        self.cpts = cpts
+        self.variables = list(variables)
+        self.cardinalities = cardinalities
+        self.target_variable = target_variable
+        self.evidence_variables = [v for v in self.variables if v != target_variable]
+        # Indexed fields classify_batch() reads
+        self.input_variables = list(self.evidence_variables)
+        self.metadata = metadata or {}
+
+    @classmethod
+    def compile(
+        cls,
+        family_counts,
+        variables,
+        cardinalities,
+        parents,
+        alpha,
+        N,
+        target_variable="fraud",
+        metadata=None,
+    ):
+        """
+        family_counts(variables) returns the sparse table of the observed
+        combinations of `variables` (one query per variable).
+        """
+        cpts = {}
+        for var in variables:
+            var_parents = list(parents.get(var, []))
+            cpts[var] = SparseCPT(
+                var,
+                var_parents,
+                family_counts(var_parents + [var]),
+                len(cardinalities[var]),
+                alpha,
+                N,
+            )
+        return cls(cpts, variables, cardinalities, target_variable, metadata)
+
+    def __len__(self):
+        """Number of stored counts."""
+        return sum(len(cpt) for cpt in self.cpts.values())
+
+    def header(self):
+        """Everything but the counts, as JSON-serializable data."""
+        some_cpt = next(iter(self.cpts.values()))
+        # Dataset size, the normalizer of the unconditioned CPTs
+        N = next((cpt.table[()][0] for cpt in self.cpts.values() if not cpt.parents), 0)
+        return {
+            "sparse": True,
+            "variables": self.variables,
+            "cardinalities": self.cardinalities,
+            "target_variable": self.target_variable,
+            "parents": {var: cpt.parents for var, cpt in self.cpts.items()},
+            "alpha": some_cpt.alpha,
+            "N": N,
+            "metadata": self.metadata,
+        }
+
+    def save(self, path):
+        """Write the counts of every CPT and the header to an .npz file."""
+        arrays = {}
+        for var, cpt in self.cpts.items():
+            arrays[f"keys_{var}"], arrays[f"counts_{var}"] = cpt.family_arrays()
+        header = np.frombuffer(json.dumps(self.header()).encode(), dtype=np.uint8)
+        np.savez(path, header=header, **arrays)
+
+    @classmethod
+    def from_header(cls, arrays, header):
+        """Rebuild a saved model from its header and {name: array} (see save)."""
+        cpts = {}
+        for var in header["variables"]:
+            keys, counts = arrays[f"keys_{var}"], arrays[f"counts_{var}"]
+            family_counts = {tuple(int(v) for v in key): int(n) for key, n in zip(keys, counts)}
+            cpts[var] = SparseCPT(
+                var,
+                header["parents"][var],
+                family_counts,
+                len(header["cardinalities"][var]),
+                header["alpha"],
+                header["N"],
+            )
+        return cls(
+            cpts,
+            header["variables"],
+            header["cardinalities"],
+            header["target_variable"],
+            header["metadata"],
+        )
+
+    def index_evidence(self, evidence):
+        # A value never seen in the data has no index: every configuration
+        # containing it falls back to the default
+        return {var: self.cardinalities[var].get(evidence[var]) for var in self.evidence_variables}
+
+    def joint_distribution(self, evidence_indexed):
+        distribution = []
+        for target_val in self.cardinalities[self.target_variable].values():
+            context = {**evidence_indexed, self.target_variable: target_val}
+            prob_total = 1.0
+            for var in self.variables:
+                cpt = self.cpts[var]
+                prob_total *= cpt.probability(
+                    context[var], tuple(context[p] for p in cpt.parents)
+                )
+            distribution.append(prob_total)
+        return distribution
+
+    def classify(self, evidence, apply_index=True):
+        """Return (is_fraud, probability) as BayesianClassifier.classify does."""
+        if apply_index:
+            evidence = self.index_evidence(evidence)
+        distribution = self.joint_distribution(evidence)
+        pred_clase = max(range(len(distribution)), key=distribution.__getitem__)
+        return (pred_clase == 1, distribution[pred_clase])
+
+    def classify_batch(self, columns):
+        """
+        classify() of many indexed evidences at once, as
+        CompiledModel.classify_batch: `columns` maps every evidence variable
+        to an array of indexed values. Returns (predicted target index,
+        P(target | evidence)) arrays.
+        """
+        n = len(columns[self.evidence_variables[0]])
+        target_values = list(self.cardinalities[self.target_variable].values())
+        joint = np.ones((n, len(target_values)))
+        for t, target_val in enumerate(target_values):
+            context = {var: np.asarray(columns[var], dtype=np.int64) for var in self.evidence_variables}
+            context[self.target_variable] = np.full(n, target_val, dtype=np.int64)
+            for var in self.variables:
+                cpt = self.cpts[var]
+                joint[:, t] *= cpt.probabilities(context[var], [context[p] for p in cpt.parents])
+        return joint.argmax(axis=1), joint / joint.sum(axis=1, keepdims=True)
+
+    def posterior(self, evidence, apply_index=True):
+        if apply_index:
+            evidence = self.index_evidence(evidence)
+        distribution = self.joint_distribution(evidence)
+        total = sum(distribution)
+        return [p / total for p in distribution]
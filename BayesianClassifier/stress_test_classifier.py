@@ -0,0 +1,144 @@
+# stress_test_classifier.py
+"""
+Stress test and thread-scaling benchmark of BayesianClassifier.classify().
+
+1. Classifies the same evidences from a thread pool of growing size and
+   checks every answer against a sequential run.
+2. Repeats it while another thread keeps switching the hypothesis, checking
+   that every answer matches one of the two hypotheses (never a mix).
+3. Reports the throughput for each thread count and saves it to
+   benchmarks/thread_scaling_results.csv.
+
+Usage:
+    python3 stress_test_classifier.py
+    python3 stress_test_classifier.py --backend mongo --no-cache --threads 1 4 16 32
+"""
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from bayes_classifier import BayesianClassifier, available_hypotheses
+from benchmark_suite import generate_evidences
+
+THREAD_COUNTS = [1, 2, 4, 8, 16]
+NUM_EVIDENCES = 200
+OUTPUT_FILENAME = "benchmarks/thread_scaling_results.csv"
+
+
+def classify_all(classifier, evidences, threads):
+    """Classify every evidence with a pool of `threads` threads."""
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        return list(pool.map(lambda e: classifier.classify(e)[:2], evidences))
+
+
+def reference_results(classifier, evidences):
+    BayesianClassifier._cached_compute_counts.cache_clear()
+    return [classifier.classify(evidence)[:2] for evidence in evidences]
+
+
+def check_consistency(classifier, evidences, expected, thread_counts):
+    """Run classify() concurrently and compare against the sequential results."""
+    rows = []
+    for threads in thread_counts:
+        # Start cold so the threads actually overlap on I/O
+        BayesianClassifier._cached_compute_counts.cache_clear()
+        start = time.perf_counter()
+        results = classify_all(classifier, evidences, threads)
+        elapsed = time.perf_counter() - start
+        mismatches = sum(r != e for r, e in zip(results, expected))
+        throughput = len(evidences) / elapsed
+        print(
+            f"  {threads:>3} threads: {throughput:10.1f} classifications/s, "
+            f"{mismatches} mismatches"
+        )
+        rows.append(
+            {
+                "backend": classifier.backend,
+                "use_lru_cache": classifier.use_lru_cache,
+                "threads": threads,
+                "classifications": len(evidences),
+                "elapsed_s": elapsed,
+                "throughput_per_s": throughput,
+                "mismatches": mismatches,
+            }
+        )
+    return rows
+
+
+def check_hypothesis_switching(classifier, evidences, name_a, name_b, threads):
+    """
+    Classify from `threads` threads while the hypothesis flips between A and
+    B. Every answer must match A or B exactly.
+    """
+    classifier.set_hypothesis(available_hypotheses[name_a])
+    expected_a = reference_results(classifier, evidences)
+    classifier.set_hypothesis(available_hypotheses[name_b])
+    expected_b = reference_results(classifier, evidences)
+
+    stop = threading.Event()
+
+    def switch():
+        names = [name_a, name_b]
+        i = 0
+        while not stop.is_set():
+            classifier.set_hypothesis(available_hypotheses[names[i % 2]])
+            i += 1
+            time.sleep(0.001)
+
+    switcher = threading.Thread(target=switch)
+    switcher.start()
+    try:
+        results = classify_all(classifier, evidences, threads)
+    finally:
+        stop.set()
+        switcher.join()
+
+    torn = sum(
+        r != a and r != b for r, a, b in zip(results, expected_a, expected_b)
+    )
+    print(f"  {torn} answers matched neither '{name_a}' nor '{name_b}'")
+    return torn
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--backend", default="precomputed", choices=["mongo", "precomputed", "memory", "adtree", "sketch"])
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--compiled", action="store_true")
+    parser.add_argument("--threads", nargs="+", type=int, default=THREAD_COUNTS)
+    parser.add_argument("--evidences", type=int, default=NUM_EVIDENCES)
+    parser.add_argument("--output", default=OUTPUT_FILENAME)
+    args = parser.parse_args()
+
+    classifier = BayesianClassifier(
+        backend=args.backend, use_lru_cache=not args.no_cache, compiled=args.compiled
+    )
+    evidences = generate_evidences(args.evidences)
+    original = [dict(e) for e in evidences]
+
+    print("Sequential reference run...")
+    expected = reference_results(classifier, evidences)
+
+    print("Concurrent runs:")
+    rows = check_consistency(classifier, evidences, expected, args.threads)
+
+    print("Concurrent hypothesis switching:")
+    torn = check_hypothesis_switching(
+        classifier, evidences, "Naive Bayes", "Fraud as Mediator", max(args.threads)
+    )
+
+    mutated = sum(e != o for e, o in zip(evidences, original))
+    failures = sum(row["mismatches"] for row in rows) + torn + mutated
+    print(f"Evidences mutated by classify(): {mutated}")
+
+    pd.DataFrame(rows).to_csv(args.output, index=False)
+    print(f"Thread scaling results saved to {args.output}.")
+    print("PASSED" if failures == 0 else f"FAILED ({failures} problems)")
+    return 0 if failures == 0 else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,195 @@
+# synthetic_dataset.py
+"""
+Generate synthetic encoded transactions for load and scaling tests.
+
+The generator fits either
+- the full joint distribution of `transactions_indexed` ("joint"), or
+- the CPTs of one of the available hypotheses ("hypothesis"),
+and samples as many rows as requested in vectorized chunks, streaming
+them into a MongoDB collection (same schema as `transactions_indexed`)
+or into a .csv/.npy file.
+
+Usage:
+    python3 synthetic_dataset.py --rows 6000000 --collection transactions_synthetic_10x
+    python3 synthetic_dataset.py --rows 60000000 --source hypothesis \\
+        --hypothesis "Fraud as Mediator" --out synthetic_100x.npy
+"""
+import argparse
+import math
+
+import numpy as np
+from bson import ObjectId
+
+from bayes_classifier import BayesianClassifier, available_hypotheses
+from count_backends import BUCKET_FIELD
+from index_dataset import bucket_of
+
+CHUNK_SIZE = 100000
+
+
+def joint_sampler(joint_counts, alpha=0.0):
+    """
+    Return sample(n, rng) drawing rows from the (smoothed) joint distribution.
+    Rows are int arrays of shape (n, n_variables).
+    """
+    shape = joint_counts.shape
+    weights = joint_counts.astype(np.float64).ravel() + alpha
+    cdf = np.cumsum(weights / weights.sum())
+
+    def sample(n, rng):
+        flat = np.searchsorted(cdf, rng.random(n), side="right")
+        flat = np.minimum(flat, len(cdf) - 1)
+        return np.stack(np.unravel_index(flat, shape), axis=1)
+
+    return sample
+
+
+def fit_cpts(joint_counts, variables, parents, alpha=1.0):
+    """
+    Fit P(var | parents) for every variable from the joint count tensor.
+    Each CPT has one axis per parent (in parents order) and a last axis for var.
+    """
+    cpts = {}
+    for var in variables:
+        family = list(parents.get(var, [])) + [var]
+        axes = [variables.index(v) for v in family]
+        other = tuple(i for i in range(len(variables)) if i not in axes)
+        counts = joint_counts.sum(axis=other)
+        # sum() keeps the remaining axes in variables order
+        kept = sorted(axes)
+        counts = np.transpose(counts, [kept.index(a) for a in axes])
+        k = counts.shape[-1]
+        totals = counts.sum(axis=-1, keepdims=True) + alpha * k
+        with np.errstate(invalid="ignore", divide="ignore"):
+            cpt = (counts + alpha) / totals
+        # Parent configurations never seen (with alpha=0) sample uniformly
+        cpts[var] = np.where(totals > 0, cpt, 1.0 / k)
+    return cpts
+
+
+def topological_order(variables, parents):
+    order = []
+    placed = set()
+    while len(order) < len(variables):
+        ready = [
+            var
+            for var in variables
+            if var not in placed and all(p in placed for p in parents.get(var, []))
+        ]
+        if not ready:
+            raise ValueError(f"The hypothesis has a cycle: {dict(parents)}")
+        order.extend(ready)
+        placed.update(ready)
+    return order
+
+
+def cpt_sampler(cpts, variables, parents):
+    """Return sample(n, rng) doing vectorized ancestral sampling over the CPTs."""
+    order = topological_order(variables, parents)
+    cdfs = {var: np.cumsum(cpts[var], axis=-1) for var in variables}
+
+    def sample(n, rng):
+        rows = np.empty((n, len(variables)), dtype=np.int64)
+        for var in order:
+            parent_axes = [variables.index(p) for p in parents.get(var, [])]
+            row_cdf = cdfs[var][tuple(rows[:, a] for a in parent_axes)]
+            k = row_cdf.shape[-1]
+            values = (rng.random(n)[:, None] > row_cdf).sum(axis=1)
+            rows[:, variables.index(var)] = np.minimum(values, k - 1)
+        return rows
+
+    return sample
+
+
+def generate_chunks(sample, total_rows, chunk_size=CHUNK_SIZE, seed=42):
+    """Yield arrays of at most chunk_size sampled rows until total_rows."""
+    rng = np.random.default_rng(seed)
+    for start in range(0, total_rows, chunk_size):
+        yield sample(min(chunk_size, total_rows - start), rng)
+
+
+def write_to_collection(collection, chunks, variables, total_rows):
+    collection.drop()
+    written = 0
+    for rows in chunks:
+        docs = []
+        for row in rows.tolist():
+            doc = dict(zip(variables, row))
+            # Synthetic rows get hash buckets too, so `fraction=` works on them
+            doc["_id"] = ObjectId()
+            doc[BUCKET_FIELD] = bucket_of(doc["_id"])
+            docs.append(doc)
+        collection.insert_many(docs, ordered=False)
+        written += len(rows)
+        print_progress(written, total_rows)
+    collection.create_index(BUCKET_FIELD)
+
+
+def write_to_file(filename, chunks, variables, total_rows):
+    if filename.endswith(".npy"):
+        out = np.lib.format.open_memmap(
+            filename, mode="w+", dtype=np.uint8, shape=(total_rows, len(variables))
+        )
+        written = 0
+        for rows in chunks:
+            out[written : written + len(rows)] = rows
+            written += len(rows)
+            print_progress(written, total_rows)
+        out.flush()
+        return
+    with open(filename, "w") as f:
+        f.write(",".join(variables) + "\n")
+        written = 0
+        for rows in chunks:
+            np.savetxt(f, rows, fmt="%d", delimiter=",")
+            written += len(rows)
+            print_progress(written, total_rows)
+
+
+def print_progress(current, total, bar_length=40):
+    percent = current / total
+    filled = int(bar_length * percent)
+    bar = "█" * filled + "-" * (bar_length - filled)
+    print(f"\rProgreso: |{bar}| {current}/{total} docs", end="", flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic encoded transactions.")
+    parser.add_argument("--rows", type=int, default=None, help="Rows to generate")
+    parser.add_argument("--scale", type=float, default=None, help="Rows as a multiple of N")
+    parser.add_argument("--source", choices=["joint", "hypothesis"], default="joint")
+    parser.add_argument("--hypothesis", default="Naive Bayes", choices=list(available_hypotheses))
+    parser.add_argument("--alpha", type=float, default=0.0, help="Smoothing of the fitted model")
+    parser.add_argument("--collection", default=None, help="Target MongoDB collection")
+    parser.add_argument("--out", default=None, help="Target .csv or .npy file")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    if (args.collection is None) == (args.out is None):
+        parser.error("Give exactly one of --collection or --out")
+
+    classifier = BayesianClassifier(hyphothesis_name=args.hypothesis, backend="memory")
+    joint_counts = classifier.count_backend.joint_counts
+    variables = classifier.variables
+    if args.rows is not None:
+        total_rows = args.rows
+    else:
+        total_rows = math.ceil(classifier.N * (args.scale or 1.0))
+
+    if args.source == "joint":
+        sample = joint_sampler(joint_counts, alpha=args.alpha)
+    else:
+        cpts = fit_cpts(joint_counts, variables, classifier.parents, alpha=args.alpha)
+        sample = cpt_sampler(cpts, variables, classifier.parents)
+
+    print(f"Generating {total_rows:,} synthetic rows from the {args.source} model...")
+    chunks = generate_chunks(sample, total_rows, args.chunk_size, args.seed)
+    if args.collection is not None:
+        write_to_collection(classifier.db[args.collection], chunks, variables, total_rows)
+    else:
+        write_to_file(args.out, chunks, variables, total_rows)
+    print("\nDone.")
+
+
+if __name__ == "__main__":
+    main()
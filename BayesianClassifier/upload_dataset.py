@@ -1,90 +1,130 @@
+import argparse
 import pandas as pd
-from pymongo import MongoClient
 import math
-import os
-from dotenv import load_dotenv
+from discretizer import AMOUNT_BINS, AMOUNT_LABELS
+
+CSV_FILENAME = "fraud_credit_card.csv"
+COLUMNS = ["age", "gender", "category", "amount_bin", "fraud"]
+# Columns de alta cardinalidad que se pueden conservar con --extra
+# (ver HIGH_CARDINALITY_VARIABLES en bayes_classifier.py)
+EXTRA_COLUMNS = ["merchant", "customer", "step"]
+
+# Discretización de 'amount': AMOUNT_BINS y AMOUNT_LABELS están en
+# discretizer.py, que el clasificador importa sin pandas
+# Los bordes y etiquetas usados se guardan aquí y index_dataset.py los copia
+# junto al mapping de 'amount_bin' en 'cardinalities' (ver discretizer.py)
+DISCRETIZATION_COLLECTION = "discretization"
+
+
+def clean_transactions(df, extra_columns=(), amount_bins=AMOUNT_BINS, amount_labels=AMOUNT_LABELS):
+    """
+    Limpia un DataFrame del .csv original (o un chunk de él) y deja solo las
+    columnas usadas por el clasificador (más `extra_columns`), con los
+    valores que se guardan en MongoDB.
+    """
+    # Reemplazar ',' por '.' en 'amount'
+    df["amount"] = df["amount"].astype(str).str.replace(",", ".").astype(float)
+
+    df["amount_bin"] = pd.cut(df["amount"], bins=amount_bins,
+                              labels=amount_labels, include_lowest=True)
+
+    # Convertir 'age' a número, marcando 'U' como None
+    df["age"] = df["age"].apply(lambda x: 
+        x.strip('\'') if x != "'U'" else "U")
+
+    # Quitar quotes de 'gender', 'U' es 'unknown'
+    # NOTE: Cuando 'age' es 'U', 'gender' siempre es 'E' (7 de estos casos son fraude).
+    df["gender"] = df["gender"].apply(
+        lambda x: x.strip('\'') if x != "'U'" else "U")
+
+    # Quitar quotes de 'category', marcando 'U' como None
+    df["category"] = df["category"].apply(
+        lambda x: x.strip('\'') if x != "'U'" else None)
+
+    # Convertir 'fraud' a 'yes' or 'no'
+    df["fraud"] = df["fraud"].apply(
+        lambda x: 'yes' if x == 1 else 'no')
+
+    # Quitar quotes de 'merchant' y 'customer'; 'step' como texto, ya que las
+    # claves de los mappings en MongoDB deben ser strings
+    for column in ("merchant", "customer"):
+        if column in extra_columns:
+            df[column] = df[column].str.strip('\'')
+    if "step" in extra_columns:
+        df["step"] = df["step"].astype(str)
+
+    # Quedarse solo con las columnas relevantes para la inferencia, en orden.
+    # Solo hay 1 único zipcodeOri y 1 único zipMerchant.
+    # NOTE: Hay 50 distintos merchants, 180 steps y 4112 customers: solo se
+    # conservan con --extra, y el clasificador los cuenta de forma dispersa.
+    return df[COLUMNS + [c for c in EXTRA_COLUMNS if c in extra_columns]]
 
-# Load environment variables from .env file
-load_dotenv()
 
-# Cargar el .csv en un DataFrame
-df = pd.read_csv("fraud_credit_card.csv", sep=",", quotechar='"')
-print(f"El dataset tiene {len(df)} registros.\n")
-
-# Reemplazar ',' por '.' en 'amount'
-df["amount"] = df["amount"].str.replace(",", ".").astype(float)
+def print_progress(current, total, bar_length=40):
+    percent = current / total
+    filled = int(bar_length * percent)
+    bar = "█" * filled + "-" * (bar_length - filled)
+    print(f"\rProgreso: |{bar}| {current}/{total} docs", end="", flush=True)
 
-# Discretización de 'amount'
-# 0 <= x < 10  : 107373 (very low)
-# 10 <= x < 50 : 386499 (low)
-# 50 <= x < 100: 80210  (medium)
-# 100 <= x     : 20561  (high)
-bins = [0, 10, 50, 100, float("inf")]
-labels = ["very low", "low", "medium", "high"]
-df["amount_bin"] = pd.cut(df["amount"], bins=bins,
-                          labels=labels, include_lowest=True)
 
-# Convertir 'age' a número, marcando 'U' como None
-df["age"] = df["age"].apply(lambda x: 
-    x.strip('\'') if x != "'U'" else "U")
+def upload(df, batch_size=10000):
+    # Conectar a MongoDB Atlas (cliente compartido, ver mongo_connection.py)
+    from mongo_connection import get_db
 
-# Quitar quotes de 'gender', 'U' es 'unknown'
-# NOTE: Cuando 'age' es 'U', 'gender' siempre es 'E' (7 de estos casos son fraude).
-df["gender"] = df["gender"].apply(
-    lambda x: x.strip('\'') if x != "'U'" else "U")
+    db = get_db()
+    collection = db["transactions"]
 
-# Quitar quotes de 'category', marcando 'U' como None
-df["category"] = df["category"].apply(
-    lambda x: x.strip('\'') if x != "'U'" else None)
+    # collection.delete_many({})
+    collection.drop()
+    print("Colección limpiada.", flush=True)
 
-# Convertir 'fraud' a 'yes' or 'no'
-df["fraud"] = df["fraud"].apply(
-    lambda x: 'yes' if x == 1 else 'no')
+    # collection.insert_many(df.to_dict("records"))
+    # Insertar en batches
+    total = len(df)
+    n_batches = math.ceil(total / batch_size)
+    for i in range(n_batches):
+        start = i * batch_size
+        end = min((i + 1) * batch_size, total)
+        batch = df.iloc[start:end].to_dict("records")
+        collection.insert_many(batch)
+        print_progress(end, total)
+    print("\nCarga completa.")
 
-# Borrar columnas que no son relevantes para la inferencia.
-# Solo hay 1 único zipcodeOri y 1 único zipMerchant.
-# NOTE: Hay 50 distintos merchants, podría ser relevante.
-# Hay 180 distintos steps, por lo que no es relevante.
-# Hay 4112 distintos customers, por lo que no es relevante.
-df = df.drop(columns=["step", "customer",
-             "zipcodeOri", "merchant", "zipMerchant"])
 
-# Ordenar columnas
-df = df[['age', 'gender', 'category', 'amount_bin', 'fraud']]
+def store_discretization(amount_bins=AMOUNT_BINS, amount_labels=AMOUNT_LABELS):
+    from mongo_connection import get_db
 
-print(f"Descripción del dataset:\n{df.describe()}\n")
+    doc = {"variable": "amount_bin", "source": "amount",
+           "edges": [float(edge) for edge in amount_bins], "labels": list(amount_labels)}
+    get_db()[DISCRETIZATION_COLLECTION].replace_one({"variable": "amount_bin"}, doc, upsert=True)
 
-print(f"Primeras 5 filas:\n{df[0:5]}\n")
 
-# TODO: Guardar esto en un lugar más apropriado (see .env)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sube el .csv limpio a MongoDB.")
+    parser.add_argument("--extra", nargs="*", default=[], choices=EXTRA_COLUMNS,
+                        help="Columnas de alta cardinalidad a conservar")
+    parser.add_argument("--amount-quantiles", type=int, default=None, metavar="N",
+                        help="Discretizar 'amount' en N bins por cuantiles (ver discretizer.py)")
+    args = parser.parse_args()
 
-# Conectar a MongoDB Atlas
-client = MongoClient(os.environ["ATLASMONGODB_CONNECTION_STRING"])
-db = client["fraud_db"]
-collection = db["transactions"]
+    amount_bins, amount_labels = AMOUNT_BINS, AMOUNT_LABELS
+    if args.amount_quantiles:
+        from discretizer import interval_labels, quantile_edges, sketch_csv_amounts
 
-# collection.delete_many({})
-collection.drop()
-print("Colección limpiada.", flush=True)
+        # Una pasada por chunks, con memoria acotada, antes de cargar el .csv
+        amount_bins = quantile_edges(sketch_csv_amounts(CSV_FILENAME), args.amount_quantiles)
+        amount_labels = interval_labels(amount_bins)
+        print(f"Bins de 'amount': {amount_labels}\n")
 
-# collection.insert_many(df.to_dict("records"))
-# Insertar en batches
-BATCH_SIZE = 10000
-total = len(df)
-n_batches = math.ceil(total / BATCH_SIZE)
+    # Cargar el .csv en un DataFrame
+    df = pd.read_csv(CSV_FILENAME, sep=",", quotechar='"')
+    print(f"El dataset tiene {len(df)} registros.\n")
 
+    df = clean_transactions(df, args.extra, amount_bins, amount_labels)
 
-def print_progress(current, total, bar_length=40):
-    percent = current / total
-    filled = int(bar_length * percent)
-    bar = "█" * filled + "-" * (bar_length - filled)
-    print(f"\rProgreso: |{bar}| {current}/{total} docs", end="", flush=True)
+    print(f"Descripción del dataset:\n{df.describe()}\n")
 
+    print(f"Primeras 5 filas:\n{df[0:5]}\n")
 
-for i in range(n_batches):
-    start = i * BATCH_SIZE
-    end = min((i + 1) * BATCH_SIZE, total)
-    batch = df.iloc[start:end].to_dict("records")
-    collection.insert_many(batch)
-    print_progress(end, total)
-print("\nCarga completa.")
+    upload(df)
+    store_discretization(amount_bins, amount_labels)
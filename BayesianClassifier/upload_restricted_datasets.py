@@ -1,20 +1,26 @@
-import os
 import math
-import random
-from pymongo import MongoClient
-from dotenv import load_dotenv
-
-load_dotenv()
+from mongo_connection import get_db
 
 FRACTIONS = [0.1, 0.3, 0.5, 0.7, 0.9]
 DB_NAME = "fraud_db"
 SOURCE_COLLECTION = "transactions_indexed"
 
-random.seed(42)
+
+def create_sampled_collection(source, target_name, size):
+    """
+    Materialize a random sample of `size` documents of `source` into
+    `target_name` entirely on the server: $out writes the aggregation result
+    into the target collection (replacing it atomically), so no document is
+    shipped to the client.
+    """
+    pipeline = [{"$sample": {"size": size}}, {"$out": target_name}]
+    # $out returns an empty cursor; exhaust it so the aggregation completes
+    for _ in source.aggregate(pipeline, allowDiskUse=True):
+        pass
+
 
 def main():
-    client = MongoClient(os.environ["ATLASMONGODB_CONNECTION_STRING"])
-    db = client[DB_NAME]
+    db = get_db(DB_NAME)
     source = db[SOURCE_COLLECTION]
 
     total = source.estimated_document_count()
@@ -28,19 +34,11 @@ def main():
             f"\n[{int(fraction * 100)}%] Sampling {size} documents -> {temp_name} ..."
         )
 
-        # Drop the collection if it exists
-        if temp_name in db.list_collection_names():
-            db.drop_collection(temp_name)
-
-        # Sample with allowDiskUse (using aggregation)
-        pipeline = [{"$sort": {"_id": 1}}, {"$sample": {"size": size}}]
-        sampled_docs = list(source.aggregate(pipeline, allowDiskUse=True))
+        create_sampled_collection(source, temp_name, size)
 
-        if sampled_docs:
-            db[temp_name].insert_many(sampled_docs)
-            print(
-                f"Uploaded {len(sampled_docs)} documents to '{temp_name}' collection."
-            )
+        sampled = db[temp_name].estimated_document_count()
+        if sampled:
+            print(f"Sampled {sampled} documents into '{temp_name}' collection.")
         else:
             print("Warning: No documents sampled!")
 